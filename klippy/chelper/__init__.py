@@ -18,7 +18,7 @@ COMPILE_ARGS = ("-Wall -g -O2 -shared -fPIC"
 SSE_FLAGS = "-mfpmath=sse -msse2"
 SOURCE_FILES = [
     'pyhelper.c', 'serialqueue.c', 'stepcompress.c', 'itersolve.c', 'trapq.c',
-    'pollreactor.c', 'msgblock.c', 'trdispatch.c',
+    'pollreactor.c', 'msgblock.c', 'trdispatch.c', 'lookahead.c',
     'kin_cartesian.c', 'kin_corexy.c', 'kin_corexz.c', 'kin_delta.c',
     'kin_deltesian.c', 'kin_polar.c', 'kin_rotary_delta.c', 'kin_winch.c',
     'kin_extruder.c', 'kin_shaper.c', 'kin_idex.c',
@@ -26,7 +26,7 @@ SOURCE_FILES = [
 DEST_LIB = "c_helper.so"
 OTHER_FILES = [
     'list.h', 'serialqueue.h', 'stepcompress.h', 'itersolve.h', 'pyhelper.h',
-    'trapq.h', 'pollreactor.h', 'msgblock.h'
+    'trapq.h', 'pollreactor.h', 'msgblock.h', 'lookahead.h'
 ]
 
 defs_stepcompress = """
@@ -51,6 +51,9 @@ defs_stepcompress = """
         , uint32_t *data, int len);
     int stepcompress_queue_mq_msg(struct stepcompress *sc, uint64_t req_clock
         , uint32_t *data, int len);
+    int stepcompress_queue_mq_msgs(struct stepcompress *sc, uint32_t *data
+        , int len, int clock_idx, int value_idx, uint64_t *clocks
+        , uint32_t *values, int count);
     int stepcompress_extract_old(struct stepcompress *sc
         , struct pull_history_steps *p, int max
         , uint64_t start_clock, uint64_t end_clock);
@@ -95,14 +98,25 @@ defs_trapq = """
         , double start_pos_x, double start_pos_y, double start_pos_z
         , double axes_r_x, double axes_r_y, double axes_r_z
         , double start_v, double cruise_v, double accel);
+    void trapq_append_many(struct trapq **tqs, double *data, int count);
+    double trapq_set_velocity(struct trapq *tq, double print_time
+        , double start_pos, double velocity, double accel);
     void trapq_finalize_moves(struct trapq *tq, double print_time
         , double clear_history_time);
     void trapq_set_position(struct trapq *tq, double print_time
         , double pos_x, double pos_y, double pos_z);
+    void trapq_extract_velocity_ratios(struct trapq *tq, double *ratios
+        , int count, double start_time, double interval
+        , double *move_ends, double *move_cruise_v, int move_count);
     int trapq_extract_old(struct trapq *tq, struct pull_move *p, int max
         , double start_time, double end_time);
 """
 
+defs_lookahead = """
+    int lookahead_flush(double *params, double *results, int count
+        , int lazy);
+"""
+
 defs_kin_cartesian = """
     struct stepper_kinematics *cartesian_stepper_alloc(char axis);
 """
@@ -220,7 +234,7 @@ defs_std = """
 
 defs_all = [
     defs_pyhelper, defs_serialqueue, defs_std, defs_stepcompress,
-    defs_itersolve, defs_trapq, defs_trdispatch,
+    defs_itersolve, defs_trapq, defs_lookahead, defs_trdispatch,
     defs_kin_cartesian, defs_kin_corexy, defs_kin_corexz, defs_kin_delta,
     defs_kin_deltesian, defs_kin_polar, defs_kin_rotary_delta, defs_kin_winch,
     defs_kin_extruder, defs_kin_shaper, defs_kin_idex,
@@ -0,0 +1,115 @@
+// Look-ahead velocity planning of queued toolhead moves
+//
+// Copyright (C) 2026  Nicolás A. Méndez
+//
+// This file may be distributed under the terms of the GNU GPLv3 license.
+
+#include <math.h> // sqrt
+#include "compiler.h" // __visible
+#include "lookahead.h" // lookahead_flush
+
+static inline double
+min2(double a, double b)
+{
+    return b < a ? b : a;
+}
+
+// Implement the "trapezoid generator" of a move (see Move.set_junction)
+static void
+set_junction(double *p, double *r, double start_v2, double cruise_v2
+             , double end_v2)
+{
+    // Determine accel, cruise, and decel portions of the move distance
+    double half_inv_accel = .5 / p[LAP_ACCEL];
+    double accel_d = (cruise_v2 - start_v2) * half_inv_accel;
+    double decel_d = (cruise_v2 - end_v2) * half_inv_accel;
+    double cruise_d = p[LAP_MOVE_D] - accel_d - decel_d;
+    // Determine move velocities
+    double start_v = sqrt(start_v2);
+    double cruise_v = sqrt(cruise_v2);
+    double end_v = sqrt(end_v2);
+    r[LAR_START_V] = start_v;
+    r[LAR_CRUISE_V] = cruise_v;
+    r[LAR_END_V] = end_v;
+    // Determine time spent in each portion of move
+    r[LAR_ACCEL_T] = accel_d / ((start_v + cruise_v) * 0.5);
+    r[LAR_CRUISE_T] = cruise_d / cruise_v;
+    r[LAR_DECEL_T] = decel_d / ((end_v + cruise_v) * 0.5);
+}
+
+// Determine the start and end velocities of a queue of moves. This is
+// a port of LookAheadQueue.flush() in toolhead.py and must produce the
+// same results. The 'params' array holds LA_PARAMS values per move and
+// the 'results' array receives LA_RESULTS values per move. Returns the
+// number of moves (from the start of the queue) that are ready to be
+// processed, or zero if no moves should be processed yet.
+int __visible
+lookahead_flush(double *params, double *results, int count, int lazy)
+{
+    int update_flush_count = lazy, flush_count = count;
+    // Moves with a pending junction form a contiguous run of queue
+    // indexes [i+1, i+ndelayed]. Their start_v2 and end_v2 are stored
+    // in the (not yet calculated) time fields of their results.
+    int ndelayed = 0;
+    double next_end_v2 = 0., next_smoothed_v2 = 0., peak_cruise_v2 = 0.;
+    int i;
+    for (i = count - 1; i >= 0; i--) {
+        double *p = &params[i * LA_PARAMS], *r = &results[i * LA_RESULTS];
+        double reachable_start_v2 = next_end_v2 + p[LAP_DELTA_V2];
+        double start_v2 = min2(p[LAP_MAX_START_V2], reachable_start_v2);
+        double reachable_smoothed_v2 = (next_smoothed_v2
+                                        + p[LAP_SMOOTH_DELTA_V2]);
+        double smoothed_v2 = min2(p[LAP_MAX_SMOOTHED_V2]
+                                  , reachable_smoothed_v2);
+        if (smoothed_v2 < reachable_smoothed_v2) {
+            // It's possible for this move to accelerate
+            if (smoothed_v2 + p[LAP_SMOOTH_DELTA_V2] > next_smoothed_v2
+                || ndelayed) {
+                // This move can decelerate or this is a full accel
+                // move after a full decel move
+                if (update_flush_count && peak_cruise_v2) {
+                    flush_count = i;
+                    update_flush_count = 0;
+                }
+                peak_cruise_v2 = min2(p[LAP_MAX_CRUISE_V2]
+                                      , (smoothed_v2 + reachable_smoothed_v2)
+                                      * .5);
+                if (ndelayed) {
+                    // Propagate peak_cruise_v2 to any delayed moves
+                    if (!update_flush_count && i < flush_count) {
+                        double mc_v2 = peak_cruise_v2;
+                        int j;
+                        for (j = i + 1; j <= i + ndelayed; j++) {
+                            double *dp = &params[j * LA_PARAMS];
+                            double *dr = &results[j * LA_RESULTS];
+                            double ms_v2 = dr[LAR_ACCEL_T];
+                            double me_v2 = dr[LAR_CRUISE_T];
+                            mc_v2 = min2(mc_v2, ms_v2);
+                            set_junction(dp, dr, min2(ms_v2, mc_v2), mc_v2
+                                         , min2(me_v2, mc_v2));
+                        }
+                    }
+                    ndelayed = 0;
+                }
+            }
+            if (!update_flush_count && i < flush_count) {
+                double cruise_v2 = min2(min2(0.5 * (start_v2
+                                                    + reachable_start_v2)
+                                             , p[LAP_MAX_CRUISE_V2])
+                                        , peak_cruise_v2);
+                set_junction(p, r, min2(start_v2, cruise_v2), cruise_v2
+                             , min2(next_end_v2, cruise_v2));
+            }
+        } else {
+            // Delay calculating this move until peak_cruise_v2 is known
+            r[LAR_ACCEL_T] = start_v2;
+            r[LAR_CRUISE_T] = next_end_v2;
+            ndelayed++;
+        }
+        next_end_v2 = start_v2;
+        next_smoothed_v2 = smoothed_v2;
+    }
+    if (update_flush_count)
+        return 0;
+    return flush_count;
+}
@@ -0,0 +1,18 @@
+#ifndef LOOKAHEAD_H
+#define LOOKAHEAD_H
+
+// Per move input values (see the Move class in toolhead.py)
+enum {
+    LAP_MAX_START_V2, LAP_DELTA_V2, LAP_MAX_SMOOTHED_V2, LAP_SMOOTH_DELTA_V2,
+    LAP_MAX_CRUISE_V2, LAP_MOVE_D, LAP_ACCEL, LA_PARAMS
+};
+
+// Per move output values (as set by Move.set_junction)
+enum {
+    LAR_START_V, LAR_CRUISE_V, LAR_END_V,
+    LAR_ACCEL_T, LAR_CRUISE_T, LAR_DECEL_T, LA_RESULTS
+};
+
+int lookahead_flush(double *params, double *results, int count, int lazy);
+
+#endif // lookahead.h
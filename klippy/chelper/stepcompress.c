@@ -645,6 +645,28 @@ stepcompress_queue_mq_msg(struct stepcompress *sc, uint64_t req_clock
     return 0;
 }
 
+// Queue a batch of mcu move queue commands that only differ in their
+// clock and value fields (eg: the updates of a queued pwm pin)
+int __visible
+stepcompress_queue_mq_msgs(struct stepcompress *sc, uint32_t *data, int len
+                           , int clock_idx, int value_idx, uint64_t *clocks
+                           , uint32_t *values, int count)
+{
+    int ret = stepcompress_flush(sc, UINT64_MAX);
+    if (ret)
+        return ret;
+
+    int i;
+    for (i = 0; i < count; i++) {
+        data[clock_idx] = clocks[i];
+        data[value_idx] = values[i];
+        struct queue_message *qm = message_alloc_and_encode(data, len);
+        qm->min_clock = qm->req_clock = clocks[i];
+        list_add_tail(&qm->node, &sc->msg_queue);
+    }
+    return 0;
+}
+
 // Return history of queue_step commands
 int __visible
 stepcompress_extract_old(struct stepcompress *sc, struct pull_history_steps *p
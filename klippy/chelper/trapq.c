@@ -163,6 +163,97 @@ trapq_append(struct trapq *tq, double print_time
     }
 }
 
+// Fill and add a batch of moves to (possibly different) trapezoid
+// velocity queues. Entry 'i' is added to 'tqs[i]' using the
+// TRAPQ_APPEND_ARGS values at 'data[i*TRAPQ_APPEND_ARGS]', which are
+// the arguments of trapq_append() in the same order.
+void __visible
+trapq_append_many(struct trapq **tqs, double *data, int count)
+{
+    int i;
+    for (i = 0; i < count; i++, data += TRAPQ_APPEND_ARGS)
+        trapq_append(tqs[i], data[0], data[1], data[2], data[3]
+                     , data[4], data[5], data[6], data[7], data[8], data[9]
+                     , data[10], data[11], data[12]);
+}
+
+// Duration of the open ended moves of trapq_set_velocity()
+#define VELOCITY_MOVE_T 1000000000.
+
+// Add a move along the x axis, from signed velocity 'start_v' to
+// 'end_v' (both of the same sign) over 'move_t'
+static struct coord
+add_velocity_move(struct trapq *tq, double print_time, double move_t
+                  , struct coord start_pos, double start_v, double end_v)
+{
+    struct move *m = move_alloc();
+    m->print_time = print_time;
+    m->move_t = move_t;
+    m->start_v = fabs(start_v);
+    m->half_accel = .5 * (fabs(end_v) - fabs(start_v)) / move_t;
+    m->start_pos = start_pos;
+    m->axes_r.x = start_v + end_v < 0. ? -1. : 1.;
+    trapq_add_move(tq, m);
+    return move_get_coord(m, move_t);
+}
+
+// Change the (signed) velocity along the x axis at 'print_time',
+// replacing any moves after that time. The velocity changes at
+// 'accel' from the one at 'print_time' (or zero, if there are no
+// moves then and the position is 'start_pos') to 'velocity', and then
+// stays there with no end position (an "open ended" move), until the
+// next call. A zero 'accel' changes the velocity at once. Returns the
+// time at which the new velocity is reached.
+double __visible
+trapq_set_velocity(struct trapq *tq, double print_time, double start_pos
+                   , double velocity, double accel)
+{
+    struct move *head_sentinel = list_first_entry(&tq->moves, struct move,node);
+    struct move *tail_sentinel = list_last_entry(&tq->moves, struct move, node);
+    struct coord pos = { .x=start_pos };
+    double start_v = 0.;
+    // Drop the moves starting after 'print_time' and truncate the
+    // move in progress at that time
+    for (;;) {
+        struct move *m = list_prev_entry(tail_sentinel, node);
+        if (m == head_sentinel)
+            break;
+        if (m->print_time < print_time) {
+            double move_time = print_time - m->print_time;
+            if (move_time <= m->move_t) {
+                m->move_t = move_time;
+                start_v = ((m->start_v + 2. * m->half_accel * move_time)
+                           * m->axes_r.x);
+            }
+            pos = move_get_coord(m, m->move_t);
+            break;
+        }
+        list_del(&m->node);
+        pos = m->start_pos;
+        free(m);
+    }
+    tail_sentinel->print_time = 0.;
+    // Ramp to the new velocity (through a stop, on a direction change)
+    if (accel > 0.) {
+        if (start_v * velocity < 0.) {
+            double move_t = fabs(start_v) / accel;
+            pos = add_velocity_move(tq, print_time, move_t, pos, start_v, 0.);
+            print_time += move_t;
+            start_v = 0.;
+        }
+        if (start_v != velocity) {
+            double move_t = fabs(velocity - start_v) / accel;
+            pos = add_velocity_move(tq, print_time, move_t, pos
+                                    , start_v, velocity);
+            print_time += move_t;
+        }
+    }
+    if (velocity)
+        add_velocity_move(tq, print_time, VELOCITY_MOVE_T, pos
+                          , velocity, velocity);
+    return print_time;
+}
+
 // Expire any moves older than `print_time` from the trapezoid velocity queue
 void __visible
 trapq_finalize_moves(struct trapq *tq, double print_time
@@ -227,6 +318,39 @@ trapq_set_position(struct trapq *tq, double print_time
     list_add_head(&m->node, &tq->history);
 }
 
+// Fill 'ratios' with the velocity at 'count' times (every 'interval'
+// from 'start_time') relative to the cruise velocity of the toolhead
+// move at that time. The toolhead moves are given by their end times
+// ('move_ends', in ascending order) and cruise velocities. Times
+// without a move (or without xyz motion) are 0.
+void __visible
+trapq_extract_velocity_ratios(struct trapq *tq, double *ratios, int count
+                              , double start_time, double interval
+                              , double *move_ends, double *move_cruise_v
+                              , int move_count)
+{
+    struct move *tail_sentinel = list_last_entry(&tq->moves, struct move
+                                                 , node);
+    struct move *m = list_first_entry(&tq->moves, struct move, node);
+    m = list_next_entry(m, node);
+    int i, j = 0;
+    for (i = 0; i < count; i++) {
+        double t = start_time + i * interval;
+        while (m != tail_sentinel && m->print_time + m->move_t <= t)
+            m = list_next_entry(m, node);
+        while (j < move_count && move_ends[j] <= t)
+            j++;
+        if (m == tail_sentinel || t < m->print_time || j >= move_count
+            || move_cruise_v[j] <= 0.
+            || (!m->axes_r.x && !m->axes_r.y && !m->axes_r.z)) {
+            ratios[i] = 0.;
+            continue;
+        }
+        double v = m->start_v + 2. * m->half_accel * (t - m->print_time);
+        ratios[i] = v / move_cruise_v[j];
+    }
+}
+
 // Return history of movement queue
 int __visible
 trapq_extract_old(struct trapq *tq, struct pull_move *p, int max
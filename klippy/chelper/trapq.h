@@ -43,10 +43,19 @@ void trapq_append(struct trapq *tq, double print_time
                   , double start_pos_x, double start_pos_y, double start_pos_z
                   , double axes_r_x, double axes_r_y, double axes_r_z
                   , double start_v, double cruise_v, double accel);
+// Number of trapq_append() arguments (after 'tq') per trapq_append_many entry
+#define TRAPQ_APPEND_ARGS 13
+void trapq_append_many(struct trapq **tqs, double *data, int count);
+double trapq_set_velocity(struct trapq *tq, double print_time, double start_pos
+                          , double velocity, double accel);
 void trapq_finalize_moves(struct trapq *tq, double print_time
                           , double clear_history_time);
 void trapq_set_position(struct trapq *tq, double print_time
                         , double pos_x, double pos_y, double pos_z);
+void trapq_extract_velocity_ratios(struct trapq *tq, double *ratios, int count
+                                   , double start_time, double interval
+                                   , double *move_ends, double *move_cruise_v
+                                   , int move_count);
 int trapq_extract_old(struct trapq *tq, struct pull_move *p, int max
                       , double start_time, double end_time);
 
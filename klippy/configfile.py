@@ -160,6 +160,7 @@ class PrinterConfig:
         self.status_settings = {}
         self.status_warnings = []
         self.save_config_pending = False
+        self.status_version = 0
         gcode = self.printer.lookup_object('gcode')
         gcode.register_command("SAVE_CONFIG", self.cmd_SAVE_CONFIG,
                                desc=self.cmd_SAVE_CONFIG_help)
@@ -330,6 +331,7 @@ class PrinterConfig:
         res = {'type': 'runtime_warning', 'message': msg}
         self.runtime_warnings.append(res)
         self.status_warnings = self.runtime_warnings + self.deprecate_warnings
+        self.status_version += 1
     def deprecate(self, section, option, value=None, msg=None):
         self.deprecated[(section, option, value)] = msg
     def _build_status(self, config):
@@ -352,6 +354,9 @@ class PrinterConfig:
             res['option'] = option
             self.deprecate_warnings.append(res)
         self.status_warnings = self.runtime_warnings + self.deprecate_warnings
+        self.status_version += 1
+    def get_status_version(self):
+        return self.status_version
     def get_status(self, eventtime):
         return {'config': self.status_raw_config,
                 'settings': self.status_settings,
@@ -372,6 +377,7 @@ class PrinterConfig:
         pending[section][option] = svalue
         self.status_save_pending = pending
         self.save_config_pending = True
+        self.status_version += 1
         logging.info("save_config: set [%s] %s = %s", section, option, svalue)
     def remove_section(self, section):
         if self.autosave.fileconfig.has_section(section):
@@ -380,12 +386,14 @@ class PrinterConfig:
             pending[section] = None
             self.status_save_pending = pending
             self.save_config_pending = True
+            self.status_version += 1
         elif (section in self.status_save_pending and
               self.status_save_pending[section] is not None):
             pending = dict(self.status_save_pending)
             del pending[section]
             self.status_save_pending = pending
             self.save_config_pending = True
+            self.status_version += 1
     def _disallow_include_conflicts(self, regular_data, cfgname, gcode):
         config = self._build_config_wrapper(regular_data, cfgname)
         for section in self.autosave.fileconfig.sections():
@@ -141,6 +141,7 @@ class BedMesh:
         gcode_move = self.printer.load_object(config, 'gcode_move')
         gcode_move.set_move_transform(self)
         # initialize status dict
+        self.status_version = 0
         self.update_status()
     def handle_connect(self):
         self.toolhead: ToolHead = self.printer.lookup_object('toolhead')
@@ -241,7 +242,11 @@ class BedMesh:
         self.last_position[:] = newpos
     def get_status(self, eventtime=None):
         return self.status
+    def get_status_version(self):
+        # The status is only replaced by update_status()
+        return self.status_version
     def update_status(self):
+        self.status_version += 1
         self.status = {
             "profile_name": "",
             "mesh_min": (0., 0.),
@@ -3,7 +3,7 @@
 # Copyright (C) 2020-2023  Kevin O'Connor <kevin@koconnor.net>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import logging, threading, struct
+import logging, threading, struct, itertools
 
 # This "bulk sensor" module facilitates the processing of sensor chip
 # measurements that do not require the host to respond with low
@@ -97,7 +97,8 @@ class BatchBulkHelper:
     def add_mux_endpoint(self, path, key, value, webhooks_start_resp):
         self.webhooks_start_resp = webhooks_start_resp
         wh = self.printer.lookup_object('webhooks')
-        wh.register_mux_endpoint(path, key, value, self._add_api_client)
+        wh.register_mux_endpoint(path, key, value, self._add_api_client,
+                                 priority='bulk')
 
 # A webhooks wrapper for use by BatchBulkHelper
 class BatchWebhooksClient:
@@ -107,11 +108,30 @@ class BatchWebhooksClient:
     def handle_batch(self, msg):
         if self.cconn.is_closed():
             return False
+        if self.cconn.get_encoding() == 'msgpack':
+            msg = pack_batch_data(msg)
         tmp = dict(self.template)
         tmp['params'] = msg
         self.cconn.send(tmp)
         return True
 
+# Replace the "data" list of a batch with an array of little-endian
+# doubles (and its number of columns), for clients that use a binary
+# encoding. Batches with nested or irregular samples are left as is.
+def pack_batch_data(msg):
+    data = msg.get('data')
+    if not data:
+        return msg
+    columns = len(data[0])
+    if any([len(sample) != columns for sample in data]):
+        return msg
+    values = list(itertools.chain.from_iterable(data))
+    try:
+        packed = struct.pack("<%dd" % (len(values),), *values)
+    except struct.error:
+        return msg
+    return dict(msg, data=packed, data_columns=columns)
+
 # Helper class to store incoming messages in a queue
 class BulkDataQueue:
     def __init__(self, mcu, msg_name="sensor_bulk_data", oid=None):
@@ -169,6 +169,10 @@ class ExcludeObject:
         return self.current_object in self.excluded_objects \
             and self.initial_extrusion_moves == 0
 
+    def get_status_version(self):
+        # The status fields are replaced (never modified) on any change
+        return (self.objects, self.excluded_objects, self.current_object)
+
     def get_status(self, eventtime=None):
         status = {
             "objects": self.objects,
@@ -6,25 +6,15 @@
 # Copyright (C) 2011 Camiel Gubbels / Erik van der Zalm
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import math, logging, copy
+import math, tracing
 
-# Setup a logger: https://stackoverflow.com/a/11233293
-def setup_logger(name, log_file, level=logging.INFO):
-    """To setup as many loggers as you want"""
-    handler = logging.FileHandler(log_file)        
+trace_arcs = tracing.get_category("gcode.arcs")
 
-    # formatter = logging.Formatter('%(asctime)s %(levelname)s %(message)s')
-    # handler.setFormatter(formatter)
+# Angular travels closer than this to zero are full circles
+ARC_ANGULAR_TRAVEL_EPSILON = 5e-7
 
-    logger = logging.getLogger(name)
-    logger.setLevel(level)
-    logger.addHandler(handler)
-
-    return logger
-gcode_log = setup_logger('gcode_log', '/tmp/gcode.log')
-
-
-# Coordinates created by this are converted into G1 commands.
+# Coordinates created by this are queued as G1 style moves (see
+# GCodeMove.move_path).
 #
 # supports XY, XZ & YZ planes with remaining axis as helical
 
@@ -39,6 +29,18 @@ class ArcSupport:
         #   finer arc, but also more work for your machine. Arcs smaller than
         #   the configured value will become straight lines. The default is
         #   1 mm.
+        #chord_tolerance: 0.0
+        #   Maximum distance (in mm) between an arc and its segments. When
+        #   set, the number of segments of each arc is chosen from its
+        #   radius (larger arcs get longer segments) and "resolution" is
+        #   not used. The default is 0 (use "resolution").
+        #min_segment_time: 0.0
+        #   With chord_tolerance, the minimum duration (in seconds) of the
+        #   segments at the speed the toolhead can reach on the arc (the
+        #   lowest of the feedrate, max_velocity and the centripetal limit
+        #   sqrt(max_accel * radius)). Large and fast arcs then use less
+        #   and longer segments, even beyond the chord_tolerance. The
+        #   default is 0 (no limit).
 
         To start adding support for multi-axis, this reads the 'axis' parameter
         of the '[printer]' section in the config file:
@@ -54,6 +56,10 @@ class ArcSupport:
         
         self.printer = config.get_printer()
         self.mm_per_arc_segment = config.getfloat('resolution', 1., above=0.0)
+        self.chord_tolerance = config.getfloat('chord_tolerance', 0.,
+                                               minval=0.)
+        self.min_segment_time = config.getfloat('min_segment_time', 0.,
+                                                minval=0.)
 
         self.gcode_move = self.printer.load_object(config, 'gcode_move')
         self.gcode = self.printer.lookup_object('gcode')
@@ -99,7 +105,8 @@ class ArcSupport:
         for cmd in self.handlers:
             func = getattr(self, 'cmd_' + cmd)
             desc = getattr(self, 'cmd_' + cmd + '_help', None)
-            self.gcode.register_command(cmd, func, when_not_ready=False, desc=desc)
+            self.gcode.register_command(cmd, func, when_not_ready=False, desc=desc,
+                                        fast_params=(cmd in ('G2', 'G3')))
 
         # This is a named tuple with elements: ('x', 'y', 'z', 'e', 'a', 'b', 'c')
         # Values default to None.
@@ -110,12 +117,12 @@ class ArcSupport:
 
     cmd_G2_help = "Clockwise arc move to a specified position."
     def cmd_G2(self, gcmd):
-        """Arc Move Clockwise: G2 [X<pos>] [Y<pos>] [Z<pos>] [E<pos>] [F<speed>] I<value> J<value>|I<value> K<value>|J<value> K<value>"""
+        """Arc Move Clockwise: G2 [X<pos>] [Y<pos>] [Z<pos>] [E<pos>] [F<speed>] I<value> J<value>|I<value> K<value>|J<value> K<value>|R<radius> [P<turns>]"""
         self._cmd_inner(gcmd, True)
 
     cmd_G3_help = "Counter-clockwise arc move to a specified position."
     def cmd_G3(self, gcmd):
-        """Arc Move Counter-clockwise: G3 [X<pos>] [Y<pos>] [Z<pos>] [E<pos>] [F<speed>] I<value> J<value>|I<value> K<value>|J<value> K<value>"""
+        """Arc Move Counter-clockwise: G3 [X<pos>] [Y<pos>] [Z<pos>] [E<pos>] [F<speed>] I<value> J<value>|I<value> K<value>|J<value> K<value>|R<radius> [P<turns>]"""
         self._cmd_inner(gcmd, False)
 
     cmd_G17_help = "Select XY plane for circular interpolation"
@@ -149,98 +156,100 @@ class ArcSupport:
             a=None
         )
 
-        if gcmd.get_float("R", None) is not None:
-            raise gcmd.error("G2/G3 does not support R moves")
-
         # determine the plane coordinates and the helical axis
-        asPlanar = [ gcmd.get_float(a, 0.) for i,a in enumerate('IJ') ]
+        planar_letters = 'IJ'
         axes = (self.X_AXIS, self.Y_AXIS, self.Z_AXIS)
         if self.plane == self.ARC_PLANE_X_Z:
-            asPlanar = [ gcmd.get_float(a, 0.) for i,a in enumerate('IK') ]
+            planar_letters = 'IK'
             axes = (self.X_AXIS, self.Z_AXIS, self.Y_AXIS)
         elif self.plane == self.ARC_PLANE_Y_Z:
-            asPlanar = [ gcmd.get_float(a, 0.) for i,a in enumerate('JK') ]
+            planar_letters = 'JK'
             axes = (self.Y_AXIS, self.Z_AXIS, self.X_AXIS)
 
+        asR = gcmd.get_float("R", None)
+        turns = 1
+        if asR is not None:
+            if gcmd.get_float(planar_letters[0], None) is not None or \
+               gcmd.get_float(planar_letters[1], None) is not None:
+                raise gcmd.error("G2/G3 does not support both R and %s"
+                                 " parameters" % (planar_letters,))
+            asPlanar = self._radius_offset(gcmd, currentPos, asTarget, asR,
+                                           clockwise, *axes[:2])
+        else:
+            asPlanar = [ gcmd.get_float(a, 0.) for a in planar_letters ]
+            turns = gcmd.get_int("P", 1, minval=1)
+
         if not (asPlanar[0] or asPlanar[1]):
-            raise gcmd.error("G2/G3 requires IJ, IK or JK parameters")
+            raise gcmd.error("G2/G3 requires IJ, IK, JK or R parameters")
 
         asE = gcmd.get_float("E", None)
         asF = gcmd.get_float("F", None)
 
-        # Build list of linear coordinates to move
+        feedrate = gcodestatus['speed']
+        if asF is not None:
+            feedrate = asF
+
+        # Build the columns of linear coordinates to move
         # Expand the axes list to pass its values to: "alpha_axis", "beta_axis", "helical_axis"
-        coords = self.planArc(currentPos, asTarget, asPlanar, clockwise, *axes)
-        e_per_move = e_base = 0.
+        coords = self.planArc(currentPos, asTarget, asPlanar, clockwise, *axes,
+                              turns=turns,
+                              speed=feedrate * self.gcode_move.speed_factor)
+        count = len(coords[0])
+        columns = {self.ax_letters[i]: coords[i] for i in range(3)}
+        e_values = None
         if asE is not None:
+            e_base = 0.
             if gcodestatus['absolute_extrude']:
-                # NOTE: the extruder axis should always be the last item in the position vector.
-                e_base = currentPos[self.E_AXIS]
-            e_per_move = (asE - e_base) / len(coords)
+                e_base = currentPos.e
+            e_per_move = (asE - e_base) / count
+            if gcodestatus['absolute_extrude']:
+                e_values = [e_base + e_per_move * i
+                            for i in range(1, count + 1)]
+            else:
+                e_values = [e_per_move] * count
 
         # NOTE: Add support for moves in the ABC axes, which are not 
         #       part of the arc move, and should be split like extruder
         #       moves or "helical axis" moves are.
-        g1_abc_params = {}
-        g1_abc_increments = {}
         abc_sq_displacement = 0.0  # Sum of the squared ABC displacements. 
         extra_axes_idx = {ax: idx for ax, idx in self.axis_map.items() if idx not in [0,1,2,self.E_AXIS]}
         for axis_letter, idx in extra_axes_idx.items():
             axis_coord = gcmd.get_float(axis_letter, None)
             if axis_coord is not None:
                 # Calculate the distance this axis will move during each arc segment.
-                axis_increment = axis_coord / len(coords)
+                axis_increment = axis_coord / count
                 # Calculate sum of square displacements for the extra axes.
                 abc_sq_displacement += axis_increment ** 2
-                # Make target coordinates for the extra axes of the first move.
-                g1_abc_params[axis_letter] = currentPos[idx] + axis_increment
-                g1_abc_increments[axis_letter] = axis_increment
+                columns[axis_letter] = [currentPos[idx] + axis_increment * i
+                                        for i in range(1, count + 1)]
+
+        # NOTE: Calculate the feedrate adjustment factor of each move.
+        #       This is used to "increase" the feedrate internally,
+        #       because: (1) the feedrate for arc moves is expected
+        #       to affect to non-ABC moves only (2) Klipper will split
+        #       the "available feedrate" among all axes; except the E axis.
+        if abc_sq_displacement:
+            x, y, z = coords
+            xyz_sq_displacements = [
+                (x1 - x0)**2 + (y1 - y0)**2 + (z1 - z0)**2
+                for x0, x1, y0, y1, z0, z1 in zip(
+                    [currentPos[0]] + x, x, [currentPos[1]] + y, y,
+                    [currentPos[2]] + z, z)]
+            feedrates = [feedrate * math.sqrt((d + abc_sq_displacement) / d)
+                         if d else feedrate
+                         for d in xyz_sq_displacements]
+        else:
+            feedrates = [feedrate] * count
+
+        if trace_arcs.enabled:
+            trace_arcs.log("%s: %d segments to %s", gcmd.get_commandline(),
+                           count, [v[-1] for v in columns.values()])
+
+        # Send the moves to the move queue.
+        self.gcode_move.move_path(columns, e_values, feedrates, gcmd)
 
-        # NOTE: Prepare a command that restores the original feedrate.
-        feedrate = self.gcode_move.speed * 1.0
-        if asF is not None:
-            feedrate = asF
-        g1_f_gcmd = self.gcode.create_gcode_command(command="G1", commandline="G1", params={"F": feedrate})
-
-        # Convert coords into G1 commands
-        prev_pos = copy.copy(currentPos)
-        for coord in coords:
-            g1_params = {'X': coord[0], 'Y': coord[1], 'Z': coord[2]}
-            for ax, pos in g1_abc_params.items():
-                g1_params[ax] = pos
-                g1_abc_params[ax] += g1_abc_increments[ax]
-            if e_per_move:
-                g1_params['E'] = e_base + e_per_move
-                if gcodestatus['absolute_extrude']:
-                    e_base += e_per_move
-            # NOTE: Calculate feedrate adjustment factor for the current move.
-            #       This is used to "increase" the feedrate internally,
-            #       because: (1) the feedrate for arc moves is expected
-            #       to affect to non-ABC moves only (2) Klipper will split
-            #       the "available feedrate" among all axes; except the E axis.
-            # xyz_sq_displacement = sum(i**2 for i in coord[0:3])
-            xyz_sq_displacement = sum([(c-pc)**2 for c, pc in zip(coord[0:3], prev_pos[0:3])])
-            feedrate_factor = math.sqrt(xyz_sq_displacement + abc_sq_displacement) / math.sqrt(xyz_sq_displacement)
-            # Save new coordinate for the next loop iteration.
-            prev_pos = coord
-            # Set the adjusted feedrate.
-            g1_params['F'] = feedrate * feedrate_factor
-            
-            # Generate the GCODE command.
-            g1_gcmd = self.gcode.create_gcode_command(
-                command="G1", 
-                commandline="G1", 
-                params=g1_params)
-            
-            # NOTE: write actual G1 commands to the log.
-            # gcode_log.info( f'G1 { " ".join([f"{k}{v}" for k, v in g1_params.items()]) }; >>> Arc segment with target: {asTarget}' )
-            gcode_log.info( f'G1 { " ".join([f"{k}{v}" for k, v in g1_params.items()]) }' )
-            
-            # Send the command to the move queue.
-            self.gcode_move.cmd_G1(g1_gcmd)
-        
         # NOTE: restore original feedrate.
-        self.gcode_move.cmd_G1(g1_f_gcmd)
+        self.gcode_move.set_gcode_speed(feedrate)
 
     # function planArc() originates from marlin plan_arc()
     # https://github.com/MarlinFirmware/Marlin
@@ -251,9 +260,7 @@ class ArcSupport:
     #
     # alpha and beta axes are the current plane, helical axis is linear travel
     def planArc(self, currentPos, targetPos, offset, clockwise,
-                alpha_axis, beta_axis, helical_axis):
-        # todo: sometimes produces full circles
-
+                alpha_axis, beta_axis, helical_axis, turns=1, speed=None):
         # Radius vector from center to current location
         r_P = -offset[0]
         r_Q = -offset[1]
@@ -265,52 +272,97 @@ class ArcSupport:
         rt_Beta = targetPos[beta_axis] - center_Q
         angular_travel = math.atan2(r_P * rt_Beta - r_Q * rt_Alpha,
                                     r_P * rt_Alpha + r_Q * rt_Beta)
-        if angular_travel < 0.:
+        # Make a full circle if the target is the current position (an
+        # angular travel of about zero, in either direction)
+        if clockwise:
+            if angular_travel >= -ARC_ANGULAR_TRAVEL_EPSILON:
+                angular_travel -= 2. * math.pi
+        elif angular_travel <= ARC_ANGULAR_TRAVEL_EPSILON:
             angular_travel += 2. * math.pi
+        # Additional full turns (P parameter)
         if clockwise:
-            angular_travel -= 2. * math.pi
-
-        if (angular_travel == 0.
-            and currentPos[alpha_axis] == targetPos[alpha_axis]
-            and currentPos[beta_axis] == targetPos[beta_axis]):
-            # Make a circle if the angular rotation is 0 and the
-            # target is the current position
-            angular_travel = 2. * math.pi
+            angular_travel -= 2. * math.pi * (turns - 1)
+        else:
+            angular_travel += 2. * math.pi * (turns - 1)
 
         # Determine the number of segments
         linear_travel = targetPos[helical_axis] - currentPos[helical_axis]
         radius = math.hypot(r_P, r_Q)
-        flat_mm = radius * angular_travel
-        if linear_travel:
-            mm_of_travel = math.hypot(flat_mm, linear_travel)
+        if self.chord_tolerance:
+            segments = self._chord_segments(radius, angular_travel,
+                                            linear_travel, speed)
         else:
-            mm_of_travel = math.fabs(flat_mm)
-        segments = max(1., math.floor(mm_of_travel / self.mm_per_arc_segment))
-
-        # Generate coordinates
+            flat_mm = radius * angular_travel
+            if linear_travel:
+                mm_of_travel = math.hypot(flat_mm, linear_travel)
+            else:
+                mm_of_travel = math.fabs(flat_mm)
+            segments = max(1., math.floor(mm_of_travel / self.mm_per_arc_segment))
+
+        # Generate the coordinates of all segments at once, as one list
+        # per axis (indexed by the XYZ position of the axis)
         theta_per_segment = angular_travel / segments
         linear_per_segment = linear_travel / segments
-        coords = []
-        for i in range(1, int(segments)):
-            dist_Helical = i * linear_per_segment
-            cos_Ti = math.cos(i * theta_per_segment)
-            sin_Ti = math.sin(i * theta_per_segment)
-            r_P = -offset[0] * cos_Ti + offset[1] * sin_Ti
-            r_Q = -offset[0] * sin_Ti - offset[1] * cos_Ti
-
-            # Coord is a named tuple with elements: ('x', 'y', 'z', 'e', 'a', 'b', 'c')
-            # Its values default to None.
-            # Coord doesn't support index assignment, create list.
-            # NOTE: Using "pos_length" (e.g. can be "3" for an XYZE setup).
-            #       This achieves backwardcompatibility.
-            c = [None for i in range(self.pos_length)]
-            c[alpha_axis] = center_P + r_P
-            c[beta_axis] = center_Q + r_Q
-            c[helical_axis] = currentPos[helical_axis] + dist_Helical
-            coords.append(self.Coord(*c))
-
-        coords.append(targetPos)
+        steps = range(1, int(segments))
+        thetas = [i * theta_per_segment for i in steps]
+        cos_T = list(map(math.cos, thetas))
+        sin_T = list(map(math.sin, thetas))
+        o_P, o_Q = offset
+        coords = [None, None, None]
+        coords[alpha_axis] = [center_P + (-o_P * cos_Ti + o_Q * sin_Ti)
+                              for cos_Ti, sin_Ti in zip(cos_T, sin_T)]
+        coords[beta_axis] = [center_Q + (-o_P * sin_Ti - o_Q * cos_Ti)
+                             for cos_Ti, sin_Ti in zip(cos_T, sin_T)]
+        start_Helical = currentPos[helical_axis]
+        coords[helical_axis] = [start_Helical + i * linear_per_segment
+                                for i in steps]
+        for axis in (alpha_axis, beta_axis, helical_axis):
+            coords[axis].append(targetPos[axis])
         return coords
 
+    # Number of segments of an arc, such that the distance between
+    # the arc and its segments stays within "chord_tolerance", but with
+    # segments lasting at least "min_segment_time" at the speed that the
+    # toolhead can reach on the arc
+    def _chord_segments(self, radius, angular_travel, linear_travel, speed):
+        max_theta = math.pi / 2.
+        if radius > self.chord_tolerance:
+            max_theta = min(max_theta,
+                            2. * math.acos(1. - self.chord_tolerance / radius))
+        segments = max(1., math.ceil(math.fabs(angular_travel) / max_theta))
+        if self.min_segment_time and speed:
+            toolhead = self.printer.lookup_object('toolhead')
+            max_velocity, max_accel = toolhead.get_max_velocity()
+            arc_speed = min(speed, max_velocity,
+                            math.sqrt(max_accel * radius))
+            min_length = arc_speed * self.min_segment_time
+            mm_of_travel = math.hypot(radius * angular_travel, linear_travel)
+            max_segments = max(1., math.floor(mm_of_travel / min_length))
+            segments = min(segments, max_segments)
+        return segments
+
+    # Offset of the center of an "R" arc from the current position
+    # (from grbl's mc_arc). A negative radius selects the arc of more
+    # than 180 degrees.
+    def _radius_offset(self, gcmd, currentPos, targetPos, radius, clockwise,
+                       alpha_axis, beta_axis):
+        x = targetPos[alpha_axis] - currentPos[alpha_axis]
+        y = targetPos[beta_axis] - currentPos[beta_axis]
+        if not (x or y):
+            raise gcmd.error("G2/G3 with R requires an end point different"
+                             " from the current position")
+        h_x2_div_d = 4. * radius**2 - x**2 - y**2
+        if h_x2_div_d < 0.:
+            if h_x2_div_d < -0.000001 * (x**2 + y**2):
+                raise gcmd.error("G2/G3 radius too small for the end point")
+            # Rounding of a half circle
+            h_x2_div_d = 0.
+        h_x2_div_d = -math.sqrt(h_x2_div_d) / math.hypot(x, y)
+        if not clockwise:
+            h_x2_div_d = -h_x2_div_d
+        if radius < 0.:
+            h_x2_div_d = -h_x2_div_d
+        return [.5 * (x - y * h_x2_div_d), .5 * (y + x * h_x2_div_d)]
+
 def load_config(config):
     return ArcSupport(config)
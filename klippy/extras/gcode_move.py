@@ -3,11 +3,13 @@
 # Copyright (C) 2016-2021  Kevin O'Connor <kevin@koconnor.net>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import logging, klippy
+import logging, klippy, tracing
 from gcode import GCodeDispatch, GCodeCommand
 from extras.homing import Homing
 from copy import copy
 
+trace_gcode_move = tracing.get_category("gcode.move")
+
 class GCodeMove:
     """Main GCodeMove class.
 
@@ -80,6 +82,7 @@ class GCodeMove:
 
         # Register g-code commands
         gcode: GCodeDispatch = printer.lookup_object('gcode')
+        self.gcode = gcode
         handlers = [
             'G1', 'G20', 'G21',
             'M82', 'M83', 'G90', 'G91', 'G92', 'M220', 'M221',
@@ -90,11 +93,13 @@ class GCodeMove:
         for cmd in handlers:
             func = getattr(self, 'cmd_' + cmd)
             desc = getattr(self, 'cmd_' + cmd + '_help', None)
-            gcode.register_command(cmd, func, when_not_ready=False, desc=desc)
+            gcode.register_command(cmd, func, when_not_ready=False, desc=desc,
+                                   fast_params=(cmd == 'G1'))
 
         # Register G0 as an alias for G1.
         # TODO: Re-implement G0 as a proper "fast/non-contact move".
-        gcode.register_command('G0', self.cmd_G1, when_not_ready=False, desc=self.cmd_G0_help)
+        gcode.register_command('G0', self.cmd_G1, when_not_ready=False, desc=self.cmd_G0_help,
+                               fast_params=True)
 
         # NOTE: These commands require `when_not_ready=True`.
         gcode.register_command('M114', self.cmd_M114, when_not_ready=True)
@@ -126,12 +131,32 @@ class GCodeMove:
         #       toolhead.get_position) or "set_move_transform".
         self.position_with_transform = (lambda: [0.0 for i in range(self.pos_length)])
 
+        # G1 move parser tables (see "_build_move_parser").
+        self._build_move_parser()
+        # NOTE: Live list of "gcode_move:parsing_move_command" handlers,
+        #       used by cmd_G1 to skip the event when there are none.
+        self.parsing_move_handlers = printer.get_event_handlers(
+            "gcode_move:parsing_move_command")
+
+    def _build_move_parser(self):
+        # NOTE: Map the letters of the configured axes to their position
+        #       vector index (eg: {'X': 0, 'Y': 1, 'Z': 2, 'A': 3}), such
+        #       that cmd_G1 only looks at the parameters present in the
+        #       line. Letters of axes in the position vector that were not
+        #       configured (eg: 'B' and 'C' with "axis: XYZA") are errors.
+        self.move_axes = {a: i for a, i in self.axis_map.items()
+                          if a in self.axis_names}
+        self.unconfigured_axes = frozenset(a for a in self.axis_map
+                                           if a != 'E'
+                                           and a not in self.axis_names)
+
     def _handle_ready(self):
         self.is_printer_ready = True
         if self.move_transform is None:
             toolhead = self.printer.lookup_object(self.toolhead_id)
             self.move_with_transform = toolhead.move
             self.position_with_transform = toolhead.get_position
+        self._build_move_parser()
         self.reset_last_position()
 
     def _handle_shutdown(self):
@@ -218,15 +243,14 @@ class GCodeMove:
         # NOTE: Handler for "toolhead:set_position" and other events,
         #       sent at least by "toolhead.set_position" and also
         #       called by "_handle_activate_extruder" (and other methods).
-        logging.info(f"gcode_move.reset_last_position: triggered.")
         if self.is_printer_ready:
             # NOTE: The "" method is actually either "transform.get_position",
             #       "toolhead.get_position", or a default function returning "0.0"
             #       for all axis.
             self.last_position = self.position_with_transform()
-            logging.info(f"gcode_move.reset_last_position: set self.last_position={self.last_position}")
-        else:
-            logging.info(f"gcode_move.reset_last_position: printer not ready self.last_position={self.last_position} not updated.")
+            if trace_gcode_move.enabled:
+                trace_gcode_move.log("reset_last_position: last_position=%s",
+                                     self.last_position)
 
     # G-Code movement commands
     cmd_G1_help = "Linear move to a specified position with a controlled feedrate."
@@ -235,52 +259,121 @@ class GCodeMove:
 
         # Move
         params = gcmd.get_command_parameters()
-        logging.info(f"GCodeMove: G1 starting setup with params={params}")
-        logging.info(f"GCodeMove: current G1 modes are absolute_coord={self.absolute_coord} and absolute_extrude={self.absolute_extrude}")
+        move_axes = self.move_axes
+        last_position = self.last_position
         try:
-            # NOTE: XYZ(ABC) move coordinates.
-            for pos, axis in enumerate(list(self.axis_map)[:-1]):
-                if axis in params:
-                    if axis not in self.axis_names:
-                        raise self.printer.command_error(f"G1 error: you must configure the {axis} axis in order to use it.")
-                    v = float(params[axis])
-                    logging.info(f"GCodeMove: parsed axis={axis} with value={v}")
+            # NOTE: Only the parameters present in the line are visited.
+            for axis, value in params.items():
+                pos = move_axes.get(axis)
+                if pos is not None:
+                    # NOTE: XYZ(ABC) move coordinates.
+                    v = float(value)
                     if not self.absolute_coord:
                         # value relative to position of last move
-                        self.last_position[pos] += v
+                        last_position[pos] += v
                     else:
                         # value relative to base coordinate position
-                        self.last_position[pos] = v + self.base_position[pos]
-            # NOTE: extruder move coordinates.
-            if 'E' in params:
-                v = float(params['E']) * self.extrude_factor
-                logging.info(f"GCodeMove: parsed axis=E with value={v}")
-                if not self.absolute_coord or not self.absolute_extrude:
-                    # value relative to position of last move
-                    self.last_position[-1] += v
-                else:
-                    # value relative to base coordinate position
-                    self.last_position[-1] = v + self.base_position[-1]
-            # NOTE: move feedrate.
-            if 'F' in params:
-                gcode_speed = float(params['F'])
-                if gcode_speed <= 0.:
-                    raise gcmd.error("Invalid speed in '%s'"
-                                     % (gcmd.get_commandline(),))
-                self.speed = gcode_speed * self.speed_factor
+                        last_position[pos] = v + self.base_position[pos]
+                elif axis == 'E':
+                    # NOTE: extruder move coordinates.
+                    v = float(value) * self.extrude_factor
+                    if not self.absolute_coord or not self.absolute_extrude:
+                        # value relative to position of last move
+                        last_position[-1] += v
+                    else:
+                        # value relative to base coordinate position
+                        last_position[-1] = v + self.base_position[-1]
+                elif axis == 'F':
+                    # NOTE: move feedrate.
+                    gcode_speed = float(value)
+                    if gcode_speed <= 0.:
+                        raise gcmd.error("Invalid speed in '%s'"
+                                         % (gcmd.get_commandline(),))
+                    self.speed = gcode_speed * self.speed_factor
+                elif axis in self.unconfigured_axes:
+                    raise self.printer.command_error(f"G1 error: you must configure the {axis} axis in order to use it.")
 
         except ValueError as e:
             raise gcmd.error("Unable to parse move '%s'"
                              % (gcmd.get_commandline(),))
 
         # NOTE: send event to handlers, like "extra_toolhead.py"
-        self.printer.send_event("gcode_move:parsing_move_command", gcmd, params)
+        if self.parsing_move_handlers:
+            self.printer.send_event("gcode_move:parsing_move_command", gcmd, params)
 
         # NOTE: This is just a call to "toolhead.move", unless a
         #       move "transform" is in between (e.g. a bed mesh).
-        logging.info(f"GCodeMove: G1 moving to '{self.last_position}' at speed: {self.speed}")
+        if trace_gcode_move.enabled:
+            trace_gcode_move.log("G1 params=%s moving to %s at speed %s"
+                                 " (absolute_coord=%s absolute_extrude=%s)",
+                                 params, self.last_position, self.speed,
+                                 self.absolute_coord, self.absolute_extrude)
         self.move_with_transform(self.last_position, self.speed)
 
+    def move_path(self, columns, e_values, feedrates, gcmd=None):
+        """Queue a sequence of moves, as if each one was a G1 command in
+        absolute coordinates. 'columns' maps axis letters to the list of
+        their G-Code coordinates (one per move), 'e_values' is the list
+        of E parameters (or None) and 'feedrates' the list of F values.
+        The S parameter of 'gcmd' (the command of the path, eg: a G2
+        arc) is passed along with the first move (eg: a laser power).
+        """
+        if self.parsing_move_handlers:
+            # NOTE: The handlers expect G1 commands.
+            extra_params = {}
+            if gcmd is not None and 'S' in gcmd.get_command_parameters():
+                extra_params['S'] = gcmd.get_command_parameters()['S']
+            for i, feedrate in enumerate(feedrates):
+                params = {a: values[i] for a, values in columns.items()}
+                if e_values is not None:
+                    params['E'] = e_values[i]
+                params['F'] = feedrate
+                if not i:
+                    params.update(extra_params)
+                self.cmd_G1(self.gcode.create_gcode_command(
+                    "G1", "G1", params))
+            return
+        if not self.absolute_coord:
+            raise self.printer.command_error(
+                "Path moves require absolute coordinates")
+        axes = []
+        for axis, values in columns.items():
+            if axis in self.unconfigured_axes:
+                raise self.printer.command_error(f"G1 error: you must configure the {axis} axis in order to use it.")
+            pos = self.move_axes[axis]
+            axes.append((pos, values, self.base_position[pos]))
+        if min(feedrates) <= 0.:
+            raise self.printer.command_error("Invalid speed in path move")
+        relative_extrude = not self.absolute_extrude
+        extrude_factor = self.extrude_factor
+        e_base = self.base_position[-1]
+        speed_factor = self.speed_factor
+        last_position = self.last_position
+        move_with_transform = self.move_with_transform
+        for i, feedrate in enumerate(feedrates):
+            for pos, values, base in axes:
+                last_position[pos] = values[i] + base
+            if e_values is not None:
+                v = e_values[i] * extrude_factor
+                if relative_extrude:
+                    last_position[-1] += v
+                else:
+                    last_position[-1] = v + e_base
+            self.speed = feedrate * speed_factor
+            if trace_gcode_move.enabled:
+                trace_gcode_move.log("path move %d/%d to %s at speed %s",
+                                     i + 1, len(feedrates), last_position,
+                                     self.speed)
+            move_with_transform(last_position, self.speed)
+
+    def set_gcode_speed(self, feedrate):
+        """Set the feedrate of the following moves (as the F parameter
+        of a G1 command)"""
+        if feedrate <= 0.:
+            raise self.printer.command_error("Invalid speed '%s'"
+                                             % (feedrate,))
+        self.speed = feedrate * self.speed_factor
+
     # G-Code coordinate manipulation
     cmd_G20_help = "Set units to inches."
     def cmd_G20(self, gcmd):
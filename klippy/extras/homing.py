@@ -450,7 +450,7 @@ class Homing:
     def set_homed_position(self, pos):
         self.toolhead.set_position(self._fill_coord(pos))
 
-    def home_rails(self, rails, forcepos, movepos):
+    def home_rails(self, rails, forcepos, movepos, axis_rails=None):
         """Called by 'home_axis' at the 'cartesian_abc' kinematics module,
         which calculates the start position (which should be forced) and
         the end position (derived from endstop position parameters).
@@ -459,6 +459,9 @@ class Homing:
             rails (list): A list of stepper "rail" objects.
             forcepos (list): A list of 4 coordinates, used to force the start position.
             movepos (list): A list of 4 coordinates, used to indicate the target (home) position.
+            axis_rails (dict, optional): The rail of each homing axis, to home several independent
+                rails in parallel, each with its own homing info (see "homing_group"). By default
+                all rails are homed together with the homing info of the first rail.
         """
         # NOTE: this method is used by the home method of the
         #       cartesian kinematics, in response to a G28 command.
@@ -491,10 +494,24 @@ class Homing:
         hmove = HomingMove(printer=self.printer, endstops=endstops,
                            # NOTE: Force use of a specific toolhead.
                            toolhead=self.toolhead)
-        hmove.homing_move(homepos, hi.speed)
+        if axis_rails is not None:
+            # NOTE: Each axis moves at up to its own homing speed.
+            axis_infos = {axis: rail.get_homing_info()
+                          for axis, rail in axis_rails.items()}
+            speed = self._calc_group_speed(startpos, homepos,
+                                           {axis: axis_hi.speed for axis, axis_hi in axis_infos.items()})
+            hmove.homing_move(homepos, speed)
+        else:
+            hmove.homing_move(homepos, hi.speed)
+        trigger_mcu_pos = {sp.stepper_name: sp.trig_pos
+                           for sp in hmove.stepper_positions}
 
         # Perform second home
-        if hi.retract_dist:
+        if axis_rails is not None:
+            # NOTE: Only the rails with a "homing_retract_dist" are homed again.
+            hmove = self._home_group_again(axis_rails, axis_infos,
+                                           forcepos, movepos) or hmove
+        elif hi.retract_dist:
             # Retract
             # startpos=[0.0, 0.0, 0.0, 468.0, 0.0, 0.0, 0.0]
             # homepos=[0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0]
@@ -535,8 +552,9 @@ class Homing:
 
         # Signal home operation complete
         self.toolhead.flush_step_generation()
-        self.trigger_mcu_pos = {sp.stepper_name: sp.trig_pos
-                                for sp in hmove.stepper_positions}
+        trigger_mcu_pos.update({sp.stepper_name: sp.trig_pos
+                                for sp in hmove.stepper_positions})
+        self.trigger_mcu_pos = trigger_mcu_pos
         self.adjust_pos = {}
         self.printer.send_event(self.toolhead.event_prefix + "homing:home_rails_end", self, rails)
         if any(self.adjust_pos.values()):
@@ -573,6 +591,58 @@ class Homing:
 
         logging.info(f"homing.home_rails: finalized.")
 
+    def _calc_group_speed(self, startpos, endpos, axis_speeds):
+        # Speed of a move such that no axis exceeds its own speed
+        axes_d = [ep - sp for ep, sp in zip(endpos, startpos)]
+        move_d = math.sqrt(sum([d*d for d in axes_d[:-1]]))
+        move_t = max([abs(axes_d[axis]) / speed
+                      for axis, speed in axis_speeds.items()])
+        if not move_t:
+            return min(axis_speeds.values())
+        return move_d / move_t
+
+    def _home_group_again(self, axis_rails, axis_infos, forcepos, movepos):
+        """Retract each rail of a homing group by its own retract distance,
+        and home them again at their second homing speed.
+        Returns the HomingMove, or None if no rail has a retract distance."""
+        retract_axes = [axis for axis, hi in axis_infos.items() if hi.retract_dist]
+        if not retract_axes:
+            logging.info(f"homing.home_rails: homing ended with no second homing move.")
+            return None
+        startpos = self._fill_coord(forcepos)
+        homepos = self._fill_coord(movepos)
+        axes_d = [hp - sp for hp, sp in zip(homepos, startpos)]
+        # NOTE: The rails that are not homed again stay where they are.
+        curpos = self.toolhead.get_position()
+        retractpos, startpos, targetpos = list(curpos), list(curpos), list(curpos)
+        for axis in retract_axes:
+            retract_d = math.copysign(min(axis_infos[axis].retract_dist,
+                                          abs(axes_d[axis])), axes_d[axis])
+            retractpos[axis] = homepos[axis] - retract_d
+            startpos[axis] = retractpos[axis] - retract_d
+            targetpos[axis] = homepos[axis]
+        logging.info(f"homing.home_rails: issuing group retraction move to retractpos={retractpos}")
+        self.toolhead.move(retractpos, self._calc_group_speed(
+            curpos, retractpos,
+            {axis: axis_infos[axis].retract_speed for axis in retract_axes}))
+
+        # Home again
+        self.toolhead.set_position(startpos)
+        endstops = [es for axis in retract_axes
+                    for es in axis_rails[axis].get_endstops()]
+        hmove = HomingMove(self.printer, endstops, toolhead=self.toolhead)
+        logging.info(f"homing.home_rails: starting second group home startpos={startpos} and targetpos={targetpos}")
+        hmove.homing_move(targetpos, self._calc_group_speed(
+            startpos, targetpos,
+            {axis: axis_infos[axis].second_homing_speed for axis in retract_axes}))
+
+        # Check for no movement (endstop deactivation by retraction failed).
+        if hmove.check_no_movement() is not None:
+            raise self.printer.command_error(
+                "Endstop %s still triggered after retract"
+                % (hmove.check_no_movement(),))
+        return hmove
+
 class PrinterHoming:
     def __init__(self, config):
         self.printer = config.get_printer()
@@ -582,10 +652,56 @@ class PrinterHoming:
         # to be able to grab a different toolhead object when subclassing this elsewhere.
         self.toolhead_id = 'toolhead'
 
+        # NOTE: Groups of axes with independent endstops, homed in parallel
+        #       by a single homing move (e.g. "homing_group: XY, ABC").
+        pconfig = config.getsection('printer')
+        axis_names = pconfig.get('axis', 'XYZ')
+        self.homing_groups = []
+        for group in pconfig.getlist('homing_group', ()):
+            group = group.upper()
+            for axis in group:
+                if axis not in axis_names:
+                    raise config.error(f"homing_group: axis '{axis}' is not in the configured axes '{axis_names}'.")
+                if any(axis in g for g in self.homing_groups) or group.count(axis) > 1:
+                    raise config.error(f"homing_group: axis '{axis}' is in more than one homing group.")
+            self.homing_groups.append(group)
+        if self.homing_groups:
+            self.printer.register_event_handler("klippy:connect",
+                                                self._handle_connect)
+
         # Register g-code commands
         gcode = self.printer.lookup_object('gcode')
         gcode.register_command('G28', self.cmd_G28, desc=self.cmd_G28_help)
 
+    def _handle_connect(self):
+        toolhead = self.printer.lookup_object(self.toolhead_id)
+        for group in self.homing_groups:
+            for axis_name in group:
+                axis = toolhead.axis_map[axis_name]
+                kin = self._lookup_axis_kinematics(toolhead, axis)
+                try:
+                    rail = kin.get_homing_rail(axis)
+                except AttributeError:
+                    rail = None
+                if rail is None:
+                    raise self.printer.config_error(
+                        f"homing_group: axis '{axis_name}' can not be homed in parallel with other axes.")
+
+    def _lookup_axis_kinematics(self, toolhead, axis):
+        for kin_axes in list(toolhead.kinematics):
+            kin = toolhead.kinematics[kin_axes]
+            if axis in kin.axis:
+                return kin
+        return None
+
+    def _get_group_axes(self, toolhead, axis, axes):
+        # Requested axes in the homing group of an axis
+        for group in self.homing_groups:
+            group_axes = [toolhead.axis_map[n] for n in group]
+            if axis in group_axes:
+                return [a for a in axes if a in group_axes]
+        return [axis]
+
     def manual_home(self, toolhead, endstops, pos, speed,
                     triggered, check_triggered):
         hmove = HomingMove(self.printer, endstops, toolhead)
@@ -681,15 +797,32 @@ class PrinterHoming:
 
         logging.info(f"PrinterHoming.cmd_G28: homing axes={axes}")
 
+        # NOTE: Group the requested axes by their kinematics, keeping their order.
+        #       The axes of a homing group are homed together in parallel, when
+        #       the first of them comes up (see "homing_group").
+        homing_steps = []
+        for axis in axes:
+            group_axes = self._get_group_axes(toolhead, axis, axes)
+            if len(group_axes) > 1:
+                if (None, group_axes) not in homing_steps:
+                    homing_steps.append((None, group_axes))
+                continue
+            kin = self._lookup_axis_kinematics(toolhead, axis)
+            if kin is None:
+                continue
+            if homing_steps and homing_steps[-1][0] is kin:
+                homing_steps[-1][1].append(axis)
+            else:
+                homing_steps.append((kin, [axis]))
+
         # NOTE: Home all of the requested axes, from their respective kinematics.
-        for kin_axes in list(toolhead.kinematics):  # Iterate over ["XYZ", "ABC"].
-            # Get kinematics by axis set name (e.g. "XYZ").
-            kin = toolhead.kinematics[kin_axes]
-            logging.info(f"PrinterHoming.cmd_G28: checking if kin axes={kin.axis} have been requested to home.")
-            if any(i in kin.axis for i in axes):
+        for kin, homing_axes in homing_steps:
+            if kin is None:
+                logging.info(f"PrinterHoming.cmd_G28: homing {homing_axes} axes in parallel.")
+                self.home_group(homing_axes)
+            else:
                 # NOTE: The "kin.axis" object contains indexes for the axies it handles.
                 #       For example: [0, 1, 2] for XYZ, [3, 4] for AB, etc.
-                homing_axes = [a for a in axes if a in kin.axis]
                 logging.info(f"PrinterHoming.cmd_G28: homing {homing_axes} axes of the {kin.axis} kinematic.")
                 self.home_axes(kin=kin, homing_axes=homing_axes)
 
@@ -703,6 +836,38 @@ class PrinterHoming:
         # if any(i in kin_abc.axis for i in axes) and kin_abc is not None:
         #     self.home_axes(kin=kin_abc, homing_axes=[a for a in axes if a in kin_abc.axis])
 
+    def home_group(self, homing_axes):
+        """Home the requested axes in parallel, with a single homing move.
+
+        The axes may be from different kinematics (e.g. XYZ and ABC), but
+        each of them must have its own rail and endstop (see "homing_group").
+
+        Args:
+            homing_axes (list): List of axis indexes (e.g. [0, 1, 3]).
+        """
+        toolhead = self.printer.lookup_object(self.toolhead_id)
+        homing_state = Homing(printer=self.printer, toolhead=toolhead)
+        homing_state.set_axes(homing_axes)
+        forcepos = [None] * toolhead.pos_length
+        homepos = [None] * toolhead.pos_length
+        axis_rails = {}
+        for axis in homing_axes:
+            kin = self._lookup_axis_kinematics(toolhead, axis)
+            rail = kin.get_homing_rail(axis)
+            axis_forcepos, axis_homepos = kin.calc_homing_positions(axis, rail)
+            forcepos[axis] = axis_forcepos[axis]
+            homepos[axis] = axis_homepos[axis]
+            axis_rails[axis] = rail
+        try:
+            homing_state.home_rails(list(axis_rails.values()), forcepos, homepos,
+                                    axis_rails=axis_rails)
+        except self.printer.command_error:
+            if self.printer.is_shutdown():
+                raise self.printer.command_error(
+                    "Homing failed due to printer shutdown")
+            self.printer.lookup_object('stepper_enable').motor_off()
+            raise
+
     def home_axes(self, kin, homing_axes):
         """Home the requested axis on the specified kinematics.
 
@@ -0,0 +1,202 @@
+# Pre-parsed G-Code job files (".kgc") for the virtual sdcard
+#
+# Copyright (C) 2026  Nicolás A. Méndez
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+import os, struct, bisect
+
+# A ".kgc" file is a sidecar of a G-Code file, holding one record per
+# newline terminated line of the source. Records keep the byte length
+# of the source line, such that the source file position of every
+# command is known (and resume/seek stays exact). The layout is:
+#
+#   header:  magic, version, source size, source mtime (ns)
+#   records: line_len, kind, cmd_len, nparams, values_len, [line],
+#            [cmd, letters, values]
+#   index:   (source offset, kgc offset) of every INDEX_INTERVAL record
+#   footer:  index position, index entry count, end magic
+#
+# Record kinds:
+#   KIND_EMPTY: blank or comment only line, nothing is dispatched.
+#   KIND_TOKENS: a "fast_params" command (eg: "G1 X10 Y2") already split
+#       into its command and parameter values (space separated strings).
+#   KIND_SCRIPT: any other line, dispatched as a G-Code script.
+KGC_MAGIC = b'KGC\x00'
+KGC_END_MAGIC = b'KGCE'
+KGC_VERSION = 2
+HEADER = struct.Struct('<4sIQQ')
+RECORD = struct.Struct('<IBBBH')
+INDEX_ENTRY = struct.Struct('<QQ')
+FOOTER = struct.Struct('<QQ4s')
+KIND_EMPTY, KIND_TOKENS, KIND_SCRIPT = range(3)
+INDEX_INTERVAL = 256
+READ_SIZE = 65536
+YIELD_LINES = 10000
+
+class error(Exception):
+    pass
+
+def kgc_path(filename):
+    # NOTE: Hidden sidecar, not listed by M20 nor by the file lists.
+    dirname, basename = os.path.split(filename)
+    return os.path.join(dirname, '.' + basename + '.kgc')
+
+def _source_stamp(filename):
+    st = os.stat(filename)
+    return st.st_size, st.st_mtime_ns
+
+def is_current(filename):
+    """Check if the ".kgc" sidecar of a G-Code file is up to date"""
+    try:
+        with open(kgc_path(filename), 'rb') as f:
+            header = f.read(HEADER.size)
+            f.seek(-FOOTER.size, os.SEEK_END)
+            footer = f.read(FOOTER.size)
+    except (OSError, IOError):
+        return False
+    if len(header) != HEADER.size or len(footer) != FOOTER.size:
+        return False
+    magic, version, size, mtime = HEADER.unpack(header)
+    if (magic != KGC_MAGIC or version != KGC_VERSION
+        or FOOTER.unpack(footer)[2] != KGC_END_MAGIC):
+        return False
+    return (size, mtime) == _source_stamp(filename)
+
+def _encode_line(tokenizer, raw):
+    line = raw.decode().strip()
+    cpos = line.find(';')
+    if cpos >= 0:
+        line = line[:cpos]
+    if not line.strip():
+        return RECORD.pack(len(raw), KIND_EMPTY, 0, 0, 0)
+    cmd, params = tokenizer.tokenize(line)
+    values = ' '.join(params.values()).encode()
+    if (cmd not in tokenizer.fast_param_commands or len(params) > 255
+        or len(values) > 0xffff
+        or any(len(p) != 1 or ' ' in v for p, v in params.items())):
+        return RECORD.pack(len(raw), KIND_SCRIPT, 0, 0, 0) + raw
+    bcmd = cmd.encode()
+    letters = ''.join(params).encode()
+    return b''.join([RECORD.pack(len(raw), KIND_TOKENS, len(bcmd),
+                                 len(params), len(values)),
+                     raw, bcmd, letters, values])
+
+def compile_file(filename, tokenizer, yield_cb=None):
+    """Generate the ".kgc" sidecar of a G-Code file. The optional
+    yield_cb is called periodically (eg: to run the reactor)."""
+    dest = kgc_path(filename)
+    tmp = dest + '.tmp'
+    size, mtime = _source_stamp(filename)
+    index = []
+    count = 0
+    try:
+        with open(filename, 'rb') as src, open(tmp, 'wb') as out:
+            out.write(HEADER.pack(KGC_MAGIC, KGC_VERSION, size, mtime))
+            kgc_pos = HEADER.size
+            src_pos = 0
+            partial = b''
+            while True:
+                data = src.read(READ_SIZE)
+                if not data:
+                    # NOTE: A last line without a newline is not run by
+                    #       the sdcard (same as the plain text reader).
+                    break
+                lines = (partial + data).split(b'\n')
+                partial = lines.pop()
+                out_data = []
+                for raw in lines:
+                    if not count % INDEX_INTERVAL:
+                        index.append((src_pos, kgc_pos))
+                    rec = _encode_line(tokenizer, raw)
+                    out_data.append(rec)
+                    kgc_pos += len(rec)
+                    src_pos += len(raw) + 1
+                    count += 1
+                    if yield_cb is not None and not count % YIELD_LINES:
+                        yield_cb()
+                out.write(b''.join(out_data))
+            index_pos = kgc_pos
+            out.write(b''.join([INDEX_ENTRY.pack(*e) for e in index]))
+            out.write(FOOTER.pack(index_pos, len(index), KGC_END_MAGIC))
+        os.replace(tmp, dest)
+    except:
+        try:
+            os.unlink(tmp)
+        except OSError:
+            pass
+        raise
+    return count
+
+# Sequential reader of the records of a ".kgc" file
+class KGCReader:
+    def __init__(self, filename):
+        self.file = open(kgc_path(filename), 'rb')
+        self.file.seek(-FOOTER.size, os.SEEK_END)
+        index_pos, index_count, magic = FOOTER.unpack(
+            self.file.read(FOOTER.size))
+        self.file.seek(index_pos)
+        data = self.file.read(index_count * INDEX_ENTRY.size)
+        entries = [INDEX_ENTRY.unpack_from(data, i * INDEX_ENTRY.size)
+                   for i in range(index_count)]
+        self.index_src = [e[0] for e in entries]
+        self.index_kgc = [e[1] for e in entries]
+        self.end_pos = index_pos
+        self.buffer = b''
+        self.buffer_pos = 0
+        self.kgc_pos = self.src_pos = 0
+    def close(self):
+        self.file.close()
+    def seek(self, src_pos):
+        """Position the reader at the record of the line starting at
+        'src_pos'. Returns False if no line starts at that position."""
+        i = bisect.bisect_right(self.index_src, src_pos) - 1
+        if i < 0:
+            return False
+        self.src_pos = self.index_src[i]
+        self.kgc_pos = self.index_kgc[i]
+        self.buffer = b''
+        self.buffer_pos = 0
+        while self.src_pos < src_pos:
+            if self.read_record() is None:
+                return False
+        return self.src_pos == src_pos
+    def _fill(self, size):
+        # Make sure 'size' bytes are available in the buffer
+        avail = len(self.buffer) - self.buffer_pos
+        if avail >= size:
+            return True
+        self.file.seek(self.kgc_pos + avail)
+        want = max(size - avail, READ_SIZE)
+        want = min(want, self.end_pos - self.kgc_pos - avail)
+        data = self.file.read(want) if want > 0 else b''
+        self.buffer = self.buffer[self.buffer_pos:] + data
+        self.buffer_pos = 0
+        return len(self.buffer) >= size
+    def read_record(self):
+        """Return the next record as (line_len, kind, line, cmd, params),
+        or None at the end of the file."""
+        if not self._fill(RECORD.size):
+            return None
+        line_len, kind, cmd_len, nparams, values_len = RECORD.unpack_from(
+            self.buffer, self.buffer_pos)
+        size = RECORD.size
+        if kind != KIND_EMPTY:
+            size += line_len + cmd_len + nparams + values_len
+        if not self._fill(size):
+            raise error("Truncated kgc file")
+        buf, pos = self.buffer, self.buffer_pos + RECORD.size
+        line = cmd = params = None
+        if kind != KIND_EMPTY:
+            line = buf[pos:pos+line_len].decode()
+            pos += line_len
+        if kind == KIND_TOKENS:
+            cmd = buf[pos:pos+cmd_len].decode()
+            pos += cmd_len
+            letters = buf[pos:pos+nparams].decode()
+            pos += nparams
+            values = buf[pos:pos+values_len].decode().split(' ')
+            params = dict(zip(letters, values))
+        self.buffer_pos += size
+        self.kgc_pos += size
+        self.src_pos += line_len + 1
+        return line_len, kind, line, cmd, params
@@ -0,0 +1,253 @@
+# Path blending (G64/G61) and cubic/quadratic spline moves (G5/G5.1)
+#
+# Copyright (C) 2026  Nicolás A. Méndez
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+import math, tracing
+
+trace_blend = tracing.get_category("gcode.blend")
+
+# Chords shorter than this are not blended
+BLEND_MIN_CHORD = .000001
+
+# Short G1 segments (eg: from CAM surfacing toolpaths) that continue
+# the last queued move within the blending tolerance replace it by a
+# single longer move (see ToolHead.move). The lookahead then plans one
+# move instead of many, with no junctions in between. Only moves still
+# in the lookahead queue are merged, so nothing is ever held back from
+# it.
+class PathBlend:
+    def __init__(self, config):
+        """Merging of near colinear moves and G5/G5.1 splines.
+
+        [path_blend]
+        #tolerance: 0.01
+        #   Maximum distance (in mm) between the commanded path and the
+        #   moves sent to the toolhead, both for the segments merged by
+        #   G64 and for the segments of G5/G5.1 splines. The default is
+        #   0.01 mm.
+        #max_segments: 32
+        #   Maximum number of G-Code segments merged into a single move.
+        #   The default is 32.
+        #blend: True
+        #   Start in the blending mode of G64 (otherwise, in the exact
+        #   path mode of G61). The default is True.
+        """
+        self.printer = config.get_printer()
+        self.tolerance = config.getfloat('tolerance', .01, minval=0.)
+        self.max_segments = config.getint('max_segments', 32, minval=2)
+        self.blend_tolerance = self.tolerance
+        self.is_blending = config.getboolean('blend', True)
+        # Last queued move, its speed and the end points of the
+        # segments already merged into it
+        self.last_move = None
+        self.last_speed = 0.
+        self.points = []
+        # End point of the last G5 and its second control point
+        # (relative to the end point)
+        self.last_spline = None
+        self.gcode_move = self.printer.load_object(config, 'gcode_move')
+        self.gcode = self.printer.lookup_object('gcode')
+        self.toolhead = None
+        self.printer.register_event_handler("klippy:connect",
+                                            self._handle_connect)
+        handlers = ['G64', 'G61', 'G5', 'G5.1']
+        for cmd in handlers:
+            func = getattr(self, 'cmd_' + cmd.replace('.', '_'))
+            desc = getattr(self, 'cmd_' + cmd.replace('.', '_') + '_help',
+                           None)
+            self.gcode.register_command(cmd, func, when_not_ready=False,
+                                        desc=desc)
+
+    def _handle_connect(self):
+        self.toolhead = self.printer.lookup_object('toolhead')
+        self._set_blending(self.is_blending)
+
+    def _set_blending(self, is_blending):
+        self.is_blending = is_blending
+        self.last_move = None
+        self.points = []
+        self.toolhead.set_path_blend(self if is_blending else None)
+
+    def get_status(self, eventtime=None):
+        return {'blending': self.is_blending,
+                'tolerance': self.blend_tolerance}
+
+    # Toolhead interface (see ToolHead.move)
+    def check_merge(self, last_move, start_pos, end_pos, speed):
+        """Return the last queued move if the new move to 'end_pos'
+        can replace it, or None."""
+        if (last_move is None or last_move is not self.last_move
+            or speed != self.last_speed or last_move.timing_callbacks
+            or not last_move.is_kinematic_move
+            or len(self.points) >= self.max_segments - 1
+            or last_move.end_pos != tuple(start_pos)):
+            return None
+        # Distance of the end points of all merged segments to the chord
+        # of the new move
+        a = last_move.start_pos
+        axes = range(len(a) - 1)
+        d = [end_pos[i] - a[i] for i in axes]
+        chord2 = 0.
+        for v in d:
+            chord2 += v * v
+        if chord2 < BLEND_MIN_CHORD**2:
+            return None
+        tolerance = self.blend_tolerance
+        tolerance2 = tolerance * tolerance
+        de = end_pos[-1] - a[-1]
+        # Extrusion error allowed at the same ratio as the path error
+        e_tolerance = abs(de) * tolerance / math.sqrt(chord2)
+        last_t = 0.
+        for p in self.points + [last_move.end_pos]:
+            pd = [p[i] - a[i] for i in axes]
+            t = 0.
+            for i in axes:
+                t += pd[i] * d[i]
+            t /= chord2
+            if t <= last_t or t >= 1.:
+                # Not moving forward along the chord
+                return None
+            dist2 = 0.
+            for i in axes:
+                v = pd[i] - t * d[i]
+                dist2 += v * v
+            if (dist2 > tolerance2
+                or abs(p[-1] - a[-1] - t * de) > e_tolerance):
+                return None
+            last_t = t
+        return last_move
+
+    def note_move(self, move, speed, merged_move):
+        if merged_move is not None:
+            self.points.append(merged_move.end_pos)
+            if trace_blend.enabled:
+                trace_blend.log("merged %d segments into a move to %s",
+                                len(self.points) + 1, move.end_pos)
+        elif self.points:
+            self.points = []
+        self.last_move = move
+        self.last_speed = speed
+
+    cmd_G64_help = "Blend the path within a tolerance (P)"
+    def cmd_G64(self, gcmd):
+        """Path Blending: G64 [P<tolerance>]"""
+        self.blend_tolerance = gcmd.get_float('P', self.tolerance, minval=0.)
+        self._set_blending(True)
+
+    cmd_G61_help = "Exact path mode (no blending)"
+    def cmd_G61(self, gcmd):
+        """Exact Path Mode: G61"""
+        self._set_blending(False)
+
+    cmd_G5_help = "Cubic spline move to a specified position"
+    def cmd_G5(self, gcmd):
+        """Cubic Spline: G5 [X<pos>] [Y<pos>] [E<pos>] [F<speed>] [I<offset> J<offset>] P<offset> Q<offset>"""
+        last_spline, self.last_spline = self.last_spline, None
+        start, end, gcodestatus = self._parse_spline_end(gcmd)
+        # First control point, relative to the start point (I and J are
+        # optional after another G5, which continues its tangent)
+        i = gcmd.get_float('I', None)
+        j = gcmd.get_float('J', None)
+        if i is None and j is None:
+            if (last_spline is None or math.hypot(
+                    last_spline[0][0] - start[0],
+                    last_spline[0][1] - start[1]) > BLEND_MIN_CHORD):
+                raise gcmd.error("G5 requires I and J parameters when not"
+                                 " following another G5")
+            i, j = [-v for v in last_spline[1]]
+        elif i is None or j is None:
+            raise gcmd.error("G5 requires both I and J parameters")
+        # Second control point, relative to the end point
+        p = gcmd.get_float('P', None)
+        q = gcmd.get_float('Q', None)
+        if p is None or q is None:
+            raise gcmd.error("G5 requires P and Q parameters")
+        points = [start, (start[0] + i, start[1] + j),
+                  (end[0] + p, end[1] + q), end]
+        self._spline_move(gcmd, points, gcodestatus)
+        self.last_spline = (end, (p, q))
+
+    cmd_G5_1_help = "Quadratic spline move to a specified position"
+    def cmd_G5_1(self, gcmd):
+        """Quadratic Spline: G5.1 [X<pos>] [Y<pos>] [E<pos>] [F<speed>] I<offset> J<offset>"""
+        self.last_spline = None
+        start, end, gcodestatus = self._parse_spline_end(gcmd)
+        i = gcmd.get_float('I', None)
+        j = gcmd.get_float('J', None)
+        if i is None or j is None:
+            raise gcmd.error("G5.1 requires I and J parameters")
+        points = [start, (start[0] + i, start[1] + j), end]
+        self._spline_move(gcmd, points, gcodestatus)
+
+    def _parse_spline_end(self, gcmd):
+        # Splines are planned in absolute coordinates of the XY plane
+        gcodestatus = self.gcode_move.get_status()
+        if not gcodestatus['absolute_coordinates']:
+            raise gcmd.error("G5/G5.1 does not support relative move mode")
+        pos = gcodestatus['gcode_position']
+        start = (pos[0], pos[1])
+        end = (gcmd.get_float('X', pos[0]), gcmd.get_float('Y', pos[1]))
+        return start, end, gcodestatus
+
+    def _spline_move(self, gcmd, points, gcodestatus):
+        # Number of segments from Wang's formula, such that the distance
+        # between the curve and its segments stays within the tolerance
+        degree = len(points) - 1
+        max_d = 0.
+        for p0, p1, p2 in zip(points, points[1:], points[2:]):
+            max_d = max(max_d, math.hypot(p0[0] - 2. * p1[0] + p2[0],
+                                          p0[1] - 2. * p1[1] + p2[1]))
+        count = 1
+        if max_d:
+            factor = degree * (degree - 1) / 8. * max_d
+            count = max(1, int(math.ceil(math.sqrt(
+                factor / max(self.tolerance, BLEND_MIN_CHORD)))))
+        xs, ys = _eval_bezier(points, count)
+        # Extrusion in proportion to the length of each segment
+        asE = gcmd.get_float('E', None)
+        e_values = None
+        if asE is not None:
+            lengths = [math.hypot(x1 - x0, y1 - y0) for x0, x1, y0, y1 in zip(
+                [points[0][0]] + xs, xs, [points[0][1]] + ys, ys)]
+            total = sum(lengths) or 1.
+            e_base = 0.
+            if gcodestatus['absolute_extrude']:
+                e_base = gcodestatus['gcode_position'].e
+            e_travel = asE - e_base
+            if gcodestatus['absolute_extrude']:
+                e_values = []
+                length = 0.
+                for l in lengths:
+                    length += l
+                    e_values.append(e_base + e_travel * length / total)
+                e_values[-1] = asE
+            else:
+                e_values = [e_travel * l / total for l in lengths]
+        feedrate = gcmd.get_float('F', gcodestatus['speed'], above=0.)
+        if trace_blend.enabled:
+            trace_blend.log("%s: %d segments", gcmd.get_commandline(), count)
+        self.gcode_move.move_path({'X': xs, 'Y': ys}, e_values,
+                                  [feedrate] * count, gcmd)
+        self.gcode_move.set_gcode_speed(feedrate)
+
+# Points of a Bezier curve at "count" equal steps of its parameter (not
+# including the start point), as lists of X and Y coordinates
+def _eval_bezier(points, count):
+    xs = []
+    ys = []
+    for step in range(1, count):
+        t = step / count
+        # De Casteljau's algorithm
+        pts = points
+        while len(pts) > 1:
+            pts = [(p0[0] + (p1[0] - p0[0]) * t, p0[1] + (p1[1] - p0[1]) * t)
+                   for p0, p1 in zip(pts, pts[1:])]
+        xs.append(pts[0][0])
+        ys.append(pts[0][1])
+    xs.append(points[-1][0])
+    ys.append(points[-1][1])
+    return xs, ys
+
+def load_config(config):
+    return PathBlend(config)
@@ -25,11 +25,14 @@ class PauseResume:
                                     desc=self.cmd_CANCEL_PRINT_help)
         webhooks = self.printer.lookup_object('webhooks')
         webhooks.register_endpoint("pause_resume/cancel",
-                                   self._handle_cancel_request)
+                                   self._handle_cancel_request,
+                                   priority='motion')
         webhooks.register_endpoint("pause_resume/pause",
-                                   self._handle_pause_request)
+                                   self._handle_pause_request,
+                                   priority='motion')
         webhooks.register_endpoint("pause_resume/resume",
-                                   self._handle_resume_request)
+                                   self._handle_resume_request,
+                                   priority='motion')
     def handle_connect(self):
         self.v_sd = self.printer.lookup_object('virtual_sdcard', None)
     def _handle_cancel_request(self, web_request):
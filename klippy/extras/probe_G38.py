@@ -20,6 +20,8 @@ if TYPE_CHECKING:
 # pylint: disable=logging-fstring-interpolation,logging-not-lazy,fixme
 
 import logging
+import mcu
+from .homing import HOMING_START_DELAY, ENDSTOP_SAMPLE_TIME, ENDSTOP_SAMPLE_COUNT
 from .probe import ProbeCommandHelper, PrinterProbe, ProbeOffsetsHelper, ProbeSessionHelper, ProbeEndstopWrapper, HINT_TIMEOUT
 
 # Main external probe interface
@@ -87,33 +89,41 @@ class ProbeEndstopWrapperG38(ProbeEndstopWrapper):
     #       extruder steppers.
     def _handle_mcu_identify(self):
         logging.info(f"ProbeEndstopWrapperG38: associating all steppers to probe endstop '{self.mcu_probe_name}'.")
-
-        # NOTE: Register XYZ steppers.
-        toolhead: ToolHead = self.printer.lookup_object('toolhead')
-
-        kins = toolhead.kinematics
-        for ax_set in list(kins):
-            kin = toolhead.get_kinematics(ax_set)
-            if kin is not None:
-                # NOTE: "kin.get_steppers" returns all "PrinterStepper"/"MCU_stepper" objects in the kinematic.
-                for stepper in kin.get_steppers():
-                    # NOTE: The usual 'xyz' letters are used here, even if they don't match the kin's axis names (e.g. ABC).
-                    if stepper.is_active_axis('x') or stepper.is_active_axis('y') or stepper.is_active_axis('z'):
-                        # NOTE: The "add_stepper" method called here is ultimately
-                        #       from the "TriggerDispatch" class in "mcu.py",
-                        self.add_stepper(stepper)
-
-        # NOTE: register steppers from all extruders.
-        extruder_objs = self.printer.lookup_extruders()
-        for extruder_obj in extruder_objs:
-            # extruder_name = extruder_obj[0]
-            extruder: PrinterExtruder = extruder_obj[1]                      # PrinterExtruder
-            extruder_stepper: ExtruderStepper = extruder.extruder_stepper    # ExtruderStepper
-            for stepper in extruder_stepper.rail.get_steppers():
-                # NOTE: this requires the PrinterRail or MCU_stepper objects
-                #       to have the "get_steppers" method. The original MCU_stepper
-                #       object did not, but it has been patched at "stepper.py".
-                self.add_stepper(stepper)
+        add_probing_steppers(self.printer, self)
+
+def add_probing_steppers(printer, mcu_endstop):
+    """Associate the XYZ and extruder steppers to an endstop (or to a group of endstops, see 'probe_G38_multi')."""
+    # NOTE: Register XYZ steppers.
+    toolhead: ToolHead = printer.lookup_object('toolhead')
+
+    kins = toolhead.kinematics
+    for ax_set in list(kins):
+        kin = toolhead.get_kinematics(ax_set)
+        if kin is not None:
+            # NOTE: "kin.get_steppers" returns all "PrinterStepper"/"MCU_stepper" objects in the kinematic.
+            for stepper in kin.get_steppers():
+                # NOTE: The usual 'xyz' letters are used here, even if they don't match the kin's axis names (e.g. ABC).
+                if stepper.is_active_axis('x') or stepper.is_active_axis('y') or stepper.is_active_axis('z'):
+                    # NOTE: The "add_stepper" method called here is ultimately
+                    #       from the "TriggerDispatch" class in "mcu.py",
+                    mcu_endstop.add_stepper(stepper)
+
+    # NOTE: register steppers from all extruders.
+    extruder_objs = printer.lookup_extruders()
+    for extruder_obj in extruder_objs:
+        # extruder_name = extruder_obj[0]
+        extruder: PrinterExtruder = extruder_obj[1]                      # PrinterExtruder
+        extruder_stepper: ExtruderStepper = extruder.extruder_stepper    # ExtruderStepper
+        for stepper in extruder_stepper.rail.get_steppers():
+            # NOTE: this requires the PrinterRail or MCU_stepper objects
+            #       to have the "get_steppers" method. The original MCU_stepper
+            #       object did not, but it has been patched at "stepper.py".
+            mcu_endstop.add_stepper(stepper)
+
+# NOTE: Scans re-arm the endstop after each event, at this delay from the
+#       time at which the host noticed it. Events in between are missed.
+SCAN_REARM_DELAY = 0.050
+SCAN_REST_TIME = 0.0002
 
 class ProbeG38:
     """
@@ -172,6 +182,9 @@ class ProbeG38:
         # NOTE: Dummy position vector, overriden later.
         self.last_position = [None, None, None, None]
 
+        # NOTE: Events from the last PROBE_SCAN command.
+        self.last_scan = []
+
         # NOTE: recovery stuff
         self.recovery_time = config.getfloat('recovery_time', 0.4, minval=0.)
 
@@ -215,12 +228,24 @@ class ProbeG38:
                                     self.cmd_PROBE_G38_5,
                                     when_not_ready=False,
                                     desc=self.cmd_PROBE_G38_5_help)
+        #       - Probe along a move without stopping, recording all events.
+        self.gcode.register_command("PROBE_SCAN",
+                                    self.cmd_PROBE_SCAN,
+                                    desc=self.cmd_PROBE_SCAN_help)
+        # NOTE: A trigger dispatch without steppers, such that the probe
+        #       endstop can trigger without stopping the scanning move.
+        #       It must be created before the MCUs are configured.
+        self.scan_dispatch = mcu.TriggerDispatch(
+            self.probe.mcu_probe.mcu_endstop.get_mcu())
 
     def _handle_mcu_identify(self):
         # NOTE: Get the proper ToolHead object.
         self.toolhead: ToolHead = self.printer.lookup_object('toolhead')
         self.gcode_move: GCodeMove = self.printer.lookup_object("gcode_move")
 
+    def get_status(self, eventtime=None):
+        return {'last_scan': self.last_scan}
+
     # Probe command variants
     cmd_PROBE_G38_5_help = "G38.5 Probe away from workpiece, stop on loss of contact."
     def cmd_PROBE_G38_5(self, gcmd):
@@ -239,9 +264,26 @@ class ProbeG38:
 
     # Main probe command
     cmd_PROBE_G38_2_help = "G38.2 Probe toward workpiece, stop on contact, signal error if failure."
-    def cmd_PROBE_G38_2(self, gcmd: GCodeCommand, error_out=True, trigger_invert=True):
+    def cmd_PROBE_G38_2(self, gcmd: GCodeCommand, error_out=True, trigger_invert=True, mcu_probe=None):
         # Error on failure, do not invert probe logic.
+        pos, speed, probe_axes = self._parse_probe_move(gcmd)
+
+        # NOTE: "move_with_transform" is just "toolhead.move":
+        # self.move_with_transform(self.last_position, self.gcode_move.speed)
 
+        # TODO: should this go here? borrowed code from "smart_effector"
+        if self.recovery_time:
+            self.toolhead.dwell(self.recovery_time)
+
+        # NOTE: my probe works!
+        return self.probe_g38(pos=pos, speed=speed,
+                              error_out=error_out, gcmd=gcmd,
+                              trigger_invert=trigger_invert,
+                              probe_axes=probe_axes, mcu_probe=mcu_probe)
+
+    def _parse_probe_move(self, gcmd: GCodeCommand):
+        """Parse the target position and speed of a probing command.
+        Returns the position, speed and list of probing axes."""
         # NOTE: Get the toolhead's last position.
         #       This will be updated below.
         self.last_position = self.toolhead.get_position()
@@ -306,22 +348,16 @@ class ProbeG38:
         except ValueError as e:
             raise gcmd.error(f"ProbeG38: Unable to parse move {gcmd.get_commandline()} with exception: {str(e)}")
 
-        # NOTE: "move_with_transform" is just "toolhead.move":
-        # self.move_with_transform(self.last_position, self.gcode_move.speed)
-
-        # TODO: should this go here? borrowed code from "smart_effector"
-        if self.recovery_time:
-            self.toolhead.dwell(self.recovery_time)
+        return self.last_position, speed, probe_axes
 
-        # NOTE: my probe works!
-        self.probe_g38(pos=self.last_position, speed=speed,
-                       error_out=error_out, gcmd=gcmd,
-                       trigger_invert=trigger_invert,
-                       probe_axes=probe_axes)
-
-    def probe_g38(self, pos, speed, error_out, gcmd: GCodeCommand, trigger_invert, probe_axes=None):
+    def probe_g38(self, pos, speed, error_out, gcmd: GCodeCommand, trigger_invert, probe_axes=None, mcu_probe=None):
         logging.info("probe_g38 probing with axes: " + str(probe_axes))
 
+        # NOTE: Probe with this module's endstop, unless another one
+        #       (e.g. a group of endstops) is given.
+        if mcu_probe is None:
+            mcu_probe = self.probe.mcu_probe
+
         # TODO: rethink if "homing" the machine is neccessary for probing.
         # curtime = self.printer.get_reactor().monotonic()
         # if 'z' not in toolhead.get_status(curtime)['homed_axes']:
@@ -341,7 +377,7 @@ class ProbeG38:
             # NOTE: I had to add a "check_triggered" argument to
             #       "probing_move" for G38.3 to work properly.
             # NOTE: This "epos" is "trigpos" from the "homing_move" method.
-            epos = phoming.probing_move(mcu_probe=self.probe.mcu_probe,
+            epos = phoming.probing_move(mcu_probe=mcu_probe,
                                         pos=pos,
                                         speed=speed,
                                         check_triggered=error_out,
@@ -393,6 +429,77 @@ class ProbeG38:
 
         return epos[:-1]
 
+    # Continuous scan command
+    cmd_PROBE_SCAN_help = "Probe along a move without stopping, reporting every trigger and untrigger position. Usage: PROBE_SCAN [X=x] [Y=y] [Z=z] [F=feedrate]"
+    def cmd_PROBE_SCAN(self, gcmd: GCodeCommand):
+        pos, speed, probe_axes = self._parse_probe_move(gcmd)
+        self.last_scan = self.scan_g38(pos=pos, speed=speed)
+        for event in self.last_scan:
+            msg = " ".join(["%s=%.3f" % (axis.lower(), value) for axis, value
+                            in zip(self.toolhead.axis_names, event['position'])])
+            gcmd.respond_info("probe %s at %s" % (
+                "trigger" if event['triggered'] else "untrigger", msg))
+        gcmd.respond_info(f"probe scan ended with {len(self.last_scan)} events")
+
+    def scan_g38(self, pos, speed):
+        """Move to 'pos' at feed speed, without stopping on probe events.
+        Returns the list of trigger and untrigger events along the move.
+
+        The probe endstop is armed on a trigger dispatch without steppers,
+        and re-armed with the opposite polarity after each event. The
+        positions are calculated from the stepper's step history.
+        """
+        mcu_endstop = self.probe.mcu_probe.mcu_endstop
+        mcu_obj = mcu_endstop.get_mcu()
+        reactor = self.printer.get_reactor()
+        self.toolhead.flush_step_generation()
+        print_time = self.toolhead.get_last_move_time()
+        triggered = not mcu_endstop.query_endstop(print_time)
+        self._scan_arm(print_time, triggered)
+        self.toolhead.dwell(HOMING_START_DELAY)
+        self.toolhead.move(pos, speed)
+        end_time = self.toolhead.get_last_move_time()
+        events = []
+        while True:
+            self.scan_dispatch.wait_end(end_time)
+            mcu_endstop.disarm()
+            res = self.scan_dispatch.stop()
+            if res >= mcu.MCU_trsync.REASON_COMMS_TIMEOUT:
+                raise self.printer.command_error(
+                    "Communication timeout during probe scan")
+            if res != mcu.MCU_trsync.REASON_ENDSTOP_HIT or mcu_obj.is_fileoutput():
+                break
+            trigger_time = mcu_endstop.query_trigger()[0]
+            events.append({'time': trigger_time, 'triggered': triggered,
+                           'position': self._scan_position(trigger_time)})
+            logging.info(f"probe_g38 scan event: {events[-1]}")
+            # Re-arm for the opposite event, if the move is not over yet.
+            triggered = not triggered
+            print_time = mcu_obj.estimated_print_time(reactor.monotonic())
+            print_time = max(print_time, trigger_time) + SCAN_REARM_DELAY
+            if print_time >= end_time:
+                break
+            self._scan_arm(print_time, triggered)
+        return events
+
+    def _scan_arm(self, print_time, triggered):
+        self.scan_dispatch.start(print_time)
+        self.probe.mcu_probe.mcu_endstop.arm(
+            print_time, ENDSTOP_SAMPLE_TIME, ENDSTOP_SAMPLE_COUNT,
+            SCAN_REST_TIME, triggered, self.scan_dispatch.get_oid())
+
+    def _scan_position(self, print_time):
+        # NOTE: Same as "calc_toolhead_pos" in "homing.py", using the past
+        #       stepper positions (see "StepperPosition") at the event time.
+        position = []
+        for axes in list(self.toolhead.kinematics):
+            kin = self.toolhead.kinematics[axes]
+            kin_spos = {s.get_name(): s.mcu_to_commanded_position(
+                            s.get_past_mcu_position(print_time))
+                        for s in kin.get_steppers()}
+            position += list(kin.calc_position(stepper_positions=kin_spos))[:3]
+        return position
+
 
 def load_config(config):
     # TODO: Consider registering the PrinterProbe object as 'probe' in the printer.
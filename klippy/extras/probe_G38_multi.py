@@ -20,8 +20,9 @@ if TYPE_CHECKING:
 # pylint: disable=logging-fstring-interpolation,logging-not-lazy,fixme
 
 import logging
+import mcu
 from .probe import ProbeCommandHelper, PrinterProbe, ProbeOffsetsHelper, ProbeSessionHelper
-from .probe_G38 import ProbeG38, ProbeEndstopWrapperG38
+from .probe_G38 import ProbeG38, ProbeEndstopWrapperG38, add_probing_steppers
 
 class ProbeG38multi(ProbeG38):
     """
@@ -62,6 +63,12 @@ class ProbeG38multi(ProbeG38):
         # NOTE: Readable name for the probe/endstop.
         self.mcu_probe_name = 'probe_' + self.probe_name
 
+        # NOTE: Group of the endstops of all probes, setup by the first
+        #       instance (see "_handle_mcu_identify"), and the probe that
+        #       triggered first in the last MULTIPROBE_ANY command.
+        self.probe_group = None
+        self.last_trigger = {'probe': None, 'position': None}
+
         # NOTE: Call the init method in ProbeG38.
         #       It is important that certain methods are overridden below for this to work:
         #       "setup_probe" and "register_commands".
@@ -109,6 +116,28 @@ class ProbeG38multi(ProbeG38):
             logging.info("ProbeG38multi: G38.2 not yet configured, running G38.n register_command.")
             # NOTE: Register the commands using the parent methods from ProbeG38.
             super().register_commands()
+            # NOTE: Register the commands probing with several probes at once.
+            for n in range(2, 6):
+                self.gcode.register_command(
+                    "MULTIPROBE_ANY%d" % n,
+                    getattr(self, "cmd_MULTIPROBE_ANY_%d" % n),
+                    desc=getattr(self, "cmd_MULTIPROBE_ANY_%d_help" % n))
+
+    def _handle_mcu_identify(self):
+        super()._handle_mcu_identify()
+        if self.main_object:
+            # NOTE: Arm the endstops of several probes on a single trigger
+            #       dispatch (see "MCU_endstop_group" in "mcu.py"). This must
+            #       be setup before the MCUs are configured.
+            probes = [obj for name, obj in self.printer.lookup_objects('probe_G38_multi')]
+            self.probe_group = mcu.MCU_endstop_group(
+                [probe.probe.mcu_probe.mcu_endstop for probe in probes])
+            add_probing_steppers(self.printer, self.probe_group)
+
+    def get_status(self, eventtime=None):
+        status = super().get_status(eventtime)
+        status['last_trigger'] = self.last_trigger
+        return status
 
     def get_active_probe(self):
         """Get the "active" probe from the "active" extruder by name.
@@ -159,6 +188,50 @@ class ProbeG38multi(ProbeG38):
         """Klipper style keyword-argument probing commands"""
         super().cmd_PROBE_G38_2(gcmd, error_out=error_out, trigger_invert=trigger_invert)
 
+    # MULTIPROBE_ANY command variants.
+    cmd_MULTIPROBE_ANY_5_help = "G38.5-style probe away from workpiece with several probes, stop on loss of contact of any. Usage: MULTIPROBE_ANY5 PROBE_NAMES=<name1,name2,...> [X=x] [Y=y] [Z=z] [E=e]"
+    def cmd_MULTIPROBE_ANY_5(self, gcmd):
+        self.cmd_MULTIPROBE_ANY_2(gcmd, error_out=False, trigger_invert=False)
+
+    cmd_MULTIPROBE_ANY_4_help = "G38.4-style probe away from workpiece with several probes, stop on loss of contact of any, signal error if failure. Usage: MULTIPROBE_ANY4 PROBE_NAMES=<name1,name2,...> [X=x] [Y=y] [Z=z] [E=e]"
+    def cmd_MULTIPROBE_ANY_4(self, gcmd):
+        self.cmd_MULTIPROBE_ANY_2(gcmd, error_out=True, trigger_invert=False)
+
+    cmd_MULTIPROBE_ANY_3_help = "G38.3-style probe toward workpiece with several probes, stop on contact of any. Usage: MULTIPROBE_ANY3 PROBE_NAMES=<name1,name2,...> [X=x] [Y=y] [Z=z] [E=e]"
+    def cmd_MULTIPROBE_ANY_3(self, gcmd):
+        self.cmd_MULTIPROBE_ANY_2(gcmd, error_out=False, trigger_invert=True)
+
+    cmd_MULTIPROBE_ANY_2_help = "G38.2-style probe toward workpiece with several probes, stop on contact of any, signal error if failure. Usage: MULTIPROBE_ANY2 PROBE_NAMES=<name1,name2,...> [X=x] [Y=y] [Z=z] [E=e]"
+    def cmd_MULTIPROBE_ANY_2(self, gcmd, error_out=True, trigger_invert=True):
+        """Probe with several probes in a single move, reporting the first one that triggered."""
+        # Lookup the probes by name.
+        names = [name.strip() for name in gcmd.get('PROBE_NAMES').split(',')
+                 if name.strip()]
+        endstops = []
+        for name in names:
+            probe_object = self.printer.lookup_object('probe_G38_multi ' + name, None)
+            if probe_object is None:
+                raise gcmd.error(f"MULTIPROBE_ANY: unknown probe '{name}'")
+            endstops.append(probe_object.probe.mcu_probe.mcu_endstop)
+        if not endstops:
+            raise gcmd.error("MULTIPROBE_ANY: PROBE_NAMES requires at least one probe name")
+
+        # Arm all of them in a single probing move.
+        self.probe_group.set_active(endstops)
+        epos = super().cmd_PROBE_G38_2(gcmd, error_out=error_out,
+                                       trigger_invert=trigger_invert,
+                                       mcu_probe=self.probe_group)
+
+        # Report which probe triggered first.
+        trigger = self.probe_group.get_trigger()
+        if trigger is None:
+            self.last_trigger = {'probe': None, 'position': None}
+            gcmd.respond_info("MULTIPROBE_ANY: no probe triggered")
+            return
+        name = names[endstops.index(trigger[0])]
+        self.last_trigger = {'probe': name, 'position': list(epos)}
+        gcmd.respond_info(f"MULTIPROBE_ANY: probe '{name}' triggered first")
+
 class ProbeCommandHelperMux(ProbeCommandHelper):
     """Subclass of ProbeCommandHelper, 'muxing' all probe commands.
     All commands here are MUX-type, and are pos-fixed with '_MUX',
@@ -0,0 +1,255 @@
+# Multi-point probing cycles (edge, corner, bore, boss and grid)
+#
+# Copyright (C) 2026  Nicolás A. Méndez
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+import logging
+
+# Extra probing distance beyond the expected surface
+DEFAULT_OVERTRAVEL = 2.
+
+# NOTE: A cycle runs all of its probing moves from a single command,
+#       calling "probing_move" directly instead of going through the
+#       G38.n commands. The approach, retract and travel moves between
+#       probes are only queued (the next probing move flushes them), the
+#       probe "recovery_time" dwell is done once per cycle, and the
+#       results are reported once at the end.
+class ProbeCycle:
+    def __init__(self, config):
+        """Probing cycles with a probe_G38 (or probe_G38_multi) probe.
+
+        [probe_cycle]
+        #probe: probe_G38
+        #   Name of the config section of the probe. The default is
+        #   "probe_G38".
+        #speed: 5
+        #   Speed (in mm/s) of the first probing move towards each
+        #   surface. The default is 5 mm/s.
+        #reprobe_speed: 1
+        #   Speed (in mm/s) of a second probing move, after retracting
+        #   from the first trigger. Set to 0 to probe each point once.
+        #   The default is 1 mm/s.
+        #retract_dist: 1
+        #   Distance (in mm) to back off from a surface after a trigger.
+        #   The default is 1 mm.
+        #travel_speed: 20
+        #   Speed (in mm/s) of the moves between probes. The default is
+        #   20 mm/s.
+        #tip_diameter: 0
+        #   Diameter (in mm) of the probe tip, used to compensate the
+        #   measured edges and diameters. The default is 0.
+        """
+        self.printer = config.get_printer()
+        self.probe_name = config.get('probe', 'probe_G38')
+        self.speed = config.getfloat('speed', 5., above=0.)
+        self.reprobe_speed = config.getfloat('reprobe_speed', 1., minval=0.)
+        self.retract_dist = config.getfloat('retract_dist', 1., above=0.)
+        self.travel_speed = config.getfloat('travel_speed', 20., above=0.)
+        self.tip_diameter = config.getfloat('tip_diameter', 0., minval=0.)
+        self.toolhead = self.phoming = self.mcu_probe = None
+        self.recovery_time = 0.
+        self.status = {'cycle': None, 'result': {}, 'probes': []}
+        self.cycles = {'EDGE': self._cycle_edge, 'CORNER': self._cycle_corner,
+                       'BORE': self._cycle_bore, 'BOSS': self._cycle_boss,
+                       'GRID': self._cycle_grid}
+        self.printer.register_event_handler("klippy:connect",
+                                            self._handle_connect)
+        gcode = self.printer.lookup_object('gcode')
+        gcode.register_command('PROBE_CYCLE', self.cmd_PROBE_CYCLE,
+                               desc=self.cmd_PROBE_CYCLE_help)
+        webhooks = self.printer.lookup_object('webhooks')
+        webhooks.register_endpoint("probe_cycle/results",
+                                   self._handle_results_request)
+
+    def _handle_connect(self):
+        self.toolhead = self.printer.lookup_object('toolhead')
+        self.phoming = self.printer.lookup_object('homing')
+        probe = self.printer.lookup_object(self.probe_name, None)
+        if probe is None or not hasattr(probe, 'probe'):
+            raise self.printer.config_error(
+                "probe_cycle: '%s' is not a probe_G38 section"
+                % (self.probe_name,))
+        self.mcu_probe = probe.probe.mcu_probe
+        self.recovery_time = probe.recovery_time
+
+    def get_status(self, eventtime=None):
+        return self.status
+
+    def _handle_results_request(self, web_request):
+        web_request.send(self.status)
+
+    # Probing primitives
+    def _axis_index(self, gcmd, name):
+        axis = gcmd.get(name, 'X').upper()
+        index = self.toolhead.axis_map.get(axis)
+        if index is None or axis == 'E' or axis not in self.toolhead.axis_names:
+            raise gcmd.error("Invalid %s '%s'" % (name, axis))
+        return index
+
+    def _move(self, coord):
+        # Queue a travel move (None values keep the current coordinate)
+        self.toolhead.manual_move(coord, self.travel_speed)
+
+    def _move_axis(self, axis, value):
+        coord = [None] * len(self.toolhead.get_position())
+        coord[axis] = value
+        self._move(coord)
+
+    def _probing_move(self, axis, target, speed):
+        pos = self.toolhead.get_position()
+        pos[axis] = target
+        axis_name = list(self.toolhead.axis_map)[axis].lower()
+        epos = self.phoming.probing_move(self.mcu_probe, pos, speed,
+                                         probe_axes=[axis_name])
+        return epos
+
+    def _probe(self, axis, target, probes, approach=None):
+        """Probe along an axis towards 'target' (after a travel move to
+        'approach'), reprobe slowly and back off from the surface.
+        Returns the trigger coordinate."""
+        if approach is not None:
+            self._move_axis(axis, approach)
+        start = self.toolhead.get_position()[axis]
+        direction = 1. if target > start else -1.
+        epos = self._probing_move(axis, target, self.speed)
+        if self.reprobe_speed:
+            trigger = epos[axis]
+            self._move_axis(axis, trigger - direction * self.retract_dist)
+            epos = self._probing_move(
+                axis, trigger + direction * self.retract_dist,
+                self.reprobe_speed)
+        self._move_axis(axis, epos[axis] - direction * self.retract_dist)
+        probes.append(list(epos[:-1]))
+        return epos[axis]
+
+    # Cycles
+    def _cycle_edge(self, gcmd, pos, probes):
+        # Single surface along an axis, at a signed distance
+        axis = self._axis_index(gcmd, 'AXIS')
+        dist = gcmd.get_float('DIST')
+        if not dist:
+            raise gcmd.error("PROBE_CYCLE EDGE requires a non zero DIST")
+        edge = self._probe(axis, pos[axis] + dist, probes)
+        direction = 1. if dist > 0. else -1.
+        self._move_axis(axis, pos[axis])
+        return {'axis': list(self.toolhead.axis_map)[axis],
+                'position': edge + direction * .5 * self.tip_diameter}
+
+    def _cycle_corner(self, gcmd, pos, probes):
+        # X and Y edges of a corner, at offsets from the start position
+        x_dist = gcmd.get_float('X_DIST')
+        y_dist = gcmd.get_float('Y_DIST')
+        x_offset = gcmd.get_float('X_OFFSET', 0.)
+        y_offset = gcmd.get_float('Y_OFFSET', 0.)
+        if not x_dist or not y_dist:
+            raise gcmd.error("PROBE_CYCLE CORNER requires non zero"
+                             " X_DIST and Y_DIST")
+        tip_r = .5 * self.tip_diameter
+        self._move_axis(1, pos[1] + y_offset)
+        x = self._probe(0, pos[0] + x_dist, probes)
+        self._move_axis(0, pos[0])
+        self._move_axis(1, pos[1])
+        self._move_axis(0, pos[0] + x_offset)
+        y = self._probe(1, pos[1] + y_dist, probes)
+        self._move_axis(1, pos[1])
+        self._move_axis(0, pos[0])
+        return {'x': x + (tip_r if x_dist > 0. else -tip_r),
+                'y': y + (tip_r if y_dist > 0. else -tip_r)}
+
+    def _cycle_bore(self, gcmd, pos, probes):
+        # Walls of a bore, from a position near its center. The second
+        # axis is probed from the center of the first one.
+        radius = .5 * gcmd.get_float('DIAMETER', above=0.)
+        overtravel = gcmd.get_float('OVERTRAVEL', DEFAULT_OVERTRAVEL,
+                                    minval=0.)
+        # Travel moves up to "overtravel" before the expected walls
+        approach = max(0., radius - overtravel)
+        center = list(pos[:2])
+        spans = []
+        for axis in [0, 1]:
+            high = self._probe(axis, center[axis] + radius + overtravel,
+                               probes, center[axis] + approach)
+            low = self._probe(axis, center[axis] - radius - overtravel,
+                              probes, center[axis] - approach)
+            center[axis] = .5 * (high + low)
+            spans.append(high - low + self.tip_diameter)
+            self._move_axis(axis, center[axis])
+        return {'center_x': center[0], 'center_y': center[1],
+                'diameter_x': spans[0], 'diameter_y': spans[1]}
+
+    def _cycle_boss(self, gcmd, pos, probes):
+        # Outside of a boss, from above its center: each side is probed
+        # towards the center after moving around and down by DEPTH
+        diameter = gcmd.get_float('DIAMETER', above=0.)
+        depth = gcmd.get_float('DEPTH', above=0.)
+        dist = .5 * diameter + gcmd.get_float('CLEARANCE', DEFAULT_OVERTRAVEL,
+                                              above=0.)
+        safe_z = pos[2]
+        center = list(pos[:2])
+        spans = []
+        for axis in [0, 1]:
+            sides = []
+            for direction in [1., -1.]:
+                self._move_axis(axis, center[axis] + direction * dist)
+                self._move_axis(2, safe_z - depth)
+                sides.append(self._probe(axis, center[axis], probes))
+                self._move_axis(2, safe_z)
+            center[axis] = .5 * (sides[0] + sides[1])
+            spans.append(sides[0] - sides[1] - self.tip_diameter)
+            self._move_axis(axis, center[axis])
+        return {'center_x': center[0], 'center_y': center[1],
+                'diameter_x': spans[0], 'diameter_y': spans[1]}
+
+    def _cycle_grid(self, gcmd, pos, probes):
+        # Z probes on a grid starting at the current XY position, in a
+        # back and forth order, returning to the start Z between probes
+        x_count = gcmd.get_int('X_COUNT', 1, minval=1)
+        y_count = gcmd.get_int('Y_COUNT', 1, minval=1)
+        x_step = gcmd.get_float('X_STEP', 0.)
+        y_step = gcmd.get_float('Y_STEP', 0.)
+        dist = gcmd.get_float('DIST', below=0.)
+        safe_z = pos[2]
+        points = []
+        for j in range(y_count):
+            for i in range(x_count):
+                if j % 2:
+                    i = x_count - 1 - i
+                x, y = pos[0] + i * x_step, pos[1] + j * y_step
+                coord = [None] * len(pos)
+                coord[0], coord[1] = x, y
+                self._move(coord)
+                points.append([x, y, self._probe(2, safe_z + dist, probes)])
+                self._move_axis(2, safe_z)
+        self._move_axis(0, pos[0])
+        self._move_axis(1, pos[1])
+        return {'points': points}
+
+    cmd_PROBE_CYCLE_help = "Run a multi-point probing cycle"
+    def cmd_PROBE_CYCLE(self, gcmd):
+        """Probing cycle: PROBE_CYCLE TYPE=<EDGE|CORNER|BORE|BOSS|GRID> ..."""
+        cycle_type = gcmd.get('TYPE').upper()
+        cycle = self.cycles.get(cycle_type)
+        if cycle is None:
+            raise gcmd.error("Unknown PROBE_CYCLE TYPE '%s'" % (cycle_type,))
+        pos = self.toolhead.get_position()
+        if self.recovery_time:
+            self.toolhead.dwell(self.recovery_time)
+        probes = []
+        result = cycle(gcmd, pos, probes)
+        self.toolhead.wait_moves()
+        self.status = {'cycle': cycle_type, 'result': result,
+                       'probes': probes}
+        logging.info("probe_cycle: %s result %s (%d probes)",
+                     cycle_type, result, len(probes))
+        gcmd.respond_info("PROBE_CYCLE %s: %s" % (cycle_type, " ".join(
+            ["%s=%s" % (k, _format_value(v)) for k, v in result.items()])))
+
+def _format_value(value):
+    if isinstance(value, float):
+        return "%.4f" % (value,)
+    if isinstance(value, list):
+        return len(value)
+    return value
+
+def load_config(config):
+    return ProbeCycle(config)
@@ -3,7 +3,7 @@
 # Copyright (C) 2017-2023  Kevin O'Connor <kevin@koconnor.net>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import chelper
+import bisect, math, chelper
 
 MAX_SCHEDULE_TIME = 5.0
 
@@ -22,6 +22,8 @@ class MCU_queued_pwm:
                                       ffi_lib.stepcompress_free)
         self._mcu.register_stepqueue(self._stepqueue)
         self._stepcompress_queue_mq_msg = ffi_lib.stepcompress_queue_mq_msg
+        self._stepcompress_queue_mq_msgs = ffi_lib.stepcompress_queue_mq_msgs
+        self._ffi_new = ffi_main.new
         self._mcu.register_config_callback(self._build_config)
         self._pin = pin_params['pin']
         self._invert = pin_params['invert']
@@ -111,6 +113,8 @@ class MCU_queued_pwm:
                                               data, len(data))
         if ret:
             raise error("Internal error in stepcompress")
+        self._note_activity(clock)
+    def _note_activity(self, clock):
         # Notify toolhead so that it will flush this update
         wakeclock = clock
         if self._last_value != self._default_value:
@@ -118,12 +122,43 @@ class MCU_queued_pwm:
             wakeclock += self._duration_ticks
         wake_print_time = self._mcu.clock_to_print_time(wakeclock)
         self._toolhead.note_mcu_movequeue_activity(wake_print_time)
-    def set_pwm(self, print_time, value):
-        clock = self._mcu.print_time_to_clock(print_time)
+    def _pwm_value(self, value):
         if self._invert:
             value = 1. - value
-        v = int(max(0., min(1., value)) * self._pwm_max + 0.5)
-        self._send_update(clock, v)
+        return int(max(0., min(1., value)) * self._pwm_max + 0.5)
+    def set_pwm(self, print_time, value):
+        clock = self._mcu.print_time_to_clock(print_time)
+        self._send_update(clock, self._pwm_value(value))
+    def set_pwm_batch(self, print_times, values):
+        # Queue the updates at a sequence of increasing print times with
+        # a single call into stepcompress (updates that do not change
+        # the output are dropped)
+        clocks = []
+        pwm_values = []
+        last_clock = self._last_clock
+        last_value = self._last_value
+        print_time_to_clock = self._mcu.print_time_to_clock
+        for print_time, value in zip(print_times, values):
+            v = self._pwm_value(value)
+            if v == last_value:
+                continue
+            last_clock = max(last_clock, print_time_to_clock(print_time))
+            last_value = v
+            clocks.append(last_clock)
+            pwm_values.append(v)
+        if not clocks:
+            return
+        self._last_clock = last_clock
+        self._last_value = last_value
+        data = self._ffi_new('uint32_t[]', [self._set_cmd_tag, self._oid,
+                                            0, 0])
+        ret = self._stepcompress_queue_mq_msgs(
+            self._stepqueue, data, 4, 2, 3,
+            self._ffi_new('uint64_t[]', clocks),
+            self._ffi_new('uint32_t[]', pwm_values), len(clocks))
+        if ret:
+            raise error("Internal error in stepcompress")
+        self._note_activity(last_clock)
     def _flush_notification(self, print_time, clock):
         if self._last_value != self._default_value:
             while clock >= self._last_clock + self._duration_ticks:
@@ -154,29 +189,172 @@ class PrinterOutputPin:
         self.shutdown_value = config.getfloat(
             'shutdown_value', 0., minval=0., maxval=self.scale) / self.scale
         self.mcu_pin.setup_start_value(self.last_value, self.shutdown_value)
+        # Value changes are queued at their print time and sent to the
+        # mcu in batches, when the toolhead generates steps up to them
+        self.pending_times = []
+        self.pending_values = []
+        self.pending_dynamic = []
+        self.last_dynamic = False
+        self.toolhead = self.trapq = None
+        # In dynamic power mode (M4) the value is sampled from the
+        # velocity of the toolhead moves, from "sample_time" on
+        self.dynamic_power = None
+        self.sample_time = 0.
+        # End times and cruise velocities of the toolhead moves
+        self.move_ends = []
+        self.move_cruise_v = []
+        ffi_main, ffi_lib = chelper.get_ffi()
+        self.ffi_new = ffi_main.new
+        self.trapq_extract_velocity_ratios = (
+            ffi_lib.trapq_extract_velocity_ratios)
+        self.printer.register_event_handler("klippy:connect",
+                                            self._handle_connect)
         # Register commands
         pin_name = config.get_name().split()[1]
         gcode = self.printer.lookup_object('gcode')
         gcode.register_mux_command("SET_PIN", "PIN", pin_name,
                                    self.cmd_SET_PIN,
                                    desc=self.cmd_SET_PIN_help)
+        # Laser/spindle power commands (M3/M4/M5 and G1 S)
+        self.power = 1.
+        self.power_mode = None
+        self.power_commands = config.getboolean('power_commands', False)
+        if self.power_commands:
+            # M3/M4/M5 and the S parameter drive a single tool
+            for name, obj in self.printer.lookup_objects('pwm_tool'):
+                if obj.power_commands:
+                    raise config.error(
+                        "Only one pwm_tool may set power_commands"
+                        " (already set in [%s])" % (name,))
+            self.dynamic_interval = config.getfloat(
+                'dynamic_power_interval', .002, above=0., maxval=.100)
+            self.printer.register_event_handler("klippy:connect",
+                                                self._handle_power_connect)
+            for cmd in ['M3', 'M4', 'M5']:
+                gcode.register_command(cmd, getattr(self, 'cmd_' + cmd),
+                                       desc=getattr(self, 'cmd_%s_help' % cmd))
+            self.printer.register_event_handler(
+                "gcode_move:parsing_move_command", self._handle_move_command)
+    def _handle_connect(self):
+        self.toolhead = self.printer.lookup_object('toolhead')
+        self.trapq = self.toolhead.get_trapq()
+        self.toolhead.register_step_generator(self._flush_values)
+    def _handle_power_connect(self):
+        self.toolhead.register_move_callback(self._note_move)
+    def _note_move(self, print_time, move):
+        if move.is_kinematic_move:
+            self.move_ends.append(print_time + move.accel_t + move.cruise_t
+                                  + move.decel_t)
+            self.move_cruise_v.append(move.cruise_v)
     def get_status(self, eventtime):
-        return {'value': self.last_value}
-    def _set_pin(self, print_time, value):
-        if value == self.last_value:
+        return {'value': self.last_value, 'power': self.power * self.scale,
+                'power_mode': self.power_mode}
+    def _set_pin(self, print_time, value, dynamic=False):
+        if value == self.last_value and dynamic == self.last_dynamic:
             return
         print_time = max(print_time, self.last_print_time)
-        self.mcu_pin.set_pwm(print_time, value)
+        self.pending_times.append(print_time)
+        self.pending_values.append(value)
+        self.pending_dynamic.append(dynamic)
         self.last_value = value
+        self.last_dynamic = dynamic
         self.last_print_time = print_time
+        self.toolhead.note_mcu_movequeue_activity(print_time,
+                                                  set_step_gen_time=True)
+    def _flush_values(self, flush_time):
+        pending_times = self.pending_times
+        # Forget the toolhead moves that will not be sampled again
+        prune_time = flush_time
+        if pending_times:
+            prune_time = min(prune_time, pending_times[0])
+        if self.dynamic_power is not None:
+            prune_time = min(prune_time, self.sample_time)
+        count = bisect.bisect_right(self.move_ends, prune_time)
+        if count:
+            del self.move_ends[:count]
+            del self.move_cruise_v[:count]
+        count = bisect.bisect_right(pending_times, flush_time)
+        if not count and self.dynamic_power is None:
+            return
+        times = []
+        values = []
+        for i in range(count):
+            print_time = pending_times[i]
+            self._sample_dynamic_power(print_time, times, values)
+            value = self.pending_values[i]
+            if self.pending_dynamic[i]:
+                self.dynamic_power = value
+                self.sample_time = print_time
+            else:
+                self.dynamic_power = None
+                times.append(print_time)
+                values.append(value)
+        self._sample_dynamic_power(flush_time, times, values)
+        del pending_times[:count]
+        del self.pending_values[:count]
+        del self.pending_dynamic[:count]
+        self.mcu_pin.set_pwm_batch(times, values)
+    def _sample_dynamic_power(self, end_time, times, values):
+        power = self.dynamic_power
+        start_time = self.sample_time
+        if power is None or start_time >= end_time:
+            return
+        if not power:
+            times.append(start_time)
+            values.append(0.)
+            self.sample_time = end_time
+            return
+        # Power in proportion to the velocity relative to the cruise
+        # velocity of each move, sampled every "dynamic_power_interval"
+        interval = self.dynamic_interval
+        count = int(math.ceil((end_time - start_time) / interval))
+        ratios = self.ffi_new('double[]', count)
+        move_ends = self.move_ends
+        self.trapq_extract_velocity_ratios(
+            self.trapq, ratios, count, start_time, interval,
+            move_ends, self.move_cruise_v, len(move_ends))
+        times.extend([start_time + i * interval for i in range(count)])
+        values.extend([power * r for r in ratios])
+        self.sample_time = start_time + count * interval
+    def _set_power_mode(self, power_mode):
+        self.power_mode = power_mode
+        value = self.power if power_mode is not None else 0.
+        dynamic = power_mode == 'dynamic'
+        self.toolhead.register_lookahead_callback(
+            lambda print_time: self._set_pin(print_time, value, dynamic))
+    def _handle_move_command(self, gcmd, params):
+        if 'S' not in params:
+            return
+        power = gcmd.get_float('S', minval=0., maxval=self.scale) / self.scale
+        if power == self.power:
+            return
+        self.power = power
+        if self.power_mode is not None:
+            # The move is queued after this event, so the new power
+            # applies from the end of the last queued move
+            self._set_power_mode(self.power_mode)
+    cmd_M3_help = "Turn on the tool at a constant power (S)"
+    def cmd_M3(self, gcmd):
+        if 'S' in gcmd.get_command_parameters():
+            self.power = gcmd.get_float(
+                'S', minval=0., maxval=self.scale) / self.scale
+        self._set_power_mode('constant')
+    cmd_M4_help = "Turn on the tool in dynamic power mode (S)"
+    def cmd_M4(self, gcmd):
+        if 'S' in gcmd.get_command_parameters():
+            self.power = gcmd.get_float(
+                'S', minval=0., maxval=self.scale) / self.scale
+        self._set_power_mode('dynamic')
+    cmd_M5_help = "Turn off the tool"
+    def cmd_M5(self, gcmd):
+        self._set_power_mode(None)
     cmd_SET_PIN_help = "Set the value of an output pin"
     def cmd_SET_PIN(self, gcmd):
         # Read requested value
         value = gcmd.get_float('VALUE', minval=0., maxval=self.scale)
         value /= self.scale
         # Obtain print_time and apply requested settings
-        toolhead = self.printer.lookup_object('toolhead')
-        toolhead.register_lookahead_callback(
+        self.toolhead.register_lookahead_callback(
             lambda print_time: self._set_pin(print_time, value))
 
 def load_config_prefix(config):
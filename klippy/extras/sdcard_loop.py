@@ -11,6 +11,7 @@ class SDCardLoop:
         printer = config.get_printer()
         self.sdcard = printer.load_object(config, "virtual_sdcard")
         self.gcode = printer.lookup_object('gcode')
+        self.cache_size = config.getint('cache_size', 65536, minval=0)
         self.gcode.register_command(
             "SDCARD_LOOP_BEGIN", self.cmd_SDCARD_LOOP_BEGIN,
             desc=self.cmd_SDCARD_LOOP_BEGIN_help)
@@ -38,7 +39,11 @@ class SDCardLoop:
         if not self.sdcard.is_cmd_from_sd():
             # Can only run inside of an SD file
             return False
-        self.loop_stack.append((count, self.sdcard.get_file_position()))
+        position = self.sdcard.get_file_position()
+        self.loop_stack.append((count, position))
+        # Keep the loop body in memory for the next iterations
+        if count != 1:
+            self.sdcard.start_line_cache(position, self.cache_size)
         return True
     def loop_end(self):
         if not self.sdcard.is_cmd_from_sd():
@@ -67,6 +72,7 @@ class SDCardLoop:
             return False
         logging.info("Desisting existing SD loops")
         self.loop_stack = []
+        self.sdcard.clear_line_caches()
         return True
 
 def load_config(config):
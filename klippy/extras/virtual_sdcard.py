@@ -3,9 +3,12 @@
 # Copyright (C) 2018-2024  Kevin O'Connor <kevin@koconnor.net>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
-import os, sys, logging, io
+import os, sys, logging, io, threading, collections, time
+from . import kgc_file
 
 VALID_GCODE_EXTS = ['gcode', 'g', 'gco']
+READ_SIZE = 8192
+RACY_MTIME_TIME = 2.
 
 DEFAULT_ERROR_GCODE = """
 {% if 'heaters' in printer %}
@@ -13,6 +16,250 @@ DEFAULT_ERROR_GCODE = """
 {% endif %}
 """
 
+# Read a file from a background thread (so that slow storage does not
+# stall the reactor), buffering up to 'buffer_size' bytes ahead.
+class ReadAheadFile:
+    error = IOError
+    def __init__(self, reactor, filename, buffer_size):
+        self.reactor = reactor
+        self.buffer_size = buffer_size
+        self.file = io.open(filename, 'r', newline='')
+        self.lock = threading.Lock()
+        self.cond = threading.Condition(self.lock)
+        self.chunks = collections.deque()
+        self.buffered = 0
+        self.generation = 0
+        self.seek_pos = 0
+        self.file_pos = 0
+        self.is_eof = self.read_error = self.closed = False
+        self.waiter = None
+        # Statistics (protected by lock)
+        self.read_count = 0
+        self.read_time = self.max_read_time = 0.
+        self.bg_thread = threading.Thread(target=self._bg_thread)
+        self.bg_thread.daemon = True
+        self.bg_thread.start()
+    def _bg_thread(self):
+        while 1:
+            with self.lock:
+                while not self.closed and self.seek_pos is None and (
+                        self.is_eof or self.buffered >= self.buffer_size):
+                    self.cond.wait()
+                if self.closed:
+                    break
+                seek_pos, self.seek_pos = self.seek_pos, None
+                generation = self.generation
+            is_error = False
+            start_time = self.reactor.monotonic()
+            try:
+                if seek_pos is not None:
+                    self.file.seek(seek_pos)
+                data = self.file.read(READ_SIZE)
+                nbytes = len(data.encode())
+            except:
+                logging.exception("virtual_sdcard read")
+                data = ""
+                is_error = True
+            read_time = self.reactor.monotonic() - start_time
+            with self.lock:
+                self.read_count += 1
+                self.read_time += read_time
+                self.max_read_time = max(self.max_read_time, read_time)
+                if generation != self.generation:
+                    # A seek was requested during the read
+                    continue
+                if data:
+                    self.chunks.append((data, nbytes))
+                    self.buffered += nbytes
+                else:
+                    self.is_eof = True
+                    self.read_error = is_error
+                waiter, self.waiter = self.waiter, None
+            if waiter is not None:
+                self.reactor.async_complete(waiter, None)
+        self.file.close()
+    def seek(self, pos):
+        with self.lock:
+            if pos == self.file_pos:
+                # Already reading from there
+                return
+            self.file_pos = pos
+            self.generation += 1
+            self.chunks.clear()
+            self.buffered = 0
+            self.seek_pos = pos
+            self.is_eof = self.read_error = False
+            self.cond.notify()
+    def read(self):
+        # Return the next chunk of data (or "" at the end of the file),
+        # pausing the calling greenlet until it is available
+        while 1:
+            with self.lock:
+                if self.chunks:
+                    data, nbytes = self.chunks.popleft()
+                    self.buffered -= nbytes
+                    self.file_pos += nbytes
+                    self.cond.notify()
+                    return data
+                if self.read_error:
+                    raise self.error("Error reading file")
+                if self.is_eof:
+                    return ""
+                completion = self.waiter = self.reactor.completion()
+            completion.wait(self.reactor.monotonic() + 0.100)
+    def close(self):
+        with self.lock:
+            self.closed = True
+            self.cond.notify()
+    def get_stats(self):
+        with self.lock:
+            read_count, read_time = self.read_count, self.read_time
+            max_read_time = self.max_read_time
+            self.read_count = 0
+            self.read_time = self.max_read_time = 0.
+            buffered = self.buffered
+        avg_read_time = read_time / read_count if read_count else 0.
+        return ("sd_buffered=%d sd_reads=%d sd_read_avg=%.6f"
+                " sd_read_max=%.6f" % (buffered, read_count, avg_read_time,
+                                       max_read_time))
+
+# Cached index of the file names in the sdcard directory. The contents
+# of each directory are only rescanned when its modification time
+# changes (file sizes are not cached, as rewriting a file does not
+# update the modification time of its directory).
+class DirectoryIndex:
+    def __init__(self, dirname):
+        self.dirname = dirname
+        # dirs[relative_path] = (mtime_ns, [file names], [subdirs])
+        self.dirs = {}
+        self.generation = 0
+        # listings[check_subdirs] = (generation, names, by_name, by_lower)
+        self.listings = {}
+    def _scan_dir(self, rel_path):
+        path = os.path.join(self.dirname, rel_path)
+        mtime = os.stat(path).st_mtime_ns
+        entry = self.dirs.get(rel_path)
+        if entry is not None and entry[0] == mtime:
+            return entry
+        files = []
+        subdirs = []
+        with os.scandir(path) as dentries:
+            for dentry in dentries:
+                try:
+                    if dentry.is_dir():
+                        subdirs.append(dentry.name)
+                    elif dentry.is_file():
+                        files.append(dentry.name)
+                except OSError:
+                    continue
+        if time.time() - mtime * .000000001 < RACY_MTIME_TIME:
+            # The directory may change again without a new mtime (the
+            # filesystem timestamps are coarse) - rescan it next time
+            mtime = None
+        entry = self.dirs[rel_path] = (mtime, files, subdirs)
+        self.generation += 1
+        return entry
+    def _walk(self):
+        # Rescan the changed directories (following links, like os.walk)
+        rel_paths = []
+        pending = ['']
+        while pending:
+            rel_path = pending.pop()
+            try:
+                entry = self._scan_dir(rel_path)
+            except OSError:
+                continue
+            rel_paths.append(rel_path)
+            pending.extend([os.path.join(rel_path, d) for d in entry[2]])
+        if len(rel_paths) != len(self.dirs):
+            # Forget removed directories
+            self.dirs = {rel_path: self.dirs[rel_path]
+                         for rel_path in rel_paths}
+            self.generation += 1
+    def _build_listing(self, check_subdirs):
+        if not check_subdirs:
+            mtime, files, subdirs = self.dirs['']
+            names = [name for name in files if not name.startswith('.')]
+        else:
+            names = []
+            for rel_path, (mtime, files, subdirs) in self.dirs.items():
+                for name in files:
+                    ext = name[name.rfind('.')+1:]
+                    if ext not in VALID_GCODE_EXTS:
+                        continue
+                    names.append(os.path.join(rel_path, name))
+        names.sort(key=str.lower)
+        by_name = {fname: fname for fname in names}
+        by_lower = {fname.lower(): fname for fname in names}
+        return (self.generation, names, by_name, by_lower)
+    def _refresh(self, check_subdirs):
+        if check_subdirs:
+            self._walk()
+        else:
+            self._scan_dir('')
+        listing = self.listings.get(check_subdirs)
+        if listing is None or listing[0] != self.generation:
+            listing = self._build_listing(check_subdirs)
+            self.listings[check_subdirs] = listing
+        return listing
+    def get_file_list(self, check_subdirs=False):
+        flist = []
+        for fname in self._refresh(check_subdirs)[1]:
+            try:
+                size = os.path.getsize(os.path.join(self.dirname, fname))
+            except OSError:
+                # Removed since the last scan of its directory
+                continue
+            flist.append((fname, size))
+        return flist
+    def lookup(self, filename, check_subdirs=False):
+        """Return the listed name matching 'filename' (an exact match is
+        preferred over a case insensitive one), or None"""
+        generation, names, by_name, by_lower = self._refresh(check_subdirs)
+        fname = by_name.get(filename)
+        if fname is None:
+            fname = by_lower.get(filename.lower())
+        return fname
+
+# Commands of a section of the file (eg, a loop body), recorded as they
+# are run so that they may be replayed from memory
+class LineCache:
+    def __init__(self, start_pos, max_size):
+        self.start_pos = self.next_pos = start_pos
+        self.max_size = max_size
+        self.size = 0
+        # records: [(nbytes, line, cmd, params), ...]
+        self.records = []
+        self.positions = {}
+    def record(self, pos, nbytes, line, cmd, params):
+        if pos != self.next_pos:
+            # Replay of a nested loop
+            return True
+        self.size += nbytes + 1
+        if self.size > self.max_size:
+            return False
+        self.records.append((nbytes, line, cmd, params))
+        self.next_pos = pos + nbytes + 1
+        return True
+    def complete(self, tokenizer):
+        # Parse the recorded lines and index the start of each command
+        pos = self.start_pos
+        for i, (nbytes, line, cmd, params) in enumerate(self.records):
+            self.positions[pos] = i
+            pos += nbytes + 1
+            if line is None or cmd is not None:
+                continue
+            sline = line.strip()
+            cpos = sline.find(';')
+            if cpos >= 0:
+                sline = sline[:cpos]
+            if not sline.strip():
+                self.records[i] = (nbytes, None, None, None)
+                continue
+            cmd, params = tokenizer.tokenize(sline)
+            if cmd in tokenizer.fast_param_commands:
+                self.records[i] = (nbytes, line, cmd, params)
+
 class VirtualSD:
     def __init__(self, config):
         self.printer = config.get_printer()
@@ -21,8 +268,12 @@ class VirtualSD:
         # sdcard state
         sd = config.get('path')
         self.sdcard_dirname = os.path.normpath(os.path.expanduser(sd))
+        self.file_index = DirectoryIndex(self.sdcard_dirname)
         self.current_file = None
         self.file_position = self.file_size = 0
+        self.read_ahead = None
+        self.read_ahead_buffer = config.getint(
+            'read_ahead_buffer', 131072, minval=READ_SIZE)
         # Print Stat Tracking
         self.print_stats = self.printer.load_object(config, 'print_stats')
         # Work timer
@@ -30,6 +281,14 @@ class VirtualSD:
         self.must_pause_work = self.cmd_from_sd = False
         self.next_file_position = 0
         self.work_timer = None
+        self.dispatch_time_slice = config.getfloat(
+            'dispatch_time_slice', 0.050, minval=0.)
+        # Loop body caches
+        self.line_caches = {}
+        self.line_recorders = []
+        # Pre-parsed job files (see kgc_file.py)
+        self.precompiled_jobs = config.getboolean('precompiled_jobs', False)
+        self.kgc_reader = None
         # Error handling
         gcode_macro = self.printer.load_object(config, 'gcode_macro')
         self.on_error_gcode = gcode_macro.load_template(
@@ -51,6 +310,9 @@ class VirtualSD:
         self.gcode.register_command(
             "SDCARD_PRINT_FILE", self.cmd_SDCARD_PRINT_FILE,
             desc=self.cmd_SDCARD_PRINT_FILE_help)
+        self.gcode.register_command(
+            "SDCARD_PRECOMPILE_FILE", self.cmd_SDCARD_PRECOMPILE_FILE,
+            desc=self.cmd_SDCARD_PRECOMPILE_FILE_help)
     
     cmd_M28_help = "Start writing to SD card."
     cmd_M29_help = "Stop writing to SD card."
@@ -73,32 +335,16 @@ class VirtualSD:
     def stats(self, eventtime):
         if self.work_timer is None:
             return False, ""
-        return True, "sd_pos=%d" % (self.file_position,)
+        msg = "sd_pos=%d" % (self.file_position,)
+        if self.read_ahead is not None:
+            msg += " " + self.read_ahead.get_stats()
+        return True, msg
     def get_file_list(self, check_subdirs=False):
-        if check_subdirs:
-            flist = []
-            for root, dirs, files in os.walk(
-                    self.sdcard_dirname, followlinks=True):
-                for name in files:
-                    ext = name[name.rfind('.')+1:]
-                    if ext not in VALID_GCODE_EXTS:
-                        continue
-                    full_path = os.path.join(root, name)
-                    r_path = full_path[len(self.sdcard_dirname) + 1:]
-                    size = os.path.getsize(full_path)
-                    flist.append((r_path, size))
-            return sorted(flist, key=lambda f: f[0].lower())
-        else:
-            dname = self.sdcard_dirname
-            try:
-                filenames = os.listdir(self.sdcard_dirname)
-                return [(fname, os.path.getsize(os.path.join(dname, fname)))
-                        for fname in sorted(filenames, key=str.lower)
-                        if not fname.startswith('.')
-                        and os.path.isfile((os.path.join(dname, fname)))]
-            except:
-                logging.exception("virtual_sdcard get_file_list")
-                raise self.gcode.error("Unable to get file list")
+        try:
+            return self.file_index.get_file_list(check_subdirs)
+        except:
+            logging.exception("virtual_sdcard get_file_list")
+            raise self.gcode.error("Unable to get file list")
     def get_status(self, eventtime):
         return {
             'file_path': self.file_path(),
@@ -132,8 +378,7 @@ class VirtualSD:
     def do_cancel(self):
         if self.current_file is not None:
             self.do_pause()
-            self.current_file.close()
-            self.current_file = None
+            self._close_file()
             self.print_stats.note_cancel()
         self.file_position = self.file_size = 0
     # G-Code commands
@@ -142,8 +387,7 @@ class VirtualSD:
     def _reset_file(self):
         if self.current_file is not None:
             self.do_pause()
-            self.current_file.close()
-            self.current_file = None
+            self._close_file()
         self.file_position = self.file_size = 0
         self.print_stats.reset()
         self.printer.send_event("virtual_sdcard:reset_file")
@@ -165,6 +409,47 @@ class VirtualSD:
             filename = filename[1:]
         self._load_file(gcmd, filename, check_subdirs=True)
         self.do_resume()
+    cmd_SDCARD_PRECOMPILE_FILE_help = "Generate the pre-parsed (.kgc) " \
+        "version of a SD file"
+    def cmd_SDCARD_PRECOMPILE_FILE(self, gcmd):
+        filename = gcmd.get("FILENAME")
+        if filename[0] == '/':
+            filename = filename[1:]
+        fname = self._find_file(gcmd, filename, check_subdirs=True)
+        self._compile_kgc(gcmd, fname)
+    # Pre-parsed job files
+    def _compile_kgc(self, gcmd, fname):
+        start_time = self.reactor.monotonic()
+        try:
+            count = kgc_file.compile_file(
+                fname, self.gcode.tokenizer,
+                lambda: self.reactor.pause(self.reactor.NOW))
+        except:
+            logging.exception("virtual_sdcard kgc compile")
+            raise gcmd.error("Unable to pre-parse file")
+        gcmd.respond_info("Pre-parsed %d lines of %s in %.3fs" % (
+            count, os.path.basename(fname),
+            self.reactor.monotonic() - start_time))
+    def _open_kgc(self, gcmd, fname):
+        if not kgc_file.is_current(fname):
+            self._compile_kgc(gcmd, fname)
+        try:
+            self.kgc_reader = kgc_file.KGCReader(fname)
+        except:
+            logging.exception("virtual_sdcard kgc open")
+            self.kgc_reader = None
+    def _close_file(self):
+        self.clear_line_caches()
+        self.current_file.close()
+        self.current_file = None
+        if self.read_ahead is not None:
+            self.read_ahead.close()
+            self.read_ahead = None
+        self._close_kgc()
+    def _close_kgc(self):
+        if self.kgc_reader is not None:
+            self.kgc_reader.close()
+            self.kgc_reader = None
     cmd_M20_help = "List SD card contents"
     def cmd_M20(self, gcmd):
         # List SD card
@@ -187,28 +472,37 @@ class VirtualSD:
         if filename.startswith('/'):
             filename = filename[1:]
         self._load_file(gcmd, filename)
+    def _find_file(self, gcmd, filename, check_subdirs=False):
+        try:
+            fname = self.file_index.lookup(filename, check_subdirs)
+        except:
+            logging.exception("virtual_sdcard file lookup")
+            fname = None
+        if fname is None:
+            logging.info("virtual_sdcard file not found: %s", filename)
+            raise gcmd.error("Unable to open file")
+        return os.path.join(self.sdcard_dirname, fname)
     def _load_file(self, gcmd, filename, check_subdirs=False):
-        files = self.get_file_list(check_subdirs)
-        flist = [f[0] for f in files]
-        files_by_lower = { fname.lower(): fname for fname, fsize in files }
-        fname = filename
+        fname = self._find_file(gcmd, filename, check_subdirs)
         try:
-            if fname not in flist:
-                fname = files_by_lower[fname.lower()]
-            fname = os.path.join(self.sdcard_dirname, fname)
             f = io.open(fname, 'r', newline='')
             f.seek(0, os.SEEK_END)
             fsize = f.tell()
             f.seek(0)
+            read_ahead = ReadAheadFile(self.reactor, fname,
+                                       self.read_ahead_buffer)
         except:
             logging.exception("virtual_sdcard file open")
             raise gcmd.error("Unable to open file")
         gcmd.respond_raw("File opened:%s Size:%d" % (filename, fsize))
         gcmd.respond_raw("File selected")
         self.current_file = f
+        self.read_ahead = read_ahead
         self.file_position = 0
         self.file_size = fsize
         self.print_stats.set_current_file(filename)
+        if self.precompiled_jobs:
+            self._open_kgc(gcmd, fname)
     cmd_M24_help = "Start/resume SD print"
     def cmd_M24(self, gcmd):
         # Start/resume SD print
@@ -238,35 +532,105 @@ class VirtualSD:
         self.next_file_position = pos
     def is_cmd_from_sd(self):
         return self.cmd_from_sd
+    # Loop body caches (see sdcard_loop.py)
+    def start_line_cache(self, position, max_size):
+        """Record the commands run from 'position' onwards, so that a
+        later jump back to 'position' replays them from memory"""
+        if position in self.line_caches or max_size <= 0:
+            return
+        cache = self.line_caches[position] = LineCache(position, max_size)
+        self.line_recorders.append(cache)
+    def clear_line_caches(self):
+        self.line_caches.clear()
+        del self.line_recorders[:]
+    def _record_line(self, pos, nbytes, line, cmd, params):
+        for cache in list(self.line_recorders):
+            if not cache.record(pos, nbytes, line, cmd, params):
+                logging.info("virtual_sdcard: loop at position %d too large"
+                             " to cache", cache.start_pos)
+                self.line_recorders.remove(cache)
+    def _find_line_cache(self, pos):
+        for cache in self.line_caches.values():
+            index = cache.positions.get(pos)
+            if index is not None:
+                return cache, index
+        return None, None
+    def _note_skip(self, next_file_position):
+        # A command changed the file position - complete the recording
+        # of a loop body that jumps back to its start
+        cache = self.line_caches.get(self.file_position)
+        if (cache is not None and cache in self.line_recorders
+            and cache.next_pos == next_file_position):
+            cache.complete(self.gcode.tokenizer)
+            self.line_recorders.remove(cache)
+        return self._find_line_cache(self.file_position)[0] is not None
     # Background work timer
     def work_handler(self, eventtime):
         logging.info("Starting SD card print (position %d)", self.file_position)
         self.reactor.unregister_timer(self.work_timer)
-        try:
-            self.current_file.seek(self.file_position)
-        except:
-            logging.exception("virtual_sdcard seek")
-            self.work_timer = None
-            return self.reactor.NEVER
         self.print_stats.note_start()
         gcode_mutex = self.gcode.get_mutex()
+        done, error_message = False, None
+        while not done and not self.must_pause_work:
+            # Select the source of the commands at the file position
+            cache, index = self._find_line_cache(self.file_position)
+            if cache is not None:
+                done, error_message = self._work_cache(gcode_mutex,
+                                                       cache, index)
+            elif (self.kgc_reader is not None
+                  and self.kgc_reader.seek(self.file_position)):
+                done, error_message = self._work_kgc(gcode_mutex)
+            else:
+                done, error_message = self._work_text(gcode_mutex)
+        logging.info("Exiting SD card print (position %d)", self.file_position)
+        self.work_timer = None
+        self.cmd_from_sd = False
+        if error_message is not None:
+            self.print_stats.note_error(error_message)
+        elif self.current_file is not None:
+            self.print_stats.note_pause()
+        else:
+            self.print_stats.note_complete()
+        return self.reactor.NEVER
+    def _finish_print(self):
+        self._close_file()
+        logging.info("Finished SD card print")
+        self.gcode.respond_raw("Done printing file")
+    def _run_on_error(self):
+        try:
+            self.gcode.run_script(self.on_error_gcode.render())
+        except:
+            logging.exception("virtual_sdcard on_error")
+    def _dispatch_batch(self, gcode_mutex, dispatch_func, *args):
+        # Run a batch of commands while holding the gcode mutex. Returns
+        # (result, done, error_message).
+        try:
+            with gcode_mutex:
+                return dispatch_func(*args), False, None
+        except self.gcode.error as e:
+            self._run_on_error()
+            return None, True, str(e)
+        except:
+            logging.exception("virtual_sdcard dispatch")
+            return None, True, None
+    # The _work_xxx() methods below return (done, error_message), where
+    # "done" is False if the commands at the current file position must
+    # be read from another source.
+    def _work_text(self, gcode_mutex):
+        self.read_ahead.seek(self.file_position)
         partial_input = ""
         lines = []
-        error_message = None
         while not self.must_pause_work:
             if not lines:
                 # Read more data
                 try:
-                    data = self.current_file.read(8192)
+                    data = self.read_ahead.read()
                 except:
                     logging.exception("virtual_sdcard read")
                     break
                 if not data:
                     # End of file
-                    self.current_file.close()
-                    self.current_file = None
-                    logging.info("Finished SD card print")
-                    self.gcode.respond_raw("Done printing file")
+                    self._finish_print()
                     break
                 lines = data.split('\n')
                 lines[0] = partial_input + lines[0]
@@ -278,7 +642,27 @@ class VirtualSD:
             if gcode_mutex.test():
                 self.reactor.pause(self.reactor.monotonic() + 0.100)
                 continue
-            # Dispatch command
+            # Dispatch a run of commands
+            next_file_position, done, error_message = self._dispatch_batch(
+                gcode_mutex, self._dispatch_lines, lines)
+            if done:
+                return True, error_message
+            # Do we need to skip around?
+            if next_file_position is not None:
+                if self._note_skip(next_file_position):
+                    return False, None
+                self.read_ahead.seek(self.file_position)
+                lines = []
+                partial_input = ""
+        return True, None
+    def _dispatch_lines(self, lines):
+        # Run the commands in 'lines' (stored in reverse order) until the
+        # dispatch time slice expires. The caller must hold the gcode
+        # mutex. If a command changes the file position, returns the
+        # position that would have been next.
+        run_script = self.gcode.run_script_from_command
+        end_time = self.reactor.monotonic() + self.dispatch_time_slice
+        while lines and not self.must_pause_work:
             self.cmd_from_sd = True
             line = lines.pop()
             if sys.version_info.major >= 3:
@@ -286,40 +670,140 @@ class VirtualSD:
             else:
                 next_file_position = self.file_position + len(line) + 1
             self.next_file_position = next_file_position
-            try:
-                self.gcode.run_script(line)
-            except self.gcode.error as e:
-                error_message = str(e)
-                try:
-                    self.gcode.run_script(self.on_error_gcode.render())
-                except:
-                    logging.exception("virtual_sdcard on_error")
+            if self.line_recorders:
+                self._record_line(self.file_position,
+                                  next_file_position - self.file_position - 1,
+                                  line, None, None)
+            run_script(line)
+            self.cmd_from_sd = False
+            self.file_position = self.next_file_position
+            if self.next_file_position != next_file_position:
+                return next_file_position
+            if self.reactor.monotonic() >= end_time:
                 break
-            except:
-                logging.exception("virtual_sdcard dispatch")
+        return None
+    def _work_kgc(self, gcode_mutex):
+        # Dispatch the commands of a pre-parsed file
+        reader = self.kgc_reader
+        while not self.must_pause_work:
+            # Pause if any other request is pending in the gcode class
+            if gcode_mutex.test():
+                self.reactor.pause(self.reactor.monotonic() + 0.100)
+                continue
+            # Dispatch a run of commands
+            status, done, error_message = self._dispatch_batch(
+                gcode_mutex, self._dispatch_records, reader)
+            if done:
+                return True, error_message
+            if status == KGC_EOF:
+                self._finish_print()
+                return True, None
+            if status is not None:
+                # Skip to a new position (status is the position that
+                # would have been next)
+                if self._note_skip(status):
+                    return False, None
+                if not reader.seek(self.file_position):
+                    return False, None
+            self.reactor.pause(self.reactor.NOW)
+        return True, None
+    def _dispatch_records(self, reader):
+        # Run up to KGC_YIELD_RECORDS records of a pre-parsed file, until
+        # the dispatch time slice expires. The caller must hold the gcode
+        # mutex.
+        run_tokenized = self.gcode.run_tokenized_from_command
+        run_script = self.gcode.run_script_from_command
+        is_fast_params_command = self.gcode.is_fast_params_command
+        end_time = self.reactor.monotonic() + self.dispatch_time_slice
+        for i in range(KGC_YIELD_RECORDS):
+            if self.must_pause_work:
                 break
+            rec = reader.read_record()
+            if rec is None:
+                return KGC_EOF
+            line_len, kind, line, cmd, params = rec
+            next_file_position = self.file_position + line_len + 1
+            if self.line_recorders:
+                self._record_line(self.file_position, line_len,
+                                  line, cmd, params)
+            if kind == kgc_file.KIND_EMPTY:
+                # Blank or comment only line
+                self.file_position = next_file_position
+                continue
+            self.cmd_from_sd = True
+            self.next_file_position = next_file_position
+            if kind == kgc_file.KIND_TOKENS and is_fast_params_command(cmd):
+                run_tokenized(cmd, params, line.strip())
+            else:
+                run_script(line)
             self.cmd_from_sd = False
             self.file_position = self.next_file_position
-            # Do we need to skip around?
             if self.next_file_position != next_file_position:
-                try:
-                    self.current_file.seek(self.file_position)
-                except:
-                    logging.exception("virtual_sdcard seek")
-                    self.work_timer = None
-                    return self.reactor.NEVER
-                lines = []
-                partial_input = ""
-        logging.info("Exiting SD card print (position %d)", self.file_position)
-        self.work_timer = None
-        self.cmd_from_sd = False
-        if error_message is not None:
-            self.print_stats.note_error(error_message)
-        elif self.current_file is not None:
-            self.print_stats.note_pause()
-        else:
-            self.print_stats.note_complete()
-        return self.reactor.NEVER
+                return next_file_position
+            if self.reactor.monotonic() >= end_time:
+                break
+        return None
+    def _work_cache(self, gcode_mutex, cache, index):
+        # Replay the commands of cached loop bodies
+        while not self.must_pause_work:
+            # Pause if any other request is pending in the gcode class
+            if gcode_mutex.test():
+                self.reactor.pause(self.reactor.monotonic() + 0.100)
+                continue
+            # Dispatch a run of commands
+            result, done, error_message = self._dispatch_batch(
+                gcode_mutex, self._dispatch_cached, cache, index)
+            if done:
+                return True, error_message
+            index, next_file_position = result
+            if next_file_position is not None:
+                self._note_skip(next_file_position)
+            if index is None:
+                # Continue from the cache holding the new position
+                cache, index = self._find_line_cache(self.file_position)
+                if cache is None:
+                    return False, None
+            self.reactor.pause(self.reactor.NOW)
+        return True, None
+    def _dispatch_cached(self, cache, index):
+        # Run the records of a loop body cache from 'index', until the
+        # dispatch time slice expires. The caller must hold the gcode
+        # mutex. Returns (index, next_file_position), where "index" is
+        # None at the end of the cache or on a file position change.
+        run_tokenized = self.gcode.run_tokenized_from_command
+        run_script = self.gcode.run_script_from_command
+        is_fast_params_command = self.gcode.is_fast_params_command
+        records = cache.records
+        end_time = self.reactor.monotonic() + self.dispatch_time_slice
+        while index < len(records) and not self.must_pause_work:
+            nbytes, line, cmd, params = records[index]
+            index += 1
+            next_file_position = self.file_position + nbytes + 1
+            if self.line_recorders:
+                self._record_line(self.file_position, nbytes,
+                                  line, cmd, params)
+            if line is None:
+                # Blank or comment only line
+                self.file_position = next_file_position
+                continue
+            self.cmd_from_sd = True
+            self.next_file_position = next_file_position
+            if cmd is not None and is_fast_params_command(cmd):
+                run_tokenized(cmd, params, line.strip())
+            else:
+                run_script(line)
+            self.cmd_from_sd = False
+            self.file_position = self.next_file_position
+            if self.next_file_position != next_file_position:
+                return None, next_file_position
+            if self.reactor.monotonic() >= end_time:
+                return index, None
+        if index >= len(records):
+            return None, None
+        return index, None
+
+KGC_YIELD_RECORDS = 256
+KGC_EOF = -1
 
 def load_config(config):
     return VirtualSD(config)
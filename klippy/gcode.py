@@ -97,6 +97,45 @@ class GCodeCommand:
         return self.get(name, default, parser=float, minval=minval,
                         maxval=maxval, above=above, below=below)
 
+# Split G-Code lines into a command and its parameters
+class GCodeTokenizer:
+    args_r = re.compile('([A-Z_]+|[A-Z*/])')
+    def __init__(self):
+        # NOTE: Lines of commands registered with "fast_params" (eg: G0-G3)
+        #       made of space separated letter/number words (eg: "G1 X10
+        #       Y-2.5 F300") skip the generic regex parser. The parameter
+        #       values are kept as strings, the same as in the generic
+        #       path (the handlers convert them).
+        self.fast_param_commands = set()
+    def tokenize(self, line):
+        """Return the command and the parameters dictionary of a line,
+        with comments and leading/trailing spaces already removed."""
+        uline = line.upper()
+        words = uline.split()
+        if words and words[0] in self.fast_param_commands:
+            params = {}
+            for word in words:
+                letter, value = word[0], word[1:]
+                if (letter < 'A' or letter > 'Z' or not value.lstrip(
+                        '+-').replace('.', '', 1).isdigit()):
+                    break
+                params[letter] = value
+            else:
+                return words[0], params
+        # Break line into parts and determine command
+        parts = self.args_r.split(uline)
+        numparts = len(parts)
+        cmd = ""
+        if numparts >= 3 and parts[1] != 'N':
+            cmd = parts[1] + parts[2].strip()
+        elif numparts >= 5 and parts[1] == 'N':
+            # Skip line number at start of command
+            cmd = parts[3] + parts[4].strip()
+        # Build gcode "params" dictionary
+        params = { parts[i]: parts[i+1].strip()
+                   for i in range(1, numparts, 2) }
+        return cmd, params
+
 # Parse and dispatch G-Code commands
 class GCodeDispatch:
     error = CommandError
@@ -117,6 +156,7 @@ class GCodeDispatch:
         self.mux_commands = {}
         self.gcode_help = {}
         self.status_commands = {}
+        self.tokenizer = GCodeTokenizer()
         # Register commands needed before config file is loaded
         handlers = ['M110', 'M112', 'M115',
                     'RESTART', 'FIRMWARE_RESTART', 'ECHO', 'STATUS', 'HELP']
@@ -134,8 +174,13 @@ class GCodeDispatch:
         except:
             return False
     
-    def register_command(self, cmd, func, when_not_ready=False, desc=None):
+    def register_command(self, cmd, func, when_not_ready=False, desc=None,
+                         fast_params=False):
         # logging.info("\n" + f"gcode: registering command: {cmd}")
+        # NOTE: Lines of "fast_params" commands may skip the generic
+        #       parser in the GCodeTokenizer fast path (and be pre-parsed,
+        #       see kgc_file). Their parameter values are still strings.
+        self.tokenizer.fast_param_commands.discard(cmd)
         if func is None:
             old_cmd = self.ready_gcode_handlers.get(cmd)
             if cmd in self.ready_gcode_handlers:
@@ -153,6 +198,8 @@ class GCodeDispatch:
             origfunc = func
             func = lambda params: origfunc(self._get_extended_params(params))
         self.ready_gcode_handlers[cmd] = func
+        if fast_params:
+            self.tokenizer.fast_param_commands.add(cmd)
         if when_not_ready:
             # logging.info("\n" + f"gcode: command '{cmd}' registered as base command 'when not ready'.")
             self.base_gcode_handlers[cmd] = func
@@ -204,53 +251,50 @@ class GCodeDispatch:
         self._build_status_commands()
         self._respond_state("Ready")
     # Parse input into commands
-    args_r = re.compile('([A-Z_]+|[A-Z*/])')
     def _process_commands(self, commands, need_ack=True):
         # NOTE: "run_script" calls this method with "need_ack=False".
+        tokenize = self.tokenizer.tokenize
         for line in commands:
             # Ignore comments and leading/trailing spaces
             line = origline = line.strip()
             cpos = line.find(';')
             if cpos >= 0:
                 line = line[:cpos]
-            # Break line into parts and determine command
-            parts = self.args_r.split(line.upper())
-            numparts = len(parts)
-            cmd = ""
-            if numparts >= 3 and parts[1] != 'N':
-                cmd = parts[1] + parts[2].strip()
-            elif numparts >= 5 and parts[1] == 'N':
-                # Skip line number at start of command
-                cmd = parts[3] + parts[4].strip()
-            # Build gcode "params" dictionary
-            params = { parts[i]: parts[i+1].strip()
-                       for i in range(1, numparts, 2) }
-            gcmd = GCodeCommand(gcode=self, command=cmd, commandline=origline, params=params, need_ack=need_ack)
-            # Invoke handler for command
-            handler = self.gcode_handlers.get(cmd, self.cmd_default)
-            try:
-                # The default is to call "cmd_default" as a "handler".
-                handler(gcmd)
-            except self.error as e:
-                # NOTE: "self.error" is an instance of "CommandError",
-                #       a simple subclass of "Exception".
-                self._respond_error(str(e))
-                self.printer.send_event("gcode:command_error")
-                if not need_ack:
-                    raise
-            except Exception as e:
-                msg = 'Internal error on command:"%s"' % (cmd,)
-                logging.exception(msg + str(e))
-                self.printer.invoke_shutdown(msg)
-                self._respond_error(msg)
-                if not need_ack:
-                    raise
-            gcmd.ack()
+            cmd, params = tokenize(line)
+            self._dispatch_command(cmd, params, origline, need_ack)
+    def _dispatch_command(self, cmd, params, origline, need_ack):
+        gcmd = GCodeCommand(gcode=self, command=cmd, commandline=origline, params=params, need_ack=need_ack)
+        # Invoke handler for command
+        handler = self.gcode_handlers.get(cmd, self.cmd_default)
+        try:
+            # The default is to call "cmd_default" as a "handler".
+            handler(gcmd)
+        except self.error as e:
+            # NOTE: "self.error" is an instance of "CommandError",
+            #       a simple subclass of "Exception".
+            self._respond_error(str(e))
+            self.printer.send_event("gcode:command_error")
+            if not need_ack:
+                raise
+        except Exception as e:
+            msg = 'Internal error on command:"%s"' % (cmd,)
+            logging.exception(msg + str(e))
+            self.printer.invoke_shutdown(msg)
+            self._respond_error(msg)
+            if not need_ack:
+                raise
+        gcmd.ack()
     def run_script_from_command(self, script):
         self._process_commands(script.split('\n'), need_ack=False)
     def run_script(self, script):
         with self.mutex:
             self._process_commands(script.split('\n'), need_ack=False)
+    def run_tokenized_from_command(self, cmd, params, commandline):
+        """Run a command already split by GCodeTokenizer (eg: from a
+        pre-parsed file). Only valid for "fast_params" commands."""
+        self._dispatch_command(cmd, params, commandline, need_ack=False)
+    def is_fast_params_command(self, cmd):
+        return cmd in self.tokenizer.fast_param_commands
     def get_mutex(self):
         return self.mutex
     def create_gcode_command(self, command, commandline, params):
@@ -292,8 +336,13 @@ class GCodeDispatch:
                              % (gcmd.get_commandline(),))
         eargs = m.group('args')
         try:
-            # NOTE: get "KEY=VALUE" parameters.
-            eparams = [earg.split('=', 1) for earg in shlex.split(eargs)]
+            # NOTE: get "KEY=VALUE" parameters. Quotes and escapes
+            #       are rare, skip shlex when there are none.
+            if '"' in eargs or "'" in eargs or '\\' in eargs:
+                eargs = shlex.split(eargs)
+            else:
+                eargs = eargs.split()
+            eparams = [earg.split('=', 1) for earg in eargs]
             # NOTE: Prepare a dictionary from the extracted parameters.
             eparams = { k.upper(): v for k, v in eparams }
             gcmd._params.clear()
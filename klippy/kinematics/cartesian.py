@@ -4,9 +4,11 @@
 #
 # This file may be distributed under the terms of the GNU GPLv3 license.
 import logging
-import stepper
+import stepper, tracing
 from . import idex_modes
 
+trace_kin = tracing.get_category("kin.cartesian")
+
 class CartKinematics:
     def __init__(self, toolhead, config, trapq=None):
         
@@ -150,7 +152,9 @@ class CartKinematics:
         self.limits = [(1.0, -1.0)] * 3
     
     def _check_endstops(self, move):
-        logging.info(f"cartesian._check_endstops: triggered on {self.axis_names}/{self.axis} move.")
+        if trace_kin.enabled:
+            trace_kin.log("cartesian._check_endstops: triggered on %s/%s"
+                          " move.", self.axis_names, self.axis)
         end_pos = move.end_pos
         for i, axis in enumerate(self.axis):
             if (move.axes_d[axis]
@@ -166,7 +170,9 @@ class CartKinematics:
     def check_move(self, move):
         limits = self.limits
         xpos, ypos = [move.end_pos[axis] for axis in self.axis[:2]]  # move.end_pos[:2]
-        logging.info(f"cartesian.check_move: checking move ending on xpos={xpos} and ypos={ypos}.")
+        if trace_kin.enabled:
+            trace_kin.log("cartesian.check_move: checking move ending on"
+                          " xpos=%s and ypos=%s.", xpos, ypos)
         if (xpos < limits[0][0] or xpos > limits[0][1]
             or ypos < limits[1][0] or ypos > limits[1][1]):
             self._check_endstops(move)
@@ -15,12 +15,14 @@ if TYPE_CHECKING:
     from ..toolhead import ToolHead
 
 import logging
-import stepper
+import stepper, tracing
 from . import idex_modes
 from kinematics.cartesian import CartKinematics
 from copy import deepcopy
 from collections import namedtuple
 
+trace_kin = tracing.get_category("kin.cartesian_abc")
+
 class CartKinematicsABC(CartKinematics):
     """Kinematics for the ABC axes in the main toolhead class.
 
@@ -282,7 +284,19 @@ class CartKinematicsABC(CartKinematics):
             # Helper for Safe Z Home
             self.limits[self.axis_map["Z"]] = (1.0, -1.0)
 
-    def home_axis(self, homing_state: Homing, axis, rail):
+    def get_homing_rail(self, axis):
+        """Get the rail of an axis, to home it in parallel with other axes.
+
+        Returns None if the axis can not be homed on its own rail (i.e. the
+        dual carriage axis). See "homing_group" in "homing.py".
+        """
+        toolhead = self.printer.lookup_object('toolhead')
+        if self.dc_module is not None and axis == self.dual_carriage_axis:
+            return None
+        return self.rails[toolhead.axes_to_xyz(axis)]
+
+    def calc_homing_positions(self, axis, rail):
+        """Calculate the forced start position and the home position of an axis."""
         # Determine movement
         position_min, position_max = rail.get_range()
         hi = rail.get_homing_info()
@@ -293,6 +307,10 @@ class CartKinematicsABC(CartKinematics):
             forcepos[axis] -= 1.5 * (hi.position_endstop - position_min)
         else:
             forcepos[axis] += 1.5 * (position_max - hi.position_endstop)
+        return forcepos, homepos
+
+    def home_axis(self, homing_state: Homing, axis, rail):
+        forcepos, homepos = self.calc_homing_positions(axis, rail)
         # Perform homing
         logging.info(f"cartesian_abc._home_axis: homing axis={axis} with forcepos={forcepos} and homepos={homepos}")
         homing_state.home_rails([rail], forcepos, homepos)
@@ -313,7 +331,9 @@ class CartKinematicsABC(CartKinematics):
         self.reset_limits()
     
     def _check_endstops(self, move):
-        logging.info(f"cartesian_abc._check_endstops: triggered on {self.axis_names}/{self.axis} move.")
+        if trace_kin.enabled:
+            trace_kin.log("cartesian_abc._check_endstops: triggered on %s/%s"
+                          " move.", self.axis_names, self.axis)
         end_pos = move.end_pos
         for i, axis in enumerate(self.axis_config):
             # TODO: Check if its better to iterate over "self.axis" instead,
@@ -347,7 +367,9 @@ class CartKinematicsABC(CartKinematics):
             move (tolhead.Move): Instance of the Move class.
         """
         limit_checks = []
-        logging.info(f"cartesian_abc.check_move: checking move ending on {move.end_pos}.")
+        if trace_kin.enabled:
+            trace_kin.log("cartesian_abc.check_move: checking move ending"
+                          " on %s.", move.end_pos)
         for i, axis in enumerate(self.axis_config):
             # TODO: Check if its better to iterate over "self.axis" instead,
             #       see rationale in favor of "axis_config" above, at "_check_endstops".
@@ -366,13 +388,11 @@ class CartKinematicsABC(CartKinematics):
         # NOTE: check if the move involves the Z axis, to limit the speed.
         if "Z" not in self.axis_names.upper():
             # No Z-axis has been configured in this kinematic.
-            logging.info(f"cartesian_abc.check_move: no Z axis in {self.axis_names} kinematic.")
             return
         
         z_displacement = move.axes_d[self.axis_map["Z"]]
         if not z_displacement:
             # Normal XY move, no Z axis movements - use default speed.
-            logging.info("cartesian_abc.check_move: no Z axis in move.")
             return
         
         # Move with Z - update velocity and accel for slower Z axis
@@ -16,7 +16,9 @@ if TYPE_CHECKING:
 # pylint: disable=logging-fstring-interpolation,logging-not-lazy,fixme
 
 import math, logging
-import stepper, chelper
+import stepper, chelper, tracing
+
+trace_kin = tracing.get_category("kin.extruder")
 
 class ExtruderStepper:
     def __init__(self, config):
@@ -154,17 +156,17 @@ class ExtruderStepper:
 
         if self.can_home:
             # NOTE: Software limit checks, borrowed from "cartesian.py".
-            logging.info(f"extruder_stepper.check_move_limits: checking move ending on epos={epos} and limits={self.limits}")
+            if trace_kin.enabled:
+                trace_kin.log("extruder_stepper.check_move_limits: checking"
+                              " move ending on epos=%s and limits=%s",
+                              epos, self.limits)
             if (epos < self.limits[0][0] or epos > self.limits[0][1]):
                 self._check_endstops(move)
-        else:
-            logging.info(f"extruder_stepper.check_move_limits: E stepper not home-able, skipping check on move ending on epos={epos}")
 
     def _check_endstops(self, move):
         """ExtruderStepper version of _check_endstops in toolhead.py"""
 
         # NOTE: Software limit checks, borrowed from "cartesian.py".
-        logging.info(f"extruder_stepper._check_endstops: move limit check triggered.")
         end_pos = move.end_pos[-1]
 
         # NOTE: Check if the extruder move is out of bounds.
@@ -176,9 +178,6 @@ class ExtruderStepper:
                 raise move.move_error(f"Must home extruder axis ({len(move.end_pos)}) first.")
             # NOTE: Else raise a move error without a message.
             raise move.move_error()
-        else:
-            # NOTE: Everything seems fine.
-            logging.info(f"extruder_stepper._check_endstops: The extruder's move to {end_pos} on axis {len(move.end_pos)} checks out.")
 
     def set_position(self, newpos_e, homing_e=False, print_time=None):
         """ExtruderStepper version of set_position in toolhead.py"""
@@ -385,7 +384,9 @@ class PrinterExtruder:
         # NOTE: other extrusion checks.
         if (not move.axes_d[0] and not move.axes_d[1]) or axis_r < 0. or self.symmetric:
             # Extrude only move (or retraction move) - limit accel and velocity
-            logging.info(f"PrinterExtruder.check_move: retraction move or E-only move. Limiting move speed and acceleration.")
+            if trace_kin.enabled:
+                trace_kin.log("PrinterExtruder.check_move: retraction move or"
+                              " E-only move. Limiting speed and accel.")
             if abs(move.axes_d[-1]) > self.max_e_dist:
                 raise self.printer.command_error(
                     "Extrude only move too long (%.3fmm vs %.3fmm)\n"
@@ -444,7 +445,7 @@ class PrinterExtruder:
         if diff_r:
             return (self.instant_corner_v / abs(diff_r))**2
         return move.max_cruise_v2
-    def move(self, print_time, move):
+    def move(self, print_time, move, trapq_append=None):
         # NOTE: this PrinterExtruder.move method is called
         #       by the _process_moves method from ToolHead.
         #       In that call, the "print_time" is shared with
@@ -475,13 +476,18 @@ class PrinterExtruder:
         #       moves end up together. The only reasonable place left seems to be
         #       in the "serialqueue.c" or nearby files. What I know is that they
         #       are coordinated by print_time at "_process_moves" (see: toolhead.py).
-        self.trapq_append(self.trapq, print_time,
-                          move.accel_t, move.cruise_t, move.decel_t,
-                          move.start_pos[-1], 0., 0.,
-                          1., can_pressure_advance, 0.,
-                          start_v, cruise_v, accel)
+        # NOTE: The toolhead passes "trapq_append" to batch the extruder
+        #       move with the other trapq moves (see TrapQAppendBatch).
+        if trapq_append is None:
+            trapq_append = self.trapq_append
+        trapq_append(self.trapq, print_time,
+                     move.accel_t, move.cruise_t, move.decel_t,
+                     move.start_pos[-1], 0., 0.,
+                     1., can_pressure_advance, 0.,
+                     start_v, cruise_v, accel)
         self.last_position = move.end_pos[-1]
-        logging.info(f"extruder: move.end_pos[-1]={str(move.end_pos[-1])}")
+        if trace_kin.enabled:
+            trace_kin.log("extruder: move.end_pos[-1]=%s", move.end_pos[-1])
     def find_past_position(self, print_time):
         if self.extruder_stepper is None:
             return 0.
@@ -6,7 +6,7 @@
 # This file may be distributed under the terms of the GNU GPLv3 license.
 import sys, os, gc, optparse, logging, time, collections, importlib
 import util, reactor, queuelogger, msgproto
-import gcode, configfile, pins, mcu, toolhead, webhooks
+import gcode, configfile, pins, mcu, toolhead, webhooks, tracing
 import re
 
 message_ready = "Printer is ready"
@@ -37,7 +37,7 @@ class Printer:
         self.event_handlers = {}
         self.objects = collections.OrderedDict()
         # Init printer components that must be setup prior to config
-        for m in [gcode, webhooks]:
+        for m in [gcode, webhooks, tracing]:
             m.add_early_printer_objects(self)
     def get_start_args(self):
         return self.start_args
@@ -282,6 +282,10 @@ class Printer:
             (lambda e: self.invoke_shutdown(msg, details)))
     def register_event_handler(self, event, callback):
         self.event_handlers.setdefault(event, []).append(callback)
+    def get_event_handlers(self, event):
+        # NOTE: Returns the live list of callbacks for an event, which
+        #       lets hot paths skip send_event() when it is empty.
+        return self.event_handlers.setdefault(event, [])
     def send_event(self, event, *params):
         return [cb(*params) for cb in self.event_handlers.get(event, [])]
     def request_exit(self, result):
@@ -337,6 +341,9 @@ def main():
     opts.add_option("-d", "--dictionary", dest="dictionary", type="string",
                     action="callback", callback=arg_dictionary,
                     help="file to read for mcu protocol dictionary")
+    opts.add_option("--trace", dest="trace", default="",
+                    help="comma separated trace categories to enable"
+                    " (eg: motion.*)")
     opts.add_option("--import-test", action="store_true",
                     help="perform an import module test")
     options, args = opts.parse_args()
@@ -345,7 +352,7 @@ def main():
     if len(args) != 1:
         opts.error("Incorrect number of arguments")
     start_args = {'config_file': args[0], 'apiserver': options.apiserver,
-                  'start_reason': 'startup'}
+                  'start_reason': 'startup', 'trace': options.trace}
 
     debuglevel = logging.INFO
     if options.verbose:
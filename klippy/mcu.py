@@ -241,12 +241,15 @@ class TriggerDispatch:
         return self._trsyncs[0].get_oid()
     def get_command_queue(self):
         return self._trsyncs[0].get_command_queue()
+    def get_trsync(self, mcu):
+        for trsync in self._trsyncs:
+            if trsync.get_mcu() is mcu:
+                return trsync
+        trsync = MCU_trsync(mcu, self._trdispatch)
+        self._trsyncs.append(trsync)
+        return trsync
     def add_stepper(self, stepper):
-        trsyncs = {trsync.get_mcu(): trsync for trsync in self._trsyncs}
-        trsync = trsyncs.get(stepper.get_mcu())
-        if trsync is None:
-            trsync = MCU_trsync(stepper.get_mcu(), self._trdispatch)
-            self._trsyncs.append(trsync)
+        trsync = self.get_trsync(stepper.get_mcu())
         trsync.add_stepper(stepper)
         # Check for unsupported multi-mcu shared stepper rails
         sname = stepper.get_name()
@@ -287,6 +290,9 @@ class TriggerDispatch:
         err_res = [r for r in res if r >= MCU_trsync.REASON_COMMS_TIMEOUT]
         if err_res:
             return err_res[0]
+        if MCU_trsync.REASON_ENDSTOP_HIT in res:
+            # The endstop may be on any of the mcus (see MCU_endstop_group)
+            return MCU_trsync.REASON_ENDSTOP_HIT
         return res[0]
 
 class MCU_endstop:
@@ -330,10 +336,17 @@ class MCU_endstop:
     def home_start(self, print_time, sample_time, sample_count, rest_time,
                    triggered=True):
         # NOTE: called by "homing_move" (at homing.py)
+        trigger_completion = self._dispatch.start(print_time)
+        self.arm(print_time, sample_time, sample_count, rest_time, triggered,
+                 self._dispatch.get_oid())
+        return trigger_completion
+    def arm(self, print_time, sample_time, sample_count, rest_time, triggered,
+            trsync_oid):
+        # Start checking the endstop, triggering the given trsync (which
+        # must be on the mcu of the endstop)
         clock = self._mcu.print_time_to_clock(print_time)
         rest_ticks = self._mcu.print_time_to_clock(print_time+rest_time) - clock
         self._rest_ticks = rest_ticks
-        trigger_completion = self._dispatch.start(print_time)
         # NOTE: Here the pin logic is finally used to make the endstop_home 
         #       low level command. It uses "triggered ^ self._invert" which has
         #       the following logic table:
@@ -344,13 +357,22 @@ class MCU_endstop:
         self._home_cmd.send(
             [self._oid, clock, self._mcu.seconds_to_clock(sample_time),
              sample_count, rest_ticks, triggered ^ self._invert,
-             self._dispatch.get_oid(), MCU_trsync.REASON_ENDSTOP_HIT],
+             trsync_oid, MCU_trsync.REASON_ENDSTOP_HIT],
             reqclock=clock)
-        return trigger_completion
+    def disarm(self):
+        self._home_cmd.send([self._oid, 0, 0, 0, 0, 0, 0, 0])
+    def query_trigger(self):
+        # Return the print time of the last trigger (or trigger attempt)
+        # of the endstop, and its current state
+        params = self._query_cmd.send([self._oid])
+        next_clock = self._mcu.clock32_to_clock64(params['next_clock'])
+        trigger_time = self._mcu.clock_to_print_time(
+            next_clock - self._rest_ticks)
+        return trigger_time, params['pin_value'] ^ self._invert
     def home_wait(self, home_end_time):
         # NOTE: called by "homing_move" (at homing.py)
         self._dispatch.wait_end(home_end_time)
-        self._home_cmd.send([self._oid, 0, 0, 0, 0, 0, 0, 0])
+        self.disarm()
         res = self._dispatch.stop()
         if res >= MCU_trsync.REASON_COMMS_TIMEOUT:
             cmderr = self._mcu.get_printer().command_error
@@ -359,9 +381,7 @@ class MCU_endstop:
             return 0.
         if self._mcu.is_fileoutput():
             return home_end_time
-        params = self._query_cmd.send([self._oid])
-        next_clock = self._mcu.clock32_to_clock64(params['next_clock'])
-        return self._mcu.clock_to_print_time(next_clock - self._rest_ticks)
+        return self.query_trigger()[0]
     
     def query_endstop(self, print_time):
         clock = self._mcu.print_time_to_clock(print_time)
@@ -370,6 +390,73 @@ class MCU_endstop:
         params = self._query_cmd.send([self._oid], minclock=clock)
         return params['pin_value'] ^ self._invert
 
+# Several endstops (possibly on different mcus) armed on a single
+# trigger dispatch, such that the first one to trigger stops the
+# steppers of a homing move. Only the "active" endstops are armed.
+class MCU_endstop_group:
+    def __init__(self, mcu_endstops):
+        self._endstops = list(mcu_endstops)
+        self._mcu = self._endstops[0].get_mcu()
+        self._dispatch = TriggerDispatch(self._mcu)
+        for mcu_endstop in self._endstops:
+            self._dispatch.get_trsync(mcu_endstop.get_mcu())
+        self._active = list(self._endstops)
+        self._start_time = 0.
+        self._triggered = True
+        self._trigger = None
+    def get_mcu(self):
+        return self._mcu
+    def add_stepper(self, stepper):
+        self._dispatch.add_stepper(stepper)
+    def get_steppers(self):
+        return self._dispatch.get_steppers()
+    def set_active(self, mcu_endstops):
+        self._active = list(mcu_endstops)
+    def get_trigger(self):
+        # Return the endstop that triggered first in the last homing
+        # move and its trigger time (or None)
+        return self._trigger
+    def home_start(self, print_time, sample_time, sample_count, rest_time,
+                   triggered=True):
+        self._start_time = print_time
+        self._triggered = triggered
+        self._trigger = None
+        trigger_completion = self._dispatch.start(print_time)
+        for mcu_endstop in self._active:
+            trsync = self._dispatch.get_trsync(mcu_endstop.get_mcu())
+            mcu_endstop.arm(print_time, sample_time, sample_count, rest_time,
+                            triggered, trsync.get_oid())
+        return trigger_completion
+    def home_wait(self, home_end_time):
+        self._dispatch.wait_end(home_end_time)
+        for mcu_endstop in self._active:
+            mcu_endstop.disarm()
+        res = self._dispatch.stop()
+        if res >= MCU_trsync.REASON_COMMS_TIMEOUT:
+            cmderr = self._mcu.get_printer().command_error
+            raise cmderr("Communication timeout during homing")
+        if res != MCU_trsync.REASON_ENDSTOP_HIT:
+            return 0.
+        if self._mcu.is_fileoutput():
+            self._trigger = (self._active[0], home_end_time)
+            return home_end_time
+        # The endstops keep sampling until disarmed, so pick the earliest
+        # trigger of this move, preferring the endstops still triggered
+        triggers = []
+        for mcu_endstop in self._active:
+            trigger_time, state = mcu_endstop.query_trigger()
+            if self._start_time <= trigger_time <= home_end_time:
+                triggers.append((state != self._triggered, trigger_time,
+                                 self._active.index(mcu_endstop)))
+        if not triggers:
+            return 0.
+        released, trigger_time, index = min(triggers)
+        self._trigger = (self._active[index], trigger_time)
+        return trigger_time
+    def query_endstop(self, print_time):
+        return max([mcu_endstop.query_endstop(print_time)
+                    for mcu_endstop in self._active])
+
 class MCU_digital_out:
     def __init__(self, mcu, pin_params):
         self._mcu = mcu
@@ -15,8 +15,8 @@ if TYPE_CHECKING:
 # pylint: disable=missing-class-docstring,missing-function-docstring,invalid-name,line-too-long,consider-using-f-string,multiple-imports,wrong-import-position
 # pylint: disable=logging-fstring-interpolation,logging-not-lazy,fixme
 
-import math, logging, importlib
-import mcu, chelper, kinematics.extruder
+import math, logging, importlib, array
+import mcu, chelper, kinematics.extruder, tracing
 from kinematics.extruder import PrinterExtruder
 from pprint import pformat
 from collections import namedtuple
@@ -37,17 +37,39 @@ The high-level host code uses print times to calculate almost all physical actio
 Within the host code, print times are generally stored in variables named print_time or move_time.
 """
 
+# Debug tracing of the motion hot paths (disabled by default, see tracing.py).
+trace_move = tracing.get_category("motion.move")
+trace_lookahead = tracing.get_category("motion.lookahead")
+trace_trapq = tracing.get_category("motion.trapq")
+trace_position = tracing.get_category("motion.position")
+
 # Class to track each move request
+# NOTE: Moves are created for every G-Code segment, so the class uses
+#       "__slots__" to keep instances compact and attribute access fast
+#       on machines with many axes. Attributes which are constant for
+#       the toolhead (axis names, limited axes) are read from it instead
+#       of being copied into every move.
 class Move:
+    __slots__ = (
+        'toolhead', 'start_pos', 'end_pos', 'accel', 'junction_deviation',
+        'timing_callbacks', 'is_kinematic_move', 'axes_d', 'move_d',
+        'axes_r', 'axes_r_limited', 'min_move_t',
+        'max_start_v2', 'max_cruise_v2', 'delta_v2',
+        'max_smoothed_v2', 'smooth_delta_v2',
+        'start_v', 'cruise_v', 'end_v', 'accel_t', 'cruise_t', 'decel_t')
     def __init__(self, toolhead, start_pos, end_pos, speed):
-        logging.info(f"Move: setup with start_pos={start_pos} and end_pos={end_pos}")
+        if trace_move.enabled:
+            trace_move.log("Move: setup with start_pos=%s and end_pos=%s",
+                           start_pos, end_pos)
 
         self.toolhead = toolhead
-        self.start_pos = tuple(start_pos)
+        self.start_pos = start_pos = tuple(start_pos)
         self.end_pos = tuple(end_pos)
         self.accel = toolhead.max_accel
         self.junction_deviation = toolhead.junction_deviation
-        self.timing_callbacks = []
+        # NOTE: Shared empty tuple, replaced by a list when a callback is
+        #       registered (see "register_lookahead_callback").
+        self.timing_callbacks = ()
         # NOTE: "toolhead.max_velocity" contains the value from the config file.
         #       The "speed" argument comes from the call at "toolhead.move",
         #       which is the feedrate "F" GCODE argument times a factor:
@@ -57,32 +79,33 @@ class Move:
         velocity = min(speed, toolhead.max_velocity)
         self.is_kinematic_move = True
 
-        # NOTE: amount of non-extruder axes: XYZ=3, XYZABC=6.
-        self.axis_names = toolhead.axis_names
-        self.axis_count = toolhead.axis_count
-        self.limited_axes = toolhead.limited_axes
-
         # NOTE: Compute the components of the displacement vector.
         #       The last component is now the extruder.
         self.axes_d = axes_d = [ep - sp for ep, sp in zip(end_pos, start_pos)]
+        # NOTE: amount of non-extruder axes: XYZ=3, XYZABC=6.
+        kin_count = len(axes_d) - 1
 
         # NOTE: Compute the euclidean magnitude of the XYZ(ABC) displacement vector,
         #       excluding the extruder.
-        self.move_d = move_d = math.sqrt(sum([d*d for d in axes_d[:-1]]))
+        move_d2 = 0.
+        for i in range(kin_count):
+            move_d2 += axes_d[i] * axes_d[i]
+        self.move_d = move_d = math.sqrt(move_d2)
 
-        logging.info(f"Move: setup with axes_d={axes_d} and move_d={move_d}.")
+        if trace_move.enabled:
+            trace_move.log("Move: setup with axes_d=%s and move_d=%s.",
+                           axes_d, move_d)
 
         # NOTE: If the move in XYZ is very small, then parse it as an extrude-only move.
         if move_d < .000000001:
             # Extrude only move
 
-            # NOTE: the main axes wont move, thus end=stop.
-            self.end_pos = tuple([sp for sp in start_pos[:-1]])
-            # NOTE: the extruder will move.
-            self.end_pos = self.end_pos + (end_pos[-1],)
+            # NOTE: the main axes wont move, thus end=stop, and
+            #       only the extruder will move.
+            self.end_pos = start_pos[:-1] + (end_pos[-1],)
 
             # NOTE: set axis displacement to zero.
-            for i in range(len(axes_d[:-1])):
+            for i in range(kin_count):
                 axes_d[i] = 0.
 
             # NOTE: set move distance to the extruder's displacement.
@@ -100,16 +123,19 @@ class Move:
 
         # NOTE: Compute a ratio between each component of the displacement
         #       vector and the total magnitude. Ratios can be negative.
-        self.axes_r = [d * inv_move_d for d in axes_d]
+        self.axes_r = axes_r = [d * inv_move_d for d in axes_d]
 
         # NOTE: Scale the acceleration of the move, such that the toolhead's max
         #       acceleration only limits the limited axes.
-        self.axes_r_limited = sum([abs(self.axes_r[i]) for i in self.limited_axes])
-        if self.axes_r_limited > 0.0:
-            self.accel = min(toolhead.max_accel / self.axes_r_limited, 99999999.9)
-            logging.info(f"Move: scale acceleration from {toolhead.max_accel} to {self.accel}.")
-        else:
-            logging.info(f"Move: acceleration set to {self.accel}.")
+        axes_r_limited = 0.
+        for i in toolhead.limited_axes:
+            axes_r_limited += abs(axes_r[i])
+        self.axes_r_limited = axes_r_limited
+        if axes_r_limited > 0.0:
+            self.accel = min(toolhead.max_accel / axes_r_limited, 99999999.9)
+        if trace_move.enabled:
+            trace_move.log("Move: acceleration set to %s (max_accel=%s).",
+                           self.accel, toolhead.max_accel)
 
         # NOTE: Compute the mimimum time that the move will take (at speed == max speed).
         #       The time will be greater if the axes must accelerate during the move.
@@ -151,8 +177,6 @@ class Move:
         if not self.is_kinematic_move or not prev_move.is_kinematic_move:
             return
 
-        logging.info(f"Move calc_junction: function triggered. Initial max_start_v2: {self.max_start_v2}")
-
         # Allow extruder to calculate its maximum junction
         # NOTE: Uses the "instant_corner_v" config parameter.
         extruder_v2 = self.toolhead.extruder.calc_junction(prev_move, self)
@@ -160,7 +184,10 @@ class Move:
         # Find max velocity using "approximated centripetal velocity"
         axes_r = self.axes_r
         prev_axes_r = prev_move.axes_r
-        junction_cos_theta = -sum([ axes_r[i] * prev_axes_r[i] for i in range(len(axes_r[:-1])) ])  # NOTE: axes_r comes from axes_d, used is to replace "self.axis_count".
+        # NOTE: The extruder component (last) is excluded from the dot product.
+        junction_cos_theta = 0.
+        for i in range(len(axes_r) - 1):
+            junction_cos_theta -= axes_r[i] * prev_axes_r[i]
         if junction_cos_theta > 0.999999:
             return
         junction_cos_theta = max(junction_cos_theta, -0.999999)
@@ -181,8 +208,10 @@ class Move:
             prev_move.max_start_v2 + prev_move.delta_v2)
         self.max_smoothed_v2 = min(self.max_start_v2,
                                    prev_move.max_smoothed_v2 + prev_move.smooth_delta_v2)
-
-        logging.info(f"Move calc_junction: function end. Final max_start_v2: {self.max_start_v2}")
+        if trace_lookahead.enabled:
+            trace_lookahead.log("Move calc_junction: max_start_v2=%s"
+                                " max_smoothed_v2=%s", self.max_start_v2,
+                                self.max_smoothed_v2)
 
     def set_junction(self, start_v2, cruise_v2, end_v2):
         """Move.set_junction() implements the "trapezoid generator" on a move.
@@ -197,8 +226,6 @@ class Move:
             end_v2 (_type_): _description_
         """
 
-        logging.info("Move set_junction: function triggered.")
-
         # Determine accel, cruise, and decel portions of the move distance
         half_inv_accel = .5 / self.accel
         accel_d = (cruise_v2 - start_v2) * half_inv_accel
@@ -214,8 +241,6 @@ class Move:
         self.cruise_t = cruise_d / cruise_v
         self.decel_t = decel_d / ((end_v + cruise_v) * 0.5)
 
-        logging.info("Move set_junction: function end.")
-
 LOOKAHEAD_FLUSH_TIME = 0.250
 
 # Class to track a list of pending move requests and to facilitate
@@ -234,14 +259,19 @@ class LookAheadQueue:
         if self.queue:
             return self.queue[-1]
         return None
+    def pop_last(self):
+        # NOTE: Remove the last (not yet flushed) move, such that it can
+        #       be replaced by a longer one (see extras/path_blend.py).
+        move = self.queue.pop()
+        if self.queue:
+            self.junction_flush += move.min_move_t
+        return move
     def flush(self, lazy=False):
         """MoveQueue.flush() determines the start and end velocities of each move.
 
         Args:
             lazy (bool, optional): _description_. Defaults to False.
         """
-        # NOTE: logging for tracing activity
-        logging.info("MoveQueue flush: function triggered.")
         # NOTE: called by "add_move" when:
         #       "Enough moves have been queued to reach the target flush time."
         #       Also called by "flush_step_generation".
@@ -337,14 +367,19 @@ class LookAheadQueue:
         #       which can happen if the queue was originally empty (¿or perhaps if
         #       the peak cruise speed was found on the second move?).
         if update_flush_count or not flush_count:
-            logging.info(f"MoveQueue flush: _process_moves skipped due to update_flush_count={update_flush_count} or not flush_count={flush_count}")
+            if trace_lookahead.enabled:
+                trace_lookahead.log("MoveQueue flush: _process_moves skipped"
+                                    " (update_flush_count=%s flush_count=%d)",
+                                    update_flush_count, flush_count)
             return
 
         # Generate step times for all moves ready to be flushed
         # NOTE: The clock time when these moves will be executed is not yet explicit,
         #       it will be calculated  by "_process_moves", and then updated with
         #       a call to "_update_move_time".
-        logging.info("MoveQueue flush: calling _process_moves.")
+        if trace_lookahead.enabled:
+            trace_lookahead.log("MoveQueue flush: processing %d of %d moves.",
+                                flush_count, len(queue))
         # NOTE: "flush_count" can only have been made possibly smaller by
         #       setting "lazy=True" from the start. This means that a "regular"
         #       call to flush will try to remove all
@@ -359,7 +394,6 @@ class LookAheadQueue:
         Args:
             move (Move): A new Move object.
         """
-        logging.info(f"MoveQueue.add_move: adding move.")
         self.queue.append(move)
 
         # NOTE: The move queue is not flushed automatically when the
@@ -382,6 +416,76 @@ class LookAheadQueue:
             #       "flush_count" variable should be updated (lol).
             self.flush(lazy=True)
 
+LOOKAHEAD_PARAMS = 7
+LOOKAHEAD_RESULTS = 6
+
+# Look-ahead queue with the velocity planning done in C (see
+# chelper/lookahead.c). The planner inputs of each move are packed into
+# a flat array as the move is queued, and the pure Python flush() above
+# is kept as the reference implementation (see the "--check" option of
+# scripts/benchmark_lookahead.py).
+class NativeLookAheadQueue(LookAheadQueue):
+    def __init__(self, toolhead):
+        LookAheadQueue.__init__(self, toolhead)
+        self.ffi_main, ffi_lib = chelper.get_ffi()
+        self.lookahead_flush = ffi_lib.lookahead_flush
+        self.params = array.array('d')
+    def reset(self):
+        LookAheadQueue.reset(self)
+        del self.params[:]
+    def pop_last(self):
+        del self.params[-LOOKAHEAD_PARAMS:]
+        return LookAheadQueue.pop_last(self)
+    def flush(self, lazy=False):
+        self.junction_flush = LOOKAHEAD_FLUSH_TIME
+        queue = self.queue
+        count = len(queue)
+        if not count:
+            return
+        ffi_main = self.ffi_main
+        results = ffi_main.new("double[]", count * LOOKAHEAD_RESULTS)
+        params = ffi_main.from_buffer("double[]", self.params)
+        try:
+            flush_count = self.lookahead_flush(params, results, count, lazy)
+        finally:
+            # NOTE: The array can't be resized while its buffer is exported.
+            ffi_main.release(params)
+        if not flush_count:
+            if trace_lookahead.enabled:
+                trace_lookahead.log("MoveQueue flush: _process_moves skipped"
+                                    " (lazy=%s)", lazy)
+            return
+        if trace_lookahead.enabled:
+            trace_lookahead.log("MoveQueue flush: processing %d of %d moves.",
+                                flush_count, count)
+        moves = queue[:flush_count]
+        res = ffi_main.unpack(results, flush_count * LOOKAHEAD_RESULTS)
+        r = 0
+        for move in moves:
+            (move.start_v, move.cruise_v, move.end_v,
+             move.accel_t, move.cruise_t, move.decel_t) = res[r:r+6]
+            r += LOOKAHEAD_RESULTS
+        self.toolhead._process_moves(moves=moves)
+        del queue[:flush_count]
+        del self.params[:flush_count * LOOKAHEAD_PARAMS]
+    def add_move(self, move):
+        queue = self.queue
+        queue.append(move)
+        if len(queue) > 1:
+            move.calc_junction(queue[-2])
+        self.params.extend((move.max_start_v2, move.delta_v2,
+                            move.max_smoothed_v2, move.smooth_delta_v2,
+                            move.max_cruise_v2, move.move_d, move.accel))
+        if len(queue) == 1:
+            return
+        self.junction_flush -= move.min_move_t
+        if self.junction_flush <= 0.:
+            # Enough moves have been queued to reach the target flush time.
+            self.flush(lazy=True)
+
+LOOKAHEAD_PLANNERS = {'native': NativeLookAheadQueue,
+                      'python': LookAheadQueue}
+
 BUFFER_TIME_LOW = 1.0
 BUFFER_TIME_HIGH = 2.0
 BUFFER_TIME_START = 0.250
@@ -411,6 +515,44 @@ class TrapQ:
         self.trapq_finalize_moves = ffi_lib.trapq_finalize_moves
         self.step_generators = []
 
+TRAPQ_APPEND_ARGS = 13
+
+# Collect trapq_append() calls and submit them to the C code in a single
+# trapq_append_many() call (one FFI crossing per batch instead of one
+# per move and trapq).
+class TrapQAppendBatch:
+    def __init__(self):
+        self.ffi_main, ffi_lib = chelper.get_ffi()
+        self.trapq_append_many = ffi_lib.trapq_append_many
+        self.trapqs = []
+        self.data = array.array('d')
+        # Counters for the statistics
+        self.ffi_calls = self.appends = 0
+    def append(self, trapq, print_time, accel_t, cruise_t, decel_t,
+               start_pos_x, start_pos_y, start_pos_z,
+               axes_r_x, axes_r_y, axes_r_z, start_v, cruise_v, accel):
+        # NOTE: Same arguments as "trapq_append" in chelper/trapq.c
+        self.trapqs.append(trapq)
+        self.data.extend((print_time, accel_t, cruise_t, decel_t,
+                          start_pos_x, start_pos_y, start_pos_z,
+                          axes_r_x, axes_r_y, axes_r_z,
+                          start_v, cruise_v, accel))
+    def flush(self):
+        count = len(self.trapqs)
+        if not count:
+            return
+        ffi_main = self.ffi_main
+        tqs = ffi_main.new("struct trapq *[]", self.trapqs)
+        data = ffi_main.from_buffer("double[]", self.data)
+        try:
+            self.trapq_append_many(tqs, data, count)
+        finally:
+            ffi_main.release(data)
+        del self.trapqs[:]
+        del self.data[:]
+        self.ffi_calls += 1
+        self.appends += count
+
 # Main code to track events (and their timing) on the printer toolhead
 class ToolHead:
     """Main toolhead class.
@@ -483,7 +625,9 @@ class ToolHead:
         self.all_mcus = [
             m for n, m in self.printer.lookup_objects(module='mcu')]
         self.mcu = self.all_mcus[0]
-        self.lookahead = LookAheadQueue(self)
+        lookahead_class = config.getchoice('lookahead_planner',
+                                           LOOKAHEAD_PLANNERS, 'native')
+        self.lookahead = lookahead_class(self)
         self.lookahead.set_flush_time(BUFFER_TIME_HIGH)
 
         # Initiate position as a zero vector.
@@ -528,6 +672,8 @@ class ToolHead:
         self.special_queuing_state = "NeedPrime"
         self.priming_timer = None
         self.drip_completion = None
+        # Optional merging of near colinear moves (see extras/path_blend.py)
+        self.path_blend = None
         # Flush tracking
         self.flush_timer = self.reactor.register_timer(self._flush_handler)
         self.do_kick_flush_timer = True
@@ -541,6 +687,10 @@ class ToolHead:
         self.trapq_append = ffi_lib.trapq_append
         self.trapq_finalize_moves = ffi_lib.trapq_finalize_moves
         self.step_generators = []
+        self.move_callbacks = []
+        self.trapq_batch = TrapQAppendBatch()
+        self.last_stats_time = 0.
+        self.last_stats_counts = (0, 0)
 
         # NOTE: check TRAPQ for the extra ABC axes here.
         # TODO: rewite this part to setup an arbitrary amount of axis, relying on the specification (XYZABC).
@@ -735,7 +885,9 @@ class ToolHead:
         #       "flush_moves" on all MCUs, and "generate_steps" on all steppers.
         # NOTE: Called by "flush_step_generation", "_process_moves",
         #       "dwell", and "_update_drip_move_time".
-        logging.info(f"ToolHead: _update_move_time triggered with flush_time={flush_time}")
+        if trace_trapq.enabled:
+            trace_trapq.log("ToolHead: _advance_flush_time flush_time=%.6f",
+                            flush_time)
         flush_time = max(flush_time, self.last_flush_time)
         # Generate steps via itersolve
         sg_flush_want = min(flush_time + STEPCOMPRESS_FLUSH_TIME,
@@ -774,7 +926,6 @@ class ToolHead:
         for axes in list(self.kinematics):
             # Iterate over ["XYZ", "ABC"].
             kin = self.kinematics[axes]
-            logging.info(f"ToolHead._update_move_time calling trapq_finalize_moves on axes={axes} with free_time={free_time}")
             self.trapq_finalize_moves(kin.trapq, free_time, clear_history_time)
         self.extruder.update_move_time(free_time, clear_history_time)
         # Flush stepcompress and mcu steppersync
@@ -871,9 +1022,6 @@ class ToolHead:
         #       the "flush" method in a "MoveQueue" class instance.
         #       The "moves" argument receives a "queue" of moves "ready to be flushed".
 
-        # NOTE: logging for tracing activity
-        logging.info("ToolHead _process_moves: function triggered.")
-
         # Resync print_time if necessary
         if self.special_queuing_state:
             if self.special_queuing_state != "Drip":
@@ -883,7 +1031,6 @@ class ToolHead:
             # NOTE Update "self.print_time".
             self._calc_print_time()
             # NOTE: Also sends a "toolhead:sync_print_time" event.
-            logging.info(f"ToolHead _process_moves: self.print_time={str(self.print_time)}")
 
         # Queue moves into trapezoid motion queue (trapq)
         # NOTE: the "trapq" is possibly something like a CFFI object.
@@ -891,23 +1038,31 @@ class ToolHead:
         #       object the one responsible for sending commands to
         #       the MCUs.
         next_move_time = self.print_time
+        if trace_trapq.enabled:
+            trace_trapq.log("ToolHead _process_moves: %d moves at"
+                            " print_time=%.6f", len(moves), next_move_time)
+        # NOTE: The trapq moves of all axis sets (and the extruder) are
+        #       collected and sent to the C code with a single call
+        #       to "trapq_append_many" (see TrapQAppendBatch).
+        trapq_batch = self.trapq_batch
+        trapq_append = trapq_batch.append
+        kins = list(self.kinematics.values())
+        move_callbacks = self.move_callbacks
         for move in moves:
-            logging.info(f"ToolHead _process_moves: next_move_time={str(next_move_time)}")
-
-            for axes in list(self.kinematics):
-                # Iterate over["XYZ", "ABC"]
-                logging.info(f"toolhead._process_moves: appending move to {axes} trapq.")
-                kin = self.kinematics[axes]
-                # NOTE: The moves are first placed on a "trapezoid motion queue" with trapq_append.
-                if move.is_kinematic_move:
-                    self.trapq_append(
+            # NOTE: The moves are first placed on a "trapezoid motion queue" with trapq_append.
+            if move.is_kinematic_move:
+                start_pos, axes_r = move.start_pos, move.axes_r
+                for kin in kins:
+                    # Iterate over["XYZ", "ABC"]
+                    # NOTE: "kin.axis" is used to select the position value that corresponds
+                    #       to the current kinematic axis (e.g. kin.axis is [0,1,2] for the XYZ axis,
+                    #       or [3,4,5] for the ABC axis).
+                    a0, a1, a2 = kin.axis[0], kin.axis[1], kin.axis[2]
+                    trapq_append(
                         kin.trapq, next_move_time,
                         move.accel_t, move.cruise_t, move.decel_t,
-                        # NOTE: "kin.axis" is used to select the position value that corresponds
-                        #       to the current kinematic axis (e.g. kin.axis is [0,1,2] for the XYZ axis,
-                        #       or [3,4,5] for the ABC axis).
-                        move.start_pos[kin.axis[0]], move.start_pos[kin.axis[1]], move.start_pos[kin.axis[2]],
-                        move.axes_r[kin.axis[0]], move.axes_r[kin.axis[1]], move.axes_r[kin.axis[2]],
+                        start_pos[a0], start_pos[a1], start_pos[a2],
+                        axes_r[a0], axes_r[a1], axes_r[a2],
                         move.start_v, move.cruise_v, move.accel)
 
             # NOTE: Repeat for the extruder's trapq.
@@ -915,7 +1070,12 @@ class ToolHead:
                 # NOTE: The extruder stepper move is likely synced to the main
                 #       XYZ movement here, by sharing the "next_move_time"
                 #       parameter in the call.
-                self.extruder.move(print_time=next_move_time, move=move)
+                self.extruder.move(print_time=next_move_time, move=move,
+                                   trapq_append=trapq_append)
+
+            # NOTE: Let other modules follow the moves sent to the trapq.
+            for cb in move_callbacks:
+                cb(next_move_time, move)
 
             # NOTE: The start MCU time for the next move in
             #       the move queue is calculated here.
@@ -924,15 +1084,19 @@ class ToolHead:
 
             # NOTE: Execute any "callbacks" registered
             #       to be run at the end of this move.
-            for cb in move.timing_callbacks:
-                cb(next_move_time)
+            if move.timing_callbacks:
+                # NOTE: Callbacks may inspect the trapq, submit pending moves first.
+                trapq_batch.flush()
+                for cb in move.timing_callbacks:
+                    cb(next_move_time)
+        trapq_batch.flush()
 
         # Generate steps for moves
         if self.special_queuing_state:
             # NOTE: this block is executed when "special_queuing_state" is not None.
-            # NOTE: loging "next_move_time" for tracing.
-            logging.info("ToolHead _process_moves: calling _update_drip_move_time with " +
-                         f"next_move_time={str(next_move_time)}")
+            if trace_trapq.enabled:
+                trace_trapq.log("ToolHead _process_moves: drip until"
+                                " next_move_time=%.6f", next_move_time)
             # NOTE: This function loops "while self.print_time < next_print_time".
             #       It "pauses before sending more steps" using "drip_completion.wait",
             #       and calls "_update_move_time" with small increments in "next_move_time".
@@ -1101,8 +1265,6 @@ class ToolHead:
 
         Has no effect on XYZ IDs
         """
-        logging.info(f"toolhead.axes_to_xyz: input={axes}")
-
         xyz_ids = [0, 1, 2, 0, 1, 2]
 
         try:
@@ -1113,8 +1275,6 @@ class ToolHead:
         except:
             raise Exception(f"toolhead.axes_to_xyz: error with input={axes}")
 
-        logging.info(f"toolhead.axes_to_xyz: output={result}")
-
         return result
 
     def get_elements(self, toolhead_pos, axes):
@@ -1127,33 +1287,30 @@ class ToolHead:
         return coords
 
     def set_position(self, newpos, homing_axes=()):
-        logging.info(f"toolhead.set_position: setting newpos={newpos} and homing_axes={homing_axes}")
+        if trace_position.enabled:
+            trace_position.log("toolhead.set_position: newpos=%s"
+                               " homing_axes=%s", newpos, homing_axes)
         self.flush_step_generation()
 
         # NOTE: Set the position of the axes "trapq".
         for axes in list(self.kinematics):
             # Iterate over["XYZ", "ABC"]
-            logging.info(f"toolhead.set_position: setting {axes} trapq position.")
             kin = self.kinematics[axes]
             # Filter the axis IDs according to the current kinematic
             new_kin_pos = self.get_elements(newpos, kin.axis)
-            logging.info(f"toolhead.set_position: using newpos={new_kin_pos}")
             self.set_kin_trap_position(kin.trapq, new_kin_pos)
 
         # NOTE: Also set the position of the extruder's "trapq".
         #       Runs "trapq_set_position" and "rail.set_position".
-        logging.info(f"toolhead.set_position: setting E trapq pos.")
         self.set_position_e(newpos_e=newpos[-1], homing_axes=homing_axes)
 
         # NOTE: Set the position of the axes "kinematics".
         for axes in list(self.kinematics):
             # Iterate over["XYZ", "ABC"]
-            logging.info(f"toolhead.set_position: setting {axes} kinematic position.")
             kin = self.kinematics[axes]
             # Filter the axis IDs according to the current kinematic, and convert them to the "0,1,2" range.
             kin_homing_axes = self.axes_to_xyz([axis for axis in homing_axes if axis in kin.axis])
             new_kin_pos = self.get_elements(newpos, kin.axis)
-            logging.info(f"toolhead.set_position: using newpos={new_kin_pos} and kin_homing_axes={kin_homing_axes}")
             self.set_kinematics_position(kin=kin, newpos=new_kin_pos, homing_axes=tuple(kin_homing_axes))
 
         # NOTE: "set_position_e" was inserted above and not after
@@ -1176,12 +1333,16 @@ class ToolHead:
 
         if trapq is not None:
             # NOTE: Set the position of the toolhead's "trapq".
-            logging.info(f"toolhead.set_kin_trap_position: setting trapq pos to newpos={newpos}")
+            if trace_position.enabled:
+                trace_position.log("toolhead.set_kin_trap_position:"
+                                   " newpos=%s", newpos)
             ffi_main, ffi_lib = chelper.get_ffi()
             ffi_lib.trapq_set_position(self.trapq, self.print_time,
                                        newpos[0], newpos[1], newpos[2])
         else:
-            logging.info(f"toolhead.set_kin_trap_position: trapq was None, skipped setting to newpos={newpos}")
+            if trace_position.enabled:
+                trace_position.log("toolhead.set_kin_trap_position: trapq"
+                                   " was None, skipped newpos=%s", newpos)
 
     def set_kinematics_position(self, kin, newpos, homing_axes):
         """Abstraction of kin.set_position for different sets of kinematics.
@@ -1198,14 +1359,20 @@ class ToolHead:
         #       calls "itersolve_set_position" from "itersolve.c".
         # NOTE: Passing only the first three elements (XYZ) to this set_position.
         if kin is not None:
-            logging.info(f"toolhead.set_kinematics_position: setting kinematic position with newpos={newpos} and homing_axes={homing_axes}")
+            if trace_position.enabled:
+                trace_position.log("toolhead.set_kinematics_position:"
+                                   " newpos=%s homing_axes=%s",
+                                   newpos, homing_axes)
             kin.set_position(newpos, homing_axes=tuple(homing_axes))
         else:
-            logging.info(f"toolhead.set_kinematics_position: kin was None, skipped setting to newpos={newpos} and homing_axes={homing_axes}")
+            if trace_position.enabled:
+                trace_position.log("toolhead.set_kinematics_position: kin"
+                                   " was None, skipped newpos=%s", newpos)
 
     def set_position_e(self, newpos_e, homing_axes=()):
         """Extruder version of set_position."""
-        logging.info(f"toolhead.set_position_e: setting E to newpos={newpos_e}.")
+        if trace_position.enabled:
+            trace_position.log("toolhead.set_position_e: newpos=%s", newpos_e)
 
         # Get the active extruder
         extruder: PrinterExtruder = self.get_extruder()  # PrinterExtruder
@@ -1228,19 +1395,29 @@ class ToolHead:
             speed (_type_): _description_
         """
 
-        logging.info(f"toolhead.move: processing move to newpos={newpos} at speed={speed}")
-
         # Check if any unconfigured (non-extruder) axes are being moved.
         moved_axes = [i for i, (start_pos, end_pos) in enumerate(zip(self.commanded_pos, newpos)) if start_pos != end_pos]
         unconfigured_axes = list(set(moved_axes).difference(self.axes))
-        logging.info(f"toolhead.move: moved_axes={moved_axes} unconfigured_axes={unconfigured_axes} self.axes={self.axes}")
         if unconfigured_axes:
             unconfigured_axes_names = "".join( [ list(self.axis_map)[ax] for ax in unconfigured_axes] )
             raise self.printer.command_error(f"Toolhead move: you must configure the {unconfigured_axes_names} axes ({unconfigured_axes}) in order to use them.")
 
-        logging.info(f"toolhead.move: moving to newpos={newpos}")
+        if trace_move.enabled:
+            trace_move.log("toolhead.move: newpos=%s speed=%s moved_axes=%s",
+                           newpos, speed, moved_axes)
+        # NOTE: With path blending, a move continuing the last queued
+        #       move (within the blending tolerance) replaces it by a
+        #       single move from the start of the last one.
+        start_pos = self.commanded_pos
+        path_blend = self.path_blend
+        merged_move = None
+        if path_blend is not None:
+            merged_move = path_blend.check_merge(self.lookahead.get_last(),
+                                                 start_pos, newpos, speed)
+            if merged_move is not None:
+                start_pos = merged_move.start_pos
         move = Move(toolhead=self,
-                    start_pos=self.commanded_pos,
+                    start_pos=start_pos,
                     end_pos=newpos,
                     speed=speed)
         # NOTE: So far, the clock time for when this move
@@ -1250,7 +1427,6 @@ class ToolHead:
 
         # NOTE: Move checks.
         if not move.move_d:
-            logging.info(f"toolhead.move: early return, nothing to move. move.move_d={move.move_d}")
             return
 
         # NOTE: Kinematic move checks for XYZ and ABC axes.
@@ -1260,7 +1436,6 @@ class ToolHead:
             # for axes in ["XYZ"]:
             for axes in list(self.kinematics):
                 # Iterate over["XYZ", "ABC"]
-                logging.info(f"toolhead.move: check_move on {axes} move.")
                 kin = self.kinematics[axes]
                 kin.check_move(move)
             # self.kin.check_move(move)
@@ -1270,7 +1445,6 @@ class ToolHead:
 
         # NOTE: Kinematic move checks for E axis.
         if move.axes_d[-1]:
-            logging.info(f"toolhead.move: check_move on E move with displacement: {move.axes_d[-1]}")
             # NOTE: The extruder will check the move assuming that the last coordinate is the E axis.
             self.extruder.check_move(move)
 
@@ -1280,7 +1454,11 @@ class ToolHead:
 
         # NOTE: Add the Move object to the MoveQueue.
         #       This can trigger "_process_moves".
+        if merged_move is not None:
+            self.lookahead.pop_last()
         self.lookahead.add_move(move)
+        if path_blend is not None:
+            path_blend.note_move(move, speed, merged_move)
         if self.print_time > self.need_check_pause:
             self._check_pause()
 
@@ -1492,8 +1670,19 @@ class ToolHead:
         is_active = buffer_time > -60. or not self.special_queuing_state
         if self.special_queuing_state == "Drip":
             buffer_time = 0.
-        return is_active, "print_time=%.3f buffer_time=%.3f print_stall=%d" % (
-            self.print_time, max(buffer_time, 0.), self.print_stall)
+        # Rate of trapq FFI calls (and of queued trapq moves)
+        counts = (self.trapq_batch.ffi_calls, self.trapq_batch.appends)
+        ffi_rate = append_rate = 0.
+        elapsed = eventtime - self.last_stats_time
+        if self.last_stats_time and elapsed > 0.:
+            ffi_rate = (counts[0] - self.last_stats_counts[0]) / elapsed
+            append_rate = (counts[1] - self.last_stats_counts[1]) / elapsed
+        self.last_stats_time = eventtime
+        self.last_stats_counts = counts
+        return is_active, ("print_time=%.3f buffer_time=%.3f print_stall=%d"
+                           " trapq_ffi_calls=%.1f/s trapq_appends=%.1f/s" % (
+                               self.print_time, max(buffer_time, 0.),
+                               self.print_stall, ffi_rate, append_rate))
     def check_busy(self, eventtime):
         est_print_time = self.mcu.estimated_print_time(eventtime)
         lookahead_empty = not self.lookahead.queue
@@ -1600,8 +1789,12 @@ class ToolHead:
         # TODO: update the rest of the code to use "get_trapq" with "axes" instead.
         return self.abc_trapq
 
+    def set_path_blend(self, path_blend):
+        self.path_blend = path_blend
     def register_step_generator(self, handler):
         self.step_generators.append(handler)
+    def register_move_callback(self, callback):
+        self.move_callbacks.append(callback)
     def note_step_generation_scan_time(self, delay, old_delay=0.):
         self.flush_step_generation()
         if old_delay:
@@ -1615,6 +1808,8 @@ class ToolHead:
         if last_move is None:
             callback(self.get_last_move_time())
             return
+        if not last_move.timing_callbacks:
+            last_move.timing_callbacks = []
         last_move.timing_callbacks.append(callback)
     def note_mcu_movequeue_activity(self, mq_time, set_step_gen_time=False):
         self.need_flush_time = max(self.need_flush_time, mq_time)
@@ -0,0 +1,112 @@
+# Low overhead debug tracing of the motion hot paths
+#
+# Copyright (C) 2026  Nicolás A. Méndez
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+import logging, fnmatch
+
+# Trace categories are created at module import time by the code that
+# uses them, and are all disabled by default. Callers must gate the
+# formatting of the message on the "enabled" attribute, such that a
+# disabled category costs a single attribute check:
+#
+#   trace_lookahead = tracing.get_category("motion.lookahead")
+#   ...
+#   if trace_lookahead.enabled:
+#       trace_lookahead.log("flush: count=%d", flush_count)
+class TraceCategory:
+    __slots__ = ('name', 'enabled')
+    def __init__(self, name):
+        self.name = name
+        self.enabled = False
+    def log(self, msg, *args):
+        logging.info("[%s] " + msg, self.name, *args)
+
+_categories = {}
+# Patterns are remembered so that categories of modules loaded later
+# (eg: from the config file) pick up the requested state.
+_patterns = []
+
+def get_category(name):
+    tc = _categories.get(name)
+    if tc is None:
+        tc = _categories[name] = TraceCategory(name)
+        for pattern, enabled in _patterns:
+            if _match(name, pattern):
+                tc.enabled = enabled
+    return tc
+
+# A pattern matches a category by glob (eg: "motion.*") or as a parent
+# in the dotted hierarchy (eg: "motion" matches "motion.lookahead").
+def _match(name, pattern):
+    return (fnmatch.fnmatchcase(name, pattern)
+            or name.startswith(pattern + "."))
+
+def set_enabled(pattern, enabled=True, require_match=False):
+    """Enable or disable all categories matching a pattern.
+    Returns the sorted list of matching category names. With
+    "require_match", a pattern that matches no category is ignored."""
+    names = sorted(n for n in _categories if _match(n, pattern))
+    if require_match and not names:
+        return names
+    # The latest state of a pattern replaces any earlier one
+    _patterns[:] = [(p, e) for p, e in _patterns if p != pattern]
+    _patterns.append((pattern, enabled))
+    for name in names:
+        _categories[name].enabled = enabled
+    return names
+
+def get_categories():
+    return {name: tc.enabled for name, tc in sorted(_categories.items())}
+
+# Runtime control of the trace categories (G-Code and webhooks)
+class PrinterTracing:
+    def __init__(self, printer):
+        self.printer = printer
+        start_args = printer.get_start_args()
+        for pattern in start_args.get('trace', '').split(','):
+            if pattern.strip():
+                set_enabled(pattern.strip(), True)
+        gcode = printer.lookup_object('gcode')
+        gcode.register_command('SET_TRACE', self.cmd_SET_TRACE,
+                               when_not_ready=True,
+                               desc=self.cmd_SET_TRACE_help)
+        webhooks = printer.lookup_object('webhooks')
+        webhooks.register_endpoint("tracing/list", self._handle_list)
+        webhooks.register_endpoint("tracing/set", self._handle_set)
+    def _set_enabled(self, pattern, enabled):
+        names = set_enabled(pattern, enabled, require_match=True)
+        if not names:
+            raise self.printer.command_error(
+                "No trace category matches '%s'" % (pattern,))
+        logging.info("Tracing %s: %s", ["disabled", "enabled"][enabled],
+                     " ".join(names))
+        return names
+    cmd_SET_TRACE_help = "Enable or disable debug tracing categories"
+    def cmd_SET_TRACE(self, gcmd):
+        pattern = gcmd.get('CATEGORY', None)
+        if pattern is None:
+            cats = get_categories()
+            msg = ["%s: %s" % (n, ["off", "on"][e]) for n, e in cats.items()]
+            gcmd.respond_info("Trace categories:\n" + "\n".join(msg),
+                              log=False)
+            return
+        enable = gcmd.get_int('ENABLE', 1, minval=0, maxval=1)
+        names = self._set_enabled(pattern, bool(enable))
+        gcmd.respond_info("Tracing %s: %s" % (["disabled", "enabled"][enable],
+                                              " ".join(names)), log=False)
+    def _handle_list(self, web_request):
+        web_request.send({'categories': get_categories()})
+    def _handle_set(self, web_request):
+        pattern = web_request.get_str('category')
+        enable = web_request.get('enable', True, types=(bool, int))
+        try:
+            names = self._set_enabled(pattern, bool(enable))
+        except self.printer.command_error as e:
+            raise web_request.error(str(e))
+        web_request.send({'categories': names})
+    def get_status(self, eventtime):
+        return {'enabled': [n for n, e in get_categories().items() if e]}
+
+def add_early_printer_objects(printer):
+    printer.add_object('tracing', PrinterTracing(printer))
@@ -3,10 +3,29 @@
 # Copyright (C) 2020 Eric Callahan <arksine.code@gmail.com>
 #
 # This file may be distributed under the terms of the GNU GPLv3 license
-import logging, socket, os, sys, errno, json, collections
+import logging, socket, os, sys, errno, json, collections, time, itertools
+import struct
 import gcode, klippy
 
 REQUEST_LOG_SIZE = 20
+# Maximum number of queued messages passed to a single sendmsg() call
+SEND_IOV_MAX = 64
+
+# Message encodings that a client may select with the "info" endpoint.
+# The "msgpack" encoding is only available if the msgpack module is
+# installed.
+try:
+    import msgpack
+    ENCODINGS = ['json', 'msgpack']
+except ImportError:
+    msgpack = None
+    ENCODINGS = ['json']
+
+# Priority classes of requests, in the order they are processed
+PRIORITIES = ['estop', 'motion', 'query', 'bulk']
+# Number of requests of a client waiting to be processed at which the
+# client's socket is no longer read (until half of them are processed)
+CLIENT_QUEUE_SIZE = 64
 
 # Json decodes strings as unicode types in Python 2.x.  This doesn't
 # play well with some parts of Klipper (particuarly displays), so we
@@ -52,9 +71,8 @@ class Sentinel:
 
 class WebRequest:
     error = WebRequestError
-    def __init__(self, client_conn, request):
+    def __init__(self, client_conn, base_request):
         self.client_conn = client_conn
-        base_request = json.loads(request, object_hook=json_loads_byteify)
         if type(base_request) != dict:
             raise ValueError("Not a top-level dictionary")
         self.id = base_request.get('id', None)
@@ -196,9 +214,14 @@ class ClientConnection:
         self.sock = sock
         self.fd_handle = self.reactor.register_fd(
             self.sock.fileno(), self.process_received, self._do_send)
-        self.partial_data = self.send_buffer = b""
+        self.partial_data = b""
+        # Queue of encoded messages (or memoryviews of their unsent data)
+        self.send_queue = collections.deque()
+        self.encoding = 'json'
+        self.next_encoding = None
         self.is_blocking = False
         self.blocking_count = 0
+        self.is_receive_paused = False
         self.set_client_info("?", "New connection")
         self.request_log = collections.deque([], REQUEST_LOG_SIZE)
 
@@ -250,19 +273,52 @@ class ClientConnection:
             # Socket Closed
             self.close()
             return
-        requests = data.split(b'\x03')
-        requests[0] = self.partial_data + requests[0]
-        self.partial_data = requests.pop()
+        if self.encoding == 'msgpack':
+            requests = self._split_msgpack(data)
+        else:
+            requests = data.split(b'\x03')
+            requests[0] = self.partial_data + requests[0]
+            self.partial_data = requests.pop()
         for req in requests:
             self.request_log.append((eventtime, req))
             try:
-                web_request = WebRequest(self, req)
+                if self.encoding == 'msgpack':
+                    base_request = msgpack.unpackb(req, raw=False)
+                else:
+                    base_request = json.loads(req,
+                                              object_hook=json_loads_byteify)
+                web_request = WebRequest(self, base_request)
             except Exception:
                 logging.exception("webhooks: Error decoding Server Request %s"
                                   % (req))
                 continue
-            self.reactor.register_callback(
-                lambda e, s=self, wr=web_request: s._process_request(wr))
+            self.webhooks.queue_request(self, web_request, eventtime)
+
+    def _split_msgpack(self, data):
+        # Messages are prefixed with their length (32bit big-endian)
+        data = self.partial_data + data
+        requests = []
+        pos = 0
+        while len(data) - pos >= 4:
+            length, = struct.unpack_from(">I", data, pos)
+            if len(data) - pos - 4 < length:
+                break
+            requests.append(data[pos + 4:pos + 4 + length])
+            pos += 4 + length
+        self.partial_data = data[pos:]
+        return requests
+
+    def get_encoding(self):
+        if self.next_encoding is not None:
+            return self.next_encoding
+        return self.encoding
+
+    def set_encoding(self, encoding):
+        # The encoding changes after the response to the current request
+        # is sent, so that the response uses the encoding of the request
+        if encoding not in ENCODINGS:
+            raise WebRequestError("Unsupported encoding '%s'" % (encoding,))
+        self.next_encoding = encoding
 
     def _process_request(self, web_request):
         try:
@@ -292,68 +348,178 @@ class ClientConnection:
             web_request.set_error(WebRequestError(str(e)))
             self.printer.invoke_shutdown(msg)
         result = web_request.finish()
-        if result is None:
-            return
-        # NOTE: Up to now, the error dict is not serialized,
-        #       and it isnt broken either by "send" below.
-        #       It is likely that Moonraker breaks the object.
-        # logging.info(f"Sending data to socket: data={result}")
-        self.send(result)
-
-    def send(self, data):
+        if result is not None:
+            # NOTE: Up to now, the error dict is not serialized,
+            #       and it isnt broken either by "send" below.
+            #       It is likely that Moonraker breaks the object.
+            # logging.info(f"Sending data to socket: data={result}")
+            self.send(result)
+        if self.next_encoding is not None:
+            logging.info("webhooks client %s: Using %s encoding",
+                         self.uid, self.next_encoding)
+            self.encoding = self.next_encoding
+            self.next_encoding = None
+
+    def encode(self, data):
+        # Encode a message, such that it may be sent to several clients
+        # (see send_encoded()). Returns None on an encoding error.
         try:
+            if self.encoding == 'msgpack':
+                bmsg = msgpack.packb(data, use_bin_type=True)
+                return struct.pack(">I", len(bmsg)) + bmsg
             jmsg = json.dumps(data, separators=(',', ':'))
-            self.send_buffer += jmsg.encode() + b"\x03"
         except (TypeError, ValueError) as e:
-            msg = ("json encoding error: %s" % (str(e),))
+            msg = ("%s encoding error: %s" % (self.encoding, str(e)))
             logging.exception(msg)
             self.printer.invoke_shutdown(msg)
-            return
+            return None
+        return jmsg.encode() + b"\x03"
+
+    def send(self, data):
+        msg = self.encode(data)
+        if msg is not None:
+            self.send_encoded(msg)
+
+    def set_receive_paused(self, is_paused):
+        # Stop (or resume) reading requests from the socket
+        self.is_receive_paused = is_paused
+        if self.fd_handle is not None and not self.is_blocking:
+            self.reactor.set_fd_wake(self.fd_handle, not is_paused, False)
+
+    def send_encoded(self, msg):
+        self.send_queue.append(msg)
         if not self.is_blocking:
             self._do_send()
 
     def _do_send(self, eventtime=None):
         if self.fd_handle is None:
             return
-        try:
-            sent = self.sock.send(self.send_buffer)
-        except socket.error as e:
-            if e.errno not in [errno.EAGAIN, errno.EWOULDBLOCK]:
-                logging.info("webhooks: socket write error %d" % (self.uid,))
-                self.close()
-                return
-            sent = 0
-        if sent < len(self.send_buffer):
+        send_queue = self.send_queue
+        sent = 0
+        if send_queue:
+            try:
+                sent = self.sock.sendmsg(
+                    list(itertools.islice(send_queue, SEND_IOV_MAX)))
+            except socket.error as e:
+                if e.errno not in [errno.EAGAIN, errno.EWOULDBLOCK]:
+                    logging.info("webhooks: socket write error %d"
+                                 % (self.uid,))
+                    self.close()
+                    return
+        # Drop the sent messages, without copying a partially sent one
+        while sent:
+            msg = send_queue[0]
+            if sent < len(msg):
+                send_queue[0] = memoryview(msg)[sent:]
+                break
+            sent -= len(msg)
+            send_queue.popleft()
+        if send_queue:
             if not self.is_blocking:
                 self.reactor.set_fd_wake(self.fd_handle, False, True)
                 self.is_blocking = True
                 self.blocking_count = 5
         elif self.is_blocking:
-            self.reactor.set_fd_wake(self.fd_handle, True, False)
+            self.reactor.set_fd_wake(self.fd_handle,
+                                     not self.is_receive_paused, False)
             self.is_blocking = False
-        self.send_buffer = self.send_buffer[sent:]
+
+# Process the received requests one at a time (one per reactor
+# callback, so that timers and file events run in between), by
+# priority class and then in the order they were received
+class RequestScheduler:
+    def __init__(self, printer):
+        self.printer = printer
+        self.reactor = printer.get_reactor()
+        self.queues = {priority: collections.deque()
+                       for priority in PRIORITIES}
+        self.client_pending = {}
+        self.is_scheduled = False
+        self.stats = {priority: {'queued': 0, 'processed': 0,
+                                 'max_pending': 0, 'max_delay': 0.}
+                      for priority in PRIORITIES}
+        self.receive_pauses = 0
+
+    def queue_request(self, cconn, web_request, priority, eventtime):
+        stats = self.stats[priority]
+        pending = self.client_pending.get(cconn, 0) + 1
+        self.client_pending[cconn] = pending
+        if pending >= CLIENT_QUEUE_SIZE and not cconn.is_receive_paused:
+            # Backpressure - stop reading requests from this client
+            self.receive_pauses += 1
+            cconn.set_receive_paused(True)
+        queue = self.queues[priority]
+        queue.append((eventtime, cconn, web_request))
+        stats['queued'] += 1
+        stats['max_pending'] = max(stats['max_pending'], len(queue))
+        if not self.is_scheduled:
+            self.is_scheduled = True
+            self.reactor.register_callback(self._dispatch)
+
+    def _dispatch(self, eventtime):
+        for priority in PRIORITIES:
+            queue = self.queues[priority]
+            if queue:
+                break
+        else:
+            self.is_scheduled = False
+            return
+        recvtime, cconn, web_request = queue.popleft()
+        pending = self.client_pending.pop(cconn) - 1
+        if pending:
+            self.client_pending[cconn] = pending
+        if cconn.is_receive_paused and pending <= CLIENT_QUEUE_SIZE // 2:
+            cconn.set_receive_paused(False)
+        stats = self.stats[priority]
+        stats['processed'] += 1
+        stats['max_delay'] = max(stats['max_delay'], eventtime - recvtime)
+        # Schedule the next request first, as processing a request may
+        # pause this callback
+        if any(self.queues.values()):
+            self.reactor.register_callback(self._dispatch)
+        else:
+            self.is_scheduled = False
+        cconn._process_request(web_request)
+
+    def get_stats(self):
+        stats = {'receive_pauses': self.receive_pauses,
+                 'paused_clients': len([
+                     c for c in self.client_pending if c.is_receive_paused])}
+        for priority in PRIORITIES:
+            stats[priority] = dict(self.stats[priority],
+                                   pending=len(self.queues[priority]))
+        return stats
 
 class WebHooks:
     def __init__(self, printer: klippy.Printer):
         self.printer = printer
         self._endpoints = {"list_endpoints": self._handle_list_endpoints}
+        self._priorities = {}
         self._remote_methods = {}
         self._mux_endpoints = {}
+        self.scheduler = RequestScheduler(printer)
         self.register_endpoint("info", self._handle_info_request)
-        self.register_endpoint("emergency_stop", self._handle_estop_request)
+        self.register_endpoint("emergency_stop", self._handle_estop_request,
+                               priority='estop')
         self.register_endpoint("register_remote_method",
                                self._handle_rpc_registration)
+        self.register_endpoint("webhooks/request_stats",
+                               self._handle_request_stats)
         self.sconn = ServerSocket(self, printer)
 
-    def register_endpoint(self, path, callback):
+    def register_endpoint(self, path, callback, priority='query'):
         if path in self._endpoints:
             raise WebRequestError("Path already registered to an endpoint")
+        if priority not in PRIORITIES:
+            raise WebRequestError("Invalid priority '%s'" % (priority,))
         self._endpoints[path] = callback
+        self._priorities[path] = priority
 
-    def register_mux_endpoint(self, path, key, value, callback):
+    def register_mux_endpoint(self, path, key, value, callback,
+                              priority='query'):
         prev = self._mux_endpoints.get(path)
         if prev is None:
-            self.register_endpoint(path, self._handle_mux)
+            self.register_endpoint(path, self._handle_mux, priority)
             self._mux_endpoints[path] = prev = (key, {})
         prev_key, prev_values = prev
         if prev_key != key:
@@ -380,10 +546,17 @@ class WebHooks:
     def _handle_list_endpoints(self, web_request):
         web_request.send({'endpoints': list(self._endpoints.keys())})
 
+    def _handle_request_stats(self, web_request):
+        web_request.send(self.scheduler.get_stats())
+
     def _handle_info_request(self, web_request):
+        cconn = web_request.get_client_connection()
         client_info = web_request.get_dict('client_info', None)
         if client_info is not None:
-            web_request.get_client_connection().set_client_info(client_info)
+            cconn.set_client_info(client_info)
+        encoding = web_request.get_str('encoding', None)
+        if encoding is not None:
+            cconn.set_encoding(encoding)
         state_message, state = self.printer.get_state_message()
         src_path = os.path.dirname(__file__)
         klipper_path = os.path.normpath(os.path.join(src_path, ".."))
@@ -394,7 +567,9 @@ class WebHooks:
                     'python_path': sys.executable,
                     'process_id': os.getpid(),
                     'user_id': os.getuid(),
-                    'group_id': os.getgid()}
+                    'group_id': os.getgid(),
+                    'encoding': cconn.get_encoding(),
+                    'encodings': list(ENCODINGS)}
         start_args = self.printer.get_start_args()
         for sa in ['log_file', 'config_file', 'software_version', 'cpu_info']:
             response[sa] = start_args.get(sa)
@@ -414,6 +589,11 @@ class WebHooks:
     def get_connection(self):
         return self.sconn
 
+    def queue_request(self, cconn, web_request, eventtime):
+        # Unknown methods are queued as queries (and return an error)
+        priority = self._priorities.get(web_request.get_method(), 'query')
+        self.scheduler.queue_request(cconn, web_request, priority, eventtime)
+
     def get_callback(self, path):
         cb = self._endpoints.get(path, None)
         if cb is None:
@@ -457,12 +637,14 @@ class GCodeHelper:
         # Register webhooks
         wh: WebHooks = printer.lookup_object('webhooks')
         wh.register_endpoint("gcode/help", self._handle_help)
-        wh.register_endpoint("gcode/script", self._handle_script)
-        wh.register_endpoint("gcode/restart", self._handle_restart)
+        wh.register_endpoint("gcode/script", self._handle_script,
+                             priority='motion')
+        wh.register_endpoint("gcode/restart", self._handle_restart,
+                             priority='motion')
         wh.register_endpoint("gcode/firmware_restart",
-                             self._handle_firmware_restart)
+                             self._handle_firmware_restart, priority='motion')
         wh.register_endpoint("gcode/subscribe_output",
-                             self._handle_subscribe_output)
+                             self._handle_subscribe_output, priority='bulk')
     def _handle_help(self, web_request):
         web_request.send(self.gcode.get_command_help())
     def _handle_script(self, web_request):
@@ -474,13 +656,18 @@ class GCodeHelper:
     def _handle_firmware_restart(self, web_request):
         self.gcode.run_script('firmware_restart')
     def _output_callback(self, msg):
+        encoded = {}
         for cconn, template in list(self.clients.items()):
             if cconn.is_closed():
                 del self.clients[cconn]
                 continue
-            tmp = dict(template)
-            tmp['params'] = {'response': msg}
-            cconn.send(tmp)
+            key = (cconn.encoding, repr(template))
+            if key not in encoded:
+                tmp = dict(template)
+                tmp['params'] = {'response': msg}
+                encoded[key] = cconn.encode(tmp)
+            if encoded[key] is not None:
+                cconn.send_encoded(encoded[key])
     def _handle_subscribe_output(self, web_request):
         cconn = web_request.get_client_connection()
         template = web_request.get_dict('response_template', {})
@@ -498,18 +685,65 @@ class QueryStatusHelper:
         self.pending_queries = []
         self.query_timer = None
         self.last_query = {}
+        # Status versions of the objects in the last query (for objects
+        # that implement get_status_version()) and get_status() stats
+        self.last_versions = {}
+        self.status_stats = {}
+        # Subscription of each client, as a key to share encoded messages
+        self.client_keys = {}
         # Register webhooks
         webhooks = printer.lookup_object('webhooks')
         webhooks.register_endpoint("objects/list", self._handle_list)
         webhooks.register_endpoint("objects/query", self._handle_query)
-        webhooks.register_endpoint("objects/subscribe", self._handle_subscribe)
+        webhooks.register_endpoint("objects/subscribe", self._handle_subscribe,
+                                   priority='bulk')
+        webhooks.register_endpoint("objects/status_stats",
+                                   self._handle_status_stats)
     def _handle_list(self, web_request):
         objects = [n for n, o in self.printer.lookup_objects()
                    if hasattr(o, 'get_status')]
         web_request.send({'objects': objects})
+    def _handle_status_stats(self, web_request):
+        stats = {}
+        for obj_name, (count, skipped, total, max_time) in sorted(
+                self.status_stats.items()):
+            stats[obj_name] = {'calls': count, 'skipped': skipped,
+                               'total_time': total, 'max_time': max_time}
+        web_request.send({'objects': stats})
+    def _get_status(self, obj_name, eventtime, last_query, unchanged):
+        po = self.printer.lookup_object(obj_name, None)
+        if po is None or not hasattr(po, 'get_status'):
+            return {}
+        count, skipped, total, max_time = self.status_stats.get(
+            obj_name, (0, 0, 0., 0.))
+        # Objects may publish a version of their status, such that an
+        # unchanged status is reused without calling get_status()
+        get_version = getattr(po, 'get_status_version', None)
+        version = None
+        if get_version is not None:
+            version = get_version()
+            if (obj_name in last_query
+                and obj_name in self.last_versions
+                and self.last_versions[obj_name] == version):
+                self.status_stats[obj_name] = (count, skipped + 1,
+                                               total, max_time)
+                unchanged.add(obj_name)
+                return last_query[obj_name]
+        start_time = time.perf_counter()
+        res = po.get_status(eventtime)
+        query_time = time.perf_counter() - start_time
+        if get_version is not None:
+            self.last_versions[obj_name] = version
+        self.status_stats[obj_name] = (count + 1, skipped, total + query_time,
+                                       max(max_time, query_time))
+        return res
     def _do_query(self, eventtime):
         last_query = self.last_query
         query = self.last_query = {}
+        unchanged = set()
+        # Encoded messages, shared by the clients with the same template
+        # and the same set of changed fields
+        encoded = {}
         msglist = self.pending_queries
         self.pending_queries = []
         msglist.extend(self.clients.values())
@@ -518,17 +752,18 @@ class QueryStatusHelper:
             is_query = cconn is None
             if not is_query and cconn.is_closed():
                 del self.clients[cconn]
+                self.client_keys.pop(cconn, None)
                 continue
             # Query each requested printer object
             cquery = {}
             for obj_name, req_items in subscription.items():
                 res = query.get(obj_name, None)
                 if res is None:
-                    po = self.printer.lookup_object(obj_name, None)
-                    if po is None or not hasattr(po, 'get_status'):
-                        res = query[obj_name] = {}
-                    else:
-                        res = query[obj_name] = po.get_status(eventtime)
+                    res = query[obj_name] = self._get_status(
+                        obj_name, eventtime, last_query, unchanged)
+                if obj_name in unchanged and not is_query:
+                    # Nothing to diff against the last query
+                    continue
                 if req_items is None:
                     req_items = list(res.keys())
                     if req_items:
@@ -542,10 +777,25 @@ class QueryStatusHelper:
                 if cres or is_query:
                     cquery[obj_name] = cres
             # Send data
-            if cquery or is_query:
+            if is_query:
                 tmp = dict(template)
                 tmp['params'] = {'eventtime': eventtime, 'status': cquery}
                 send_func(tmp)
+            elif cquery:
+                # All clients diff against the same last query, so clients
+                # with the same subscription receive the same message
+                key = self.client_keys.get(cconn)
+                if key is None:
+                    key = self.client_keys[cconn] = repr((template,
+                                                          subscription))
+                key = (cconn.encoding, key)
+                msg = encoded.get(key)
+                if msg is None:
+                    tmp = dict(template)
+                    tmp['params'] = {'eventtime': eventtime, 'status': cquery}
+                    msg = encoded[key] = cconn.encode(tmp)
+                if msg is not None:
+                    cconn.send_encoded(msg)
         if not query:
             # Unregister timer if there are no longer any subscriptions
             reactor = self.printer.get_reactor()
@@ -568,6 +818,7 @@ class QueryStatusHelper:
         template = web_request.get_dict('response_template', {})
         if is_subscribe and cconn in self.clients:
             del self.clients[cconn]
+            self.client_keys.pop(cconn, None)
         reactor = self.printer.get_reactor()
         complete = reactor.completion()
         self.pending_queries.append((None, objects, complete.complete, {}))
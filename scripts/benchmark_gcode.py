@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# Benchmark of the G-Code line tokenizer
+#
+# Copyright (C) 2026  Nicolás A. Méndez
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+import sys, os, optparse, math, time
+sys.path.append(os.path.join(os.path.dirname(__file__), '../klippy'))
+import gcode
+
+FAST_COMMANDS = ['G0', 'G1', 'G2', 'G3']
+
+# Generate a CNC style toolpath (mostly G1 moves with a few arcs)
+def gen_lines(count):
+    out = []
+    for i in range(count):
+        a = i * .01
+        if i % 100 == 0:
+            out.append("G0 Z5.000 F6000")
+        elif i % 20 == 0:
+            out.append("G2 X%.3f Y%.3f I2.500 J0.000" % (
+                50. + 20. * math.cos(a), 50. + 20. * math.sin(a)))
+        else:
+            out.append("G1 X%.3f Y%.3f Z%.3f A%.2f F1500" % (
+                50. + 20. * math.cos(a), 50. + 20. * math.sin(a),
+                -(i % 7) * .1, (i * .5) % 360.))
+    return out
+
+# Strip comments as done by GCodeDispatch._process_commands()
+def strip_lines(lines):
+    out = []
+    for line in lines:
+        line = line.strip()
+        cpos = line.find(';')
+        if cpos >= 0:
+            line = line[:cpos]
+        out.append(line)
+    return out
+
+def run_benchmark(lines, fast, repeat):
+    tokenizer = gcode.GCodeTokenizer()
+    if fast:
+        tokenizer.fast_param_commands.update(FAST_COMMANDS)
+    tokenize = tokenizer.tokenize
+    best = None
+    for r in range(repeat):
+        start_time = time.perf_counter()
+        for line in lines:
+            tokenize(line)
+        elapsed = time.perf_counter() - start_time
+        if best is None or elapsed < best:
+            best = elapsed
+    return len(lines) / best
+
+def main():
+    usage = "%prog [options] [gcode_file]"
+    opts = optparse.OptionParser(usage)
+    opts.add_option("-n", "--lines", type="int", dest="lines", default=1000000,
+                    help="number of generated lines (without gcode_file)")
+    opts.add_option("-r", "--repeat", type="int", dest="repeat", default=3,
+                    help="number of runs (the best one is reported)")
+    options, args = opts.parse_args()
+    if len(args) > 1:
+        opts.error("Incorrect number of arguments")
+    if args:
+        with open(args[0], 'r') as f:
+            lines = f.read().split('\n')
+    else:
+        lines = gen_lines(options.lines)
+    lines = strip_lines(lines)
+    for fast in [False, True]:
+        rate = run_benchmark(lines, fast, options.repeat)
+        sys.stdout.write("%s tokenizer: %.0f lines/second\n"
+                         % (["generic", "fast path"][fast], rate))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# Benchmark of the host Move/LookAheadQueue planning code
+#
+# Copyright (C) 2026  Nicolás A. Méndez
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+import sys, os, optparse, math, time
+sys.path.append(os.path.join(os.path.dirname(__file__), '../klippy'))
+import toolhead
+
+AXIS_SETS = {3: "XYZ", 6: "XYZABC", 9: "XYZABCUVW"}
+
+# Minimal stand-in for the extruder and ToolHead classes. Only the
+# attributes used by Move and LookAheadQueue are provided.
+class BenchExtruder:
+    def calc_junction(self, prev_move, move):
+        return move.max_cruise_v2
+
+class BenchToolHead:
+    def __init__(self, axis_names, max_velocity=300., max_accel=3000.):
+        self.axis_names = axis_names
+        self.axis_count = len(axis_names)
+        self.pos_length = self.axis_count + 1
+        self.limited_axes = list(range(self.axis_count))
+        self.max_velocity = max_velocity
+        self.max_accel = max_accel
+        scv2 = 5.**2
+        self.junction_deviation = scv2 * (math.sqrt(2.) - 1.) / max_accel
+        self.max_accel_to_decel = max_accel * .5
+        self.extruder = BenchExtruder()
+        self.processed = 0
+        self.keep_moves = False
+        self.moves = []
+    def _process_moves(self, moves):
+        self.processed += len(moves)
+        if self.keep_moves:
+            self.moves.extend(moves)
+
+# Generate a dense toolpath of short segments (similar to CAM surfacing)
+def gen_positions(count, pos_length):
+    out = []
+    for i in range(count):
+        a = i * .05
+        r = 20. + i * .001
+        pos = [0.] * pos_length
+        pos[0] = 100. + r * math.cos(a)
+        pos[1] = 100. + r * math.sin(a)
+        for j in range(2, pos_length - 1):
+            pos[j] = ((i + j) * .01) % 10.
+        pos[-1] = i * .001
+        out.append(pos)
+    return out
+
+def plan_moves(th, planner, positions, speed):
+    lookahead = toolhead.LOOKAHEAD_PLANNERS[planner](th)
+    th.processed = 0
+    last_pos = [0.] * th.pos_length
+    start_time = time.perf_counter()
+    for pos in positions:
+        move = toolhead.Move(th, last_pos, pos, speed)
+        lookahead.add_move(move)
+        last_pos = pos
+    lookahead.flush()
+    return time.perf_counter() - start_time
+
+def run_benchmark(axis_count, planner, count, repeat):
+    th = BenchToolHead(AXIS_SETS[axis_count])
+    positions = gen_positions(count, th.pos_length)
+    best = None
+    for r in range(repeat):
+        elapsed = plan_moves(th, planner, positions, 100.)
+        if best is None or elapsed < best:
+            best = elapsed
+    return th.processed / best
+
+# Verify that all planners produce the same velocities and timings
+CHECK_ATTRS = ['start_v', 'cruise_v', 'end_v',
+               'accel_t', 'cruise_t', 'decel_t']
+def check_planners(axis_count, count):
+    th = BenchToolHead(AXIS_SETS[axis_count])
+    th.keep_moves = True
+    positions = gen_positions(count, th.pos_length)
+    # Mix speeds to exercise the accel/decel paths of the planner
+    results = {}
+    for planner in sorted(toolhead.LOOKAHEAD_PLANNERS):
+        th.moves = []
+        for speeds in [(100.,), (5., 300.), (20., 150., 2.)]:
+            last_pos = [0.] * th.pos_length
+            lookahead = toolhead.LOOKAHEAD_PLANNERS[planner](th)
+            for i, pos in enumerate(positions):
+                move = toolhead.Move(th, last_pos, pos, speeds[i % len(speeds)])
+                lookahead.add_move(move)
+                last_pos = pos
+            lookahead.flush()
+        results[planner] = [[getattr(m, a) for a in CHECK_ATTRS]
+                            for m in th.moves]
+    ref = results['python']
+    errors = 0
+    for planner, res in results.items():
+        if len(res) != len(ref):
+            sys.stdout.write("%s: processed %d moves (expected %d)\n"
+                             % (planner, len(res), len(ref)))
+            errors += 1
+            continue
+        for i, (vals, ref_vals) in enumerate(zip(res, ref)):
+            for a, v, rv in zip(CHECK_ATTRS, vals, ref_vals):
+                if abs(v - rv) > 1e-9 * max(1., abs(rv)):
+                    if errors < 10:
+                        sys.stdout.write("%s: move %d %s=%.17g (expected"
+                                         " %.17g)\n" % (planner, i, a, v, rv))
+                    errors += 1
+    return errors
+
+def main():
+    usage = "%prog [options]"
+    opts = optparse.OptionParser(usage)
+    opts.add_option("-n", "--moves", type="int", dest="moves", default=50000,
+                    help="number of moves per run")
+    opts.add_option("-r", "--repeat", type="int", dest="repeat", default=3,
+                    help="number of runs (the best one is reported)")
+    opts.add_option("-a", "--axes", type="string", dest="axes",
+                    default="3,6,9", help="axis counts to benchmark")
+    opts.add_option("-p", "--planner", type="string", dest="planners",
+                    default="python,native",
+                    help="lookahead planners to benchmark")
+    opts.add_option("-c", "--check", action="store_true", dest="check",
+                    help="compare the results of all planners")
+    options, args = opts.parse_args()
+    if args:
+        opts.error("Incorrect number of arguments")
+    planners = options.planners.split(',')
+    for planner in planners:
+        if planner not in toolhead.LOOKAHEAD_PLANNERS:
+            opts.error("Unknown planner '%s'" % (planner,))
+    axis_counts = [int(a) for a in options.axes.split(',')]
+    for axis_count in axis_counts:
+        if axis_count not in AXIS_SETS:
+            opts.error("Unsupported axis count %d" % (axis_count,))
+    if options.check:
+        errors = 0
+        for axis_count in axis_counts:
+            errors += check_planners(axis_count, options.moves)
+        if errors:
+            sys.stdout.write("Planner check failed (%d errors)\n" % (errors,))
+            sys.exit(1)
+        sys.stdout.write("Planner check passed\n")
+        return
+    for axis_count in axis_counts:
+        for planner in planners:
+            rate = run_benchmark(axis_count, planner, options.moves,
+                                 options.repeat)
+            sys.stdout.write("%d axes (%s), %s planner: %.0f moves/second\n"
+                             % (axis_count, AXIS_SETS[axis_count], planner,
+                                rate))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# Benchmark of pwm_tool power updates in file output ("-o") mode
+#
+# Copyright (C) 2026  Nicolás A. Méndez
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+import sys, os, optparse, time, tempfile, subprocess, shutil
+
+KLIPPY = os.path.join(os.path.dirname(__file__), '../klippy/klippy.py')
+
+# Generate a raster job of short moves with a power change on each one,
+# either as an S parameter of the moves or as SET_PIN commands
+def gen_job(filename, count, power_cmd, use_set_pin):
+    with open(filename, 'w') as f:
+        f.write("G28\nG1 X10 Y10 F6000\n%s S0\n" % (power_cmd,))
+        for i in range(count):
+            row, col = divmod(i, 200)
+            x = 10. + .1 * (col if not row % 2 else 199 - col)
+            power = (i * 37) % 256
+            if use_set_pin:
+                f.write("SET_PIN PIN=TOOL VALUE=%d\nG1 X%.3f Y%.3f\n" % (
+                    power, x, 10. + .1 * row))
+            else:
+                f.write("G1 X%.3f Y%.3f S%d\n" % (x, 10. + .1 * row, power))
+        f.write("M5\n")
+
+def gen_config(filename, printer_config, pin):
+    with open(filename, 'w') as f:
+        f.write("[include %s]\n\n[pwm_tool TOOL]\npin: %s\ncycle_time: 0.001\n"
+                "scale: 255\npower_commands: True\n" % (
+                    os.path.abspath(printer_config), pin))
+
+# Run klippy on the job and return its duration
+def run_benchmark(tmpdir, dictionary, power_cmd, use_set_pin, count):
+    jobname = os.path.join(tmpdir, 'job.gcode')
+    gen_job(jobname, count, power_cmd, use_set_pin)
+    args = [sys.executable, KLIPPY, os.path.join(tmpdir, 'printer.cfg'),
+            '-i', jobname, '-o', os.devnull, '-d', dictionary,
+            '-l', os.path.join(tmpdir, 'klippy.log')]
+    start_time = time.monotonic()
+    subprocess.check_call(args)
+    return time.monotonic() - start_time
+
+def main():
+    usage = "%prog [options] <config> <dictionary>"
+    opts = optparse.OptionParser(usage)
+    opts.add_option("-n", "--moves", type="int", dest="moves", default=20000,
+                    help="number of moves (and power changes) in the job")
+    opts.add_option("-p", "--pin", type="string", dest="pin",
+                    default="gpio40", help="pin of the generated pwm_tool")
+    options, args = opts.parse_args()
+    if len(args) != 2:
+        opts.error("Incorrect number of arguments")
+    printer_config, dictionary = args
+    tmpdir = tempfile.mkdtemp(prefix='benchmark_pwm_tool')
+    try:
+        gen_config(os.path.join(tmpdir, 'printer.cfg'), printer_config,
+                   options.pin)
+        for name, power_cmd, use_set_pin in [("M3 G1 S", "M3", False),
+                                             ("M4 G1 S", "M4", False),
+                                             ("SET_PIN", "M3", True)]:
+            duration = run_benchmark(tmpdir, dictionary, power_cmd,
+                                     use_set_pin, options.moves)
+            sys.stdout.write("%s: %.3fs (%.0f power updates/second)\n" % (
+                name, duration, options.moves / duration))
+    finally:
+        shutil.rmtree(tmpdir)
+
+if __name__ == '__main__':
+    main()
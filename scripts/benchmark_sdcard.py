@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# Benchmark of virtual_sdcard printing in file output ("-o") mode
+#
+# Copyright (C) 2026  Nicolás A. Méndez
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+import sys, os, optparse, math, time, tempfile, subprocess, shutil
+
+KLIPPY = os.path.join(os.path.dirname(__file__), '../klippy/klippy.py')
+JOB_NAME = 'benchmark.gcode'
+
+# Generate a toolpath of short G1 moves around a circle
+def gen_job(filename, count):
+    with open(filename, 'w') as f:
+        f.write("G28\nG1 X100 Y100 F6000\n")
+        for i in range(count):
+            a = i * .01
+            f.write("G1 X%.3f Y%.3f F6000\n" % (
+                100. + 20. * math.cos(a), 100. + 20. * math.sin(a)))
+
+def gen_config(filename, printer_config, sd_path, time_slice):
+    with open(filename, 'w') as f:
+        f.write("[include %s]\n\n[virtual_sdcard]\npath: %s\n"
+                "dispatch_time_slice: %.6f\n" % (
+                    os.path.abspath(printer_config), sd_path, time_slice))
+
+def wait_log(logname, msg, timeout):
+    end_time = time.monotonic() + timeout
+    while time.monotonic() < end_time:
+        try:
+            with open(logname, 'r') as f:
+                if msg in f.read():
+                    return time.monotonic()
+        except IOError:
+            pass
+        time.sleep(.010)
+    raise Exception("Timeout waiting for '%s' in %s" % (msg, logname))
+
+# Run klippy, print the job from the virtual sdcard and return the
+# duration of the print
+def run_benchmark(tmpdir, printer_config, dictionary, time_slice, timeout):
+    cfgname = os.path.join(tmpdir, 'printer.cfg')
+    gen_config(cfgname, printer_config, tmpdir, time_slice)
+    logname = os.path.join(tmpdir, 'klippy.log')
+    if os.path.exists(logname):
+        os.unlink(logname)
+    fifoname = os.path.join(tmpdir, 'input')
+    if not os.path.exists(fifoname):
+        os.mkfifo(fifoname)
+    args = [sys.executable, KLIPPY, cfgname, '-i', fifoname,
+            '-o', os.devnull, '-d', dictionary, '-l', logname]
+    proc = subprocess.Popen(args)
+    # The input is kept open until the print finishes
+    with open(fifoname, 'w') as f:
+        f.write("SDCARD_PRINT_FILE FILENAME=%s\n" % (JOB_NAME,))
+        f.flush()
+        start_time = wait_log(logname, "Starting SD card print", timeout)
+        end_time = wait_log(logname, "Exiting SD card print", timeout)
+    proc.wait()
+    return end_time - start_time
+
+def main():
+    usage = "%prog [options] <config> <dictionary>"
+    opts = optparse.OptionParser(usage)
+    opts.add_option("-n", "--lines", type="int", dest="lines", default=20000,
+                    help="number of moves in the generated job")
+    opts.add_option("-s", "--time-slices", dest="time_slices",
+                    default="0,0.050",
+                    help="comma separated dispatch_time_slice values")
+    opts.add_option("-t", "--timeout", type="float", dest="timeout",
+                    default=600., help="maximum duration of each print")
+    options, args = opts.parse_args()
+    if len(args) != 2:
+        opts.error("Incorrect number of arguments")
+    printer_config, dictionary = args
+    tmpdir = tempfile.mkdtemp(prefix='benchmark_sdcard')
+    try:
+        gen_job(os.path.join(tmpdir, JOB_NAME), options.lines)
+        for time_slice in options.time_slices.split(','):
+            time_slice = float(time_slice)
+            duration = run_benchmark(tmpdir, printer_config, dictionary,
+                                     time_slice, options.timeout)
+            sys.stdout.write("dispatch_time_slice=%.3f: %.3fs"
+                             " (%.0f lines/second)\n" % (
+                                 time_slice, duration,
+                                 options.lines / duration))
+    finally:
+        shutil.rmtree(tmpdir)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# Benchmark of webhooks status subscriptions with several clients
+#
+# Copyright (C) 2026  Nicolás A. Méndez
+#
+# This file may be distributed under the terms of the GNU GPLv3 license.
+import sys, os, optparse, socket, time, errno
+sys.path.append(os.path.join(os.path.dirname(__file__), '../klippy'))
+import reactor, webhooks
+from extras import bulk_sensor
+
+# Printer objects with a status that changes on every query (similar
+# to the toolhead and motion_report), and one with a large static status
+class BenchMotion:
+    def __init__(self, field_count):
+        self.field_count = field_count
+    def get_status(self, eventtime):
+        return {'field%d' % (i,): eventtime + i
+                for i in range(self.field_count)}
+
+class BenchConfig:
+    def __init__(self, field_count):
+        self.status = {'config': {'section%d' % (i,): {'option': 'x' * 40}
+                                  for i in range(field_count)}}
+    def get_status(self, eventtime):
+        return self.status
+
+class BenchWebHooks:
+    def register_endpoint(self, path, callback, priority='query'):
+        pass
+
+# Minimal stand-ins for the Printer and ServerSocket classes. Only the
+# attributes used by ClientConnection and QueryStatusHelper are provided.
+class BenchPrinter:
+    def __init__(self, field_count):
+        self.reactor = reactor.Reactor()
+        self.objects = {'webhooks': BenchWebHooks(),
+                        'toolhead': BenchMotion(field_count),
+                        'motion_report': BenchMotion(field_count),
+                        'configfile': BenchConfig(field_count)}
+    def lookup_object(self, name, default=None):
+        return self.objects.get(name, default)
+    def get_reactor(self):
+        return self.reactor
+    def set_rollover_info(self, name, info, log=True):
+        pass
+    def invoke_shutdown(self, msg):
+        raise Exception(msg)
+
+class BenchServer:
+    def __init__(self, printer):
+        self.printer = printer
+        self.reactor = printer.get_reactor()
+        self.webhooks = printer.lookup_object('webhooks')
+    def pop_client(self, client_id):
+        pass
+
+# Read everything the clients received
+def drain(socks):
+    total = 0
+    for sock in socks:
+        while 1:
+            try:
+                data = sock.recv(1024 * 1024)
+            except socket.error as e:
+                if e.errno in [errno.EAGAIN, errno.EWOULDBLOCK]:
+                    break
+                raise
+            if not data:
+                break
+            total += len(data)
+    return total
+
+def create_clients(server, client_count, encoding):
+    clients = []
+    socks = []
+    for i in range(client_count):
+        ssock, csock = socket.socketpair()
+        ssock.setblocking(0)
+        csock.setblocking(0)
+        socks.append(csock)
+        cconn = webhooks.ClientConnection(server, ssock)
+        cconn.encoding = encoding
+        clients.append(cconn)
+    return clients, socks
+
+def run_benchmark(client_count, field_count, query_count, distinct,
+                  encoding):
+    printer = BenchPrinter(field_count)
+    server = BenchServer(printer)
+    helper = webhooks.QueryStatusHelper(printer)
+    clients, socks = create_clients(server, client_count, encoding)
+    for i, cconn in enumerate(clients):
+        subscription = {'toolhead': None, 'motion_report': None,
+                        'configfile': None}
+        if distinct:
+            # Each client requests a different set of fields
+            subscription['toolhead'] = ['field%d' % (j,)
+                                        for j in range(i % field_count + 1)]
+        template = {'method': 'notify_status_update'}
+        helper.clients[cconn] = (cconn, subscription, cconn.send, template)
+    received = 0
+    start_time = time.perf_counter()
+    for i in range(query_count):
+        helper._do_query(float(i + 1))
+        received += drain(socks)
+    duration = time.perf_counter() - start_time
+    return duration, received
+
+# Send accelerometer like batches (3200 samples per second, sent every
+# 0.5 seconds) to the clients of a bulk sensor endpoint
+def run_bulk_benchmark(client_count, batch_count, encoding):
+    printer = BenchPrinter(0)
+    server = BenchServer(printer)
+    clients, socks = create_clients(server, client_count, encoding)
+    batch_clients = []
+    for cconn in clients:
+        web_request = webhooks.WebRequest(cconn, {
+            'id': 1, 'method': 'adxl345/dump_adxl345',
+            'params': {'response_template': {}}})
+        batch_clients.append(bulk_sensor.BatchWebhooksClient(web_request))
+    received = 0
+    start_time = time.perf_counter()
+    for i in range(batch_count):
+        data = [(i + .0003125 * j, -535.44309 + j, -1529.8374 - j, 9561.4)
+                for j in range(1600)]
+        msg = {'data': data, 'errors': 0, 'overflows': 0}
+        for whbatch in batch_clients:
+            whbatch.handle_batch(msg)
+        received += drain(socks)
+    duration = time.perf_counter() - start_time
+    return duration, received
+
+def main():
+    usage = "%prog [options]"
+    opts = optparse.OptionParser(usage)
+    opts.add_option("-c", "--clients", type="int", dest="clients",
+                    default=12, help="number of subscribed clients")
+    opts.add_option("-f", "--fields", type="int", dest="fields",
+                    default=20, help="number of fields per status object")
+    opts.add_option("-n", "--queries", type="int", dest="queries",
+                    default=2000, help="number of subscription updates")
+    opts.add_option("-d", "--distinct", action="store_true", dest="distinct",
+                    help="subscribe each client to different fields")
+    opts.add_option("-e", "--encoding", type="choice", dest="encoding",
+                    choices=webhooks.ENCODINGS, default="json",
+                    help="message encoding used by the clients")
+    opts.add_option("-b", "--bulk", action="store_true", dest="bulk",
+                    help="send bulk sensor batches instead of status updates")
+    options, args = opts.parse_args()
+    if args:
+        opts.error("Incorrect number of arguments")
+    if options.bulk:
+        duration, received = run_bulk_benchmark(
+            options.clients, options.queries, options.encoding)
+    else:
+        duration, received = run_benchmark(
+            options.clients, options.fields, options.queries,
+            options.distinct, options.encoding)
+    sys.stdout.write("%d clients, %d updates: %.3fs (%.0f updates/second,"
+                     " %.1f MB sent)\n" % (
+                         options.clients, options.queries, duration,
+                         options.queries / duration, received / 1e6))
+
+if __name__ == '__main__':
+    main()
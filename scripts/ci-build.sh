@@ -73,6 +73,10 @@ start_test klippy "Test klippy import (Python2)"
 $PYTHON2 klippy/klippy.py --import-test
 finish_test klippy "Test klippy import (Python2)"
 
+start_test klippy "Test lookahead planners (Python3)"
+$PYTHON scripts/benchmark_lookahead.py --check -n 2000
+finish_test klippy "Test lookahead planners (Python3)"
+
 start_test klippy "Test invoke klippy (Python3)"
 $PYTHON scripts/test_klippy.py -d ${DICTDIR} test/klippy/*.test
 finish_test klippy "Test invoke klippy (Python3)"